@@ -0,0 +1,156 @@
+import datetime
+import hashlib
+import threading
+from collections import OrderedDict
+
+import metrics
+
+# Bucket size -> (step, default range, SQL bucket key of a UTC 'YYYY-MM-DD HH:MM:SS' column)
+BUCKETS = {
+    'hour': (datetime.timedelta(hours=1), datetime.timedelta(days=1), "strftime('%Y-%m-%d %H:00', {col})"),
+    'day': (datetime.timedelta(days=1), datetime.timedelta(days=30), "date({col})"),
+    'week': (datetime.timedelta(weeks=1), datetime.timedelta(weeks=12), "date({col}, '-6 days', 'weekday 1')"),
+}
+MAX_BUCKETS = 2000
+EVENT_TYPES = ('distracted', 'sleep')
+
+
+def bucket_start(t, bucket):
+    """Start of the bucket holding datetime `t` (weeks start on Monday)"""
+    if bucket == 'hour':
+        return t.replace(minute=0, second=0, microsecond=0)
+    day = t.replace(hour=0, minute=0, second=0, microsecond=0)
+    if bucket == 'week':
+        day -= datetime.timedelta(days=day.weekday())
+    return day
+
+
+def bucket_key(t, bucket):
+    """Same string the SQL bucket expression produces"""
+    return t.strftime('%Y-%m-%d %H:00' if bucket == 'hour' else '%Y-%m-%d')
+
+
+def parse_range(start=None, end=None, bucket='day', now=None):
+    """
+    ?from= / ?to= (ISO date or datetime, UTC) -> (first bucket start, last bucket start).
+    `to` defaults to now, `from` to a bucket-sized span before it. Raises ValueError.
+    """
+    if bucket not in BUCKETS:
+        raise ValueError(f"bucket must be one of {', '.join(BUCKETS)}")
+    step, default_span, _ = BUCKETS[bucket]
+    end = datetime.datetime.fromisoformat(end) if end else (now or datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None))
+    start = datetime.datetime.fromisoformat(start) if start else end - default_span
+    for t in (start, end):
+        if t.tzinfo is not None:
+            raise ValueError("Times are UTC: leave out the offset")
+    first, last = bucket_start(start, bucket), bucket_start(end, bucket)
+    if last < first:
+        raise ValueError("'from' is after 'to'")
+    if (last - first) // step + 1 > MAX_BUCKETS:
+        raise ValueError(f"More than {MAX_BUCKETS} {bucket} buckets: narrow the range")
+    return first, last
+
+
+def timeseries(conn, user_token, first, last, bucket):
+    """
+    Events (from the rollup tables) and sessions per bucket between two bucket
+    starts, as dense columnar arrays: one entry per bucket in `time`.
+    """
+    step, _, expr = BUCKETS[bucket]
+    keys = []
+    t = first
+    while t <= last:
+        keys.append(bucket_key(t, bucket))
+        t += step
+    index = {key: i for i, key in enumerate(keys)}
+    n = len(keys)
+
+    # Hourly and daily event counts are stored; weeks are summed from days
+    if bucket == 'hour':
+        rows = conn.execute(
+            "SELECT type, hour, count, total_duration FROM event_rollup_hourly "
+            "WHERE user_token=? AND hour BETWEEN ? AND ?", (user_token, keys[0], keys[-1]))
+    else:
+        week = BUCKETS['week'][2].format(col='day')
+        key_col = week if bucket == 'week' else 'day'
+        rows = conn.execute(
+            f"SELECT type, {key_col}, SUM(count), SUM(total_duration) FROM event_rollup_daily "
+            f"WHERE user_token=? AND day BETWEEN ? AND ? GROUP BY type, {key_col}",
+            (user_token, keys[0], bucket_key(last + step - datetime.timedelta(days=1), 'day')))
+    events = {event_type: {'count': [0] * n, 'seconds': [0.0] * n} for event_type in EVENT_TYPES}
+    for event_type, key, count, seconds in rows:
+        series = events.setdefault(event_type, {'count': [0] * n, 'seconds': [0.0] * n})
+        i = index.get(key)
+        if i is not None:
+            series['count'][i] = count
+            series['seconds'][i] = round(seconds, 1)
+
+    # Sessions are few per user: grouped straight from the table (idx_sessions_user_time)
+    bucket_sql = expr.format(col='timestamp')
+    rows = conn.execute(
+        f"SELECT type, {bucket_sql}, COUNT(*), COALESCE(SUM(duration), 0) FROM sessions "
+        f"WHERE user_token=? AND timestamp >= ? AND timestamp < ? GROUP BY type, {bucket_sql}",
+        (user_token, first.strftime('%Y-%m-%d %H:%M:%S'), (last + step).strftime('%Y-%m-%d %H:%M:%S')))
+    sessions = {}
+    for session_type, key, count, seconds in rows:
+        series = sessions.setdefault(session_type, {'count': [0] * n, 'seconds': [0] * n})
+        i = index.get(key)
+        if i is not None:
+            series['count'][i] = count
+            series['seconds'][i] = seconds
+
+    return {
+        'bucket': bucket,
+        'from': keys[0],
+        'to': keys[-1],
+        'time': keys,
+        'events': events,
+        'sessions': sessions,
+    }
+
+
+class ResultCache(object):
+    """
+    LRU cache of per-user query results (serialized JSON), each stored with the
+    user's data version (bumped by triggers on every write, see app.init_db).
+    The ETag is derived from user, query and version, so a matching
+    If-None-Match can be answered without the cache or the query.
+    invalidate(token) drops a user's entries right after a write in this process;
+    the version check covers writes made by other worker processes.
+    """
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._entries = OrderedDict() # (token, key) -> (version, result)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def etag(user_token, key, version):
+        return hashlib.sha1(f"{user_token}|{key}|{version}".encode()).hexdigest()[:20]
+
+    def get(self, user_token, key, version):
+        """The result if cached for this data version, else None"""
+        with self._lock:
+            entry = self._entries.get((user_token, key))
+            if entry is None or entry[0] != version:
+                metrics.ANALYTICS_CACHE.inc(label="miss")
+                return None
+            self._entries.move_to_end((user_token, key))
+        metrics.ANALYTICS_CACHE.inc(label="hit")
+        return entry[1]
+
+    def put(self, user_token, key, version, result):
+        with self._lock:
+            self._entries[(user_token, key)] = (version, result)
+            self._entries.move_to_end((user_token, key))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_token):
+        with self._lock:
+            for cache_key in [k for k in self._entries if k[0] == user_token]:
+                del self._entries[cache_key]
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
@@ -1,61 +1,157 @@
 import os
+import importlib.util
+import io
+import json
+import time
 import webbrowser
 import threading
-from flask import Flask, render_template, Response, request, redirect, url_for, jsonify
+from flask import Flask, render_template, Response, request, redirect, url_for, jsonify, g, abort, send_file
+
+import metrics
 
 
 app = Flask(__name__, template_folder='pages', static_folder='static')
 
 
-try:
-    from camera import VideoCamera
-    CAMERA_AVAILABLE = True
-    print("✅ Camera module loaded successfully.")
-except ImportError as e:
-    print(f"⚠️ Camera module missing or failed: {e}")
-    CAMERA_AVAILABLE = False
+# cv2 / mediapipe are only imported once the camera (or an uploaded frame) needs them,
+# so the server is up before they load (see LazyCamera)
+CAMERA_AVAILABLE = all(importlib.util.find_spec(m) is not None for m in ("cv2", "mediapipe"))
+if CAMERA_AVAILABLE:
+    print("✅ Camera module found (loads on first use).")
+else:
+    print("⚠️ Camera module missing: install opencv-python-headless and mediapipe")
 
-import sqlite3
 import datetime
+from db import Database, add_missing_columns
+from events import INSERT_EVENT
+import numpy as np
+import features
+from analytics import ResultCache, parse_range, timeseries
+from assets import IMMUTABLE, AssetManifest
+from lazycamera import LazyCamera
+from taskwriter import TaskWriteBehind, parse_changes
+from sessions import SessionManager, UserSession
+
+# "local": one machine, one user, frames from the local camera (desktop app)
+# "multi": no local camera; every user token gets its own session fed by uploaded frames
+SESSION_MODE = os.environ.get("NEUROMO_SESSIONS", "local").lower()
+# "local": this process opens the camera (desktop app, dev server)
+# "remote": camera_service.py owns it and every web worker talks to it (gunicorn, see gunicorn.conf.py)
+CAMERA_MODE = os.environ.get("NEUROMO_CAMERA", "local").lower()
 
 # --- DATABASE SETUP ---
-DB_NAME = 'neuromo.db'
+DB_NAME = os.environ.get("NEUROMO_DB", 'neuromo.db')
+# Pooled connections, WAL journal (see db.py). NEUROMO_DB points the app at another file.
+db = Database(DB_NAME)
+
+# Rollup tables and the bucket column each one groups by (None = lifetime totals)
+ROLLUP_TABLES = [('event_totals', None), ('event_rollup_daily', 'day'), ('event_rollup_hourly', 'hour')]
+# Bucket keys from the UTC event timestamp
+ROLLUP_BUCKETS = {
+    'day': "date(NEW.timestamp)",
+    'hour': "strftime('%Y-%m-%d %H:00', NEW.timestamp)",
+}
+
+def _rollup_statements(count, duration):
+    """Trigger body: one upsert per rollup table adding `count` events / `duration` seconds"""
+    statements = []
+    for table, bucket in ROLLUP_TABLES:
+        cols = f", {bucket}" if bucket else ""
+        vals = f", {ROLLUP_BUCKETS[bucket]}" if bucket else ""
+        statements.append(
+            f"INSERT INTO {table} (user_token, type{cols}, count, total_duration) "
+            f"VALUES (NEW.user_token, NEW.type{vals}, {count}, {duration}) "
+            f"ON CONFLICT DO UPDATE SET count = count + excluded.count, "
+            f"total_duration = total_duration + excluded.total_duration;"
+        )
+    return "\n".join(statements)
 
 def init_db():
     try:
-        conn = sqlite3.connect(DB_NAME)
-        c = conn.cursor()
+        with db.transaction() as c:
         
-        # 1. Sessions Table (Linked to User Token)
-        c.execute('''CREATE TABLE IF NOT EXISTS sessions (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        user_token TEXT NOT NULL,
-                        type TEXT NOT NULL,
-                        duration INTEGER,
-                        timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
-                    )''')
+            # 1. Sessions Table (Linked to User Token)
+            c.execute('''CREATE TABLE IF NOT EXISTS sessions (
+                            id INTEGER PRIMARY KEY AUTOINCREMENT,
+                            user_token TEXT NOT NULL,
+                            type TEXT NOT NULL,
+                            duration INTEGER,
+                            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+                        )''')
         
-        # 2. Events Table (Distractions/Sleep linked to User Token)
-        c.execute('''CREATE TABLE IF NOT EXISTS events (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        user_token TEXT NOT NULL,
-                        type TEXT NOT NULL,
-                        timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
-                    )''')
-
-        # 3. Tasks Table (Advanced Task System)
-        c.execute('''CREATE TABLE IF NOT EXISTS tasks (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        user_token TEXT NOT NULL,
-                        title TEXT NOT NULL,
-                        priority INTEGER DEFAULT 1,
-                        is_completed BOOLEAN DEFAULT 0,
-                        total_seconds INTEGER DEFAULT 0,
-                        created_at DATETIME DEFAULT CURRENT_TIMESTAMP
-                    )''')
+            # Older databases: downsampled per-frame telemetry of the session (JSON, see telemetry.py)
+            add_missing_columns(c, 'sessions', [('telemetry', 'TEXT')])
         
-        conn.commit()
-        conn.close()
+            # 2. Events Table (Distractions/Sleep linked to User Token)
+            c.execute('''CREATE TABLE IF NOT EXISTS events (
+                            id INTEGER PRIMARY KEY AUTOINCREMENT,
+                            user_token TEXT NOT NULL,
+                            type TEXT NOT NULL,
+                            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+                            duration REAL,
+                            min_ear REAL,
+                            event_key TEXT
+                        )''')
+            # Older databases: per-event duration/EAR and the idempotency key for synced events
+            add_missing_columns(c, 'events', [('duration', 'REAL'), ('min_ear', 'REAL'), ('event_key', 'TEXT')])
+            c.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_events_key ON events (event_key)")
+
+            # 3. Tasks Table (Advanced Task System)
+            c.execute('''CREATE TABLE IF NOT EXISTS tasks (
+                            id INTEGER PRIMARY KEY AUTOINCREMENT,
+                            user_token TEXT NOT NULL,
+                            title TEXT NOT NULL,
+                            priority INTEGER DEFAULT 1,
+                            is_completed BOOLEAN DEFAULT 0,
+                            total_seconds INTEGER DEFAULT 0,
+                            created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+                        )''')
+
+            # 4. Indexes (per-user lookups; the ORDER BY columns are in the index so no sort step)
+            c.execute("CREATE INDEX IF NOT EXISTS idx_events_user_type ON events (user_token, type)")
+            c.execute("CREATE INDEX IF NOT EXISTS idx_events_user_time ON events (user_token, timestamp)")
+            c.execute("CREATE INDEX IF NOT EXISTS idx_sessions_user_type ON sessions (user_token, type)")
+            c.execute("CREATE INDEX IF NOT EXISTS idx_sessions_user_time ON sessions (user_token, timestamp)")
+            c.execute("CREATE INDEX IF NOT EXISTS idx_tasks_user_order ON tasks (user_token, is_completed, priority DESC, created_at DESC)")
+
+            # 5. Event rollups (per user + type: lifetime, per day, per hour), kept current by triggers
+            rollups_exist = c.execute("SELECT 1 FROM sqlite_master WHERE name='event_totals'").fetchone()
+            for table, bucket in ROLLUP_TABLES:
+                key = f"{bucket} TEXT NOT NULL, " if bucket else ""
+                pk = f", {bucket}" if bucket else ""
+                c.execute(f'''CREATE TABLE IF NOT EXISTS {table} (
+                                user_token TEXT NOT NULL,
+                                type TEXT NOT NULL,
+                                {key}count INTEGER NOT NULL DEFAULT 0,
+                                total_duration REAL NOT NULL DEFAULT 0,
+                                PRIMARY KEY (user_token, type{pk})
+                            ) WITHOUT ROWID''')
+            c.execute(f'''CREATE TRIGGER IF NOT EXISTS trg_events_rollup_insert AFTER INSERT ON events BEGIN
+                            {_rollup_statements("1", "COALESCE(NEW.duration, 0)")}
+                        END''')
+            # A re-synced event (upsert on event_key) only changes its duration, not the count
+            c.execute(f'''CREATE TRIGGER IF NOT EXISTS trg_events_rollup_duration AFTER UPDATE OF duration ON events BEGIN
+                            {_rollup_statements("0", "COALESCE(NEW.duration, 0) - COALESCE(OLD.duration, 0)")}
+                        END''')
+            # 6. Per-user data version, bumped on every write: keys the analytics cache and ETags
+            c.execute('''CREATE TABLE IF NOT EXISTS user_data_versions (
+                            user_token TEXT PRIMARY KEY,
+                            version INTEGER NOT NULL
+                        ) WITHOUT ROWID''')
+            bump = ("INSERT INTO user_data_versions (user_token, version) VALUES (NEW.user_token, 1) "
+                    "ON CONFLICT DO UPDATE SET version = version + 1;")
+            for name, when in [('trg_events_version_insert', 'AFTER INSERT ON events'),
+                               ('trg_events_version_update', 'AFTER UPDATE ON events'),
+                               ('trg_sessions_version_insert', 'AFTER INSERT ON sessions')]:
+                c.execute(f"CREATE TRIGGER IF NOT EXISTS {name} {when} BEGIN {bump} END")
+            if not rollups_exist:
+                # First run on an existing database: backfill once from the raw events
+                for table, bucket in ROLLUP_TABLES:
+                    cols = f", {bucket}" if bucket else ""
+                    expr = f", {ROLLUP_BUCKETS[bucket].replace('NEW.', '')}" if bucket else ""
+                    c.execute(f"INSERT INTO {table} (user_token, type{cols}, count, total_duration) "
+                              f"SELECT user_token, type{expr}, COUNT(*), COALESCE(SUM(duration), 0) FROM events "
+                              f"GROUP BY user_token, type{expr}")
         print("✅ Database initialized successfully.")
     except Exception as e:
         print(f"❌ Database initialization failed: {e}")
@@ -63,36 +159,132 @@ def init_db():
 # Initialize DB on startup
 init_db()
 
-# --- HELPER: Get background/alarm files ---
+# Task updates (timer ticks, toggles) are merged in memory and written in batches
+task_writer = TaskWriteBehind(db)
+task_writer.start()
+
+# --- REQUEST METRICS ---
+@app.before_request
+def start_request_timer():
+    if metrics.ENABLED:
+        g.request_start = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    if metrics.ENABLED and 'request_start' in g:
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        metrics.REQUEST_SECONDS.observe(time.perf_counter() - g.request_start, route)
+        metrics.REQUESTS.inc(label=route)
+    return response
+
+# --- STATIC ASSETS ---
+# Hashed, immutable URLs for static/ (see assets.py); the file list is re-checked at most every few seconds
+assets = AssetManifest(app.static_folder)
+app.jinja_env.globals['asset_url'] = assets.url
+
 def get_files(folder_name):
-    path = os.path.join(app.static_folder, folder_name)
-    if not os.path.exists(path):
-        print(f"⚠️ Warning: Folder 'static/{folder_name}' not found.")
-        return []
-    # Get all files that are not hidden
-    files = [f for f in os.listdir(path) if not f.startswith('.')]
-    print(f"📂 Loaded {len(files)} files from {folder_name}")
+    files = assets.files(folder_name)
+    if not files:
+        print(f"⚠️ Warning: No files in 'static/{folder_name}'.")
     return files
 
+@app.route('/assets/<digest>/<path:filename>')
+def asset(digest, filename):
+    """A static file by hashed URL: cached for good, Range requests for audio, gzip / WebP when accepted"""
+    item = assets.get(filename)
+    if item is None:
+        abort(404)
+    path, mimetype, etag, vary = item.path, item.mimetype, item.digest, []
+    if item.gzip is not None:
+        vary.append('Accept-Encoding')
+    if item.webp is not None:
+        vary.append('Accept')
+        if 'image/webp' in request.headers.get('Accept', ''):
+            path, mimetype, etag = item.webp, 'image/webp', item.digest + '-webp'
+    if item.gzip is not None and request.accept_encodings['gzip']:
+        response = send_file(io.BytesIO(item.gzip), mimetype=mimetype, etag=item.digest + '-gz', conditional=True)
+        response.headers['Content-Encoding'] = 'gzip'
+    else:
+        response = send_file(path, mimetype=mimetype, etag=etag, conditional=True) # 206 for Range requests
+    if vary:
+        response.headers['Vary'] = ', '.join(vary)
+    # An old hash still gets the current file, just not cached as if it were that version
+    response.headers['Cache-Control'] = IMMUTABLE if digest == item.digest else "no-cache"
+    return response
+
+# Fallback Mock Camera to prevent crashes
+class MockCamera:
+    def __init__(self):
+        self.session = UserSession("local", verbose=False)
+        self.session.current_status = "camera_disabled"
+        self.stats = self.session.stats
+        self.events = self.session.events
+    @property
+    def current_status(self):
+        return self.session.current_status
+    def get_frame(self):
+        return None # Will return blank/None to gen()
+
+def open_camera(session):
+    from camera import VideoCamera # cv2 + mediapipe import happens here, in the background
+    return VideoCamera(session=session)
+
 # Create the camera object ONCE so we can read its status
-if CAMERA_AVAILABLE:
-    try:
-        global_camera = VideoCamera()
-    except Exception as e:
-        print(f"❌ Camera init failed: {e}")
-        CAMERA_AVAILABLE = False
-
-if not CAMERA_AVAILABLE:
-    # Fallback Mock Camera to prevent crashes
-    class MockCamera:
-        def __init__(self):
-            self.stats = {'distracted': 0, 'sleep': 0}
-            self.current_status = "camera_disabled"
-        def get_frame(self):
-            return None # Will return blank/None to gen()
+# (a local camera only starts loading on the first /status or /video_feed request)
+global_camera = None
+if SESSION_MODE != "multi" and CAMERA_MODE == "remote":
+    from camera_service import RemoteCamera
+    global_camera = RemoteCamera()
+elif CAMERA_AVAILABLE and SESSION_MODE != "multi":
+    global_camera = LazyCamera(open_camera)
+
+if global_camera is None:
     global_camera = MockCamera()
     print("⚠️ Using Mock Camera (Feature Disabled)")
 
+def camera_state():
+    """Readiness for /status: idle/loading/ready/failed (local camera), ready (remote) or disabled"""
+    if isinstance(global_camera, LazyCamera):
+        global_camera.start()
+        return global_camera.state
+    return "disabled" if isinstance(global_camera, MockCamera) else "ready"
+
+# --- PER-USER SESSIONS ---
+def save_evicted_session(session):
+    """Idle sessions are dropped from memory; keep their not-yet-synced events"""
+    events = session.events.pending()
+    if events:
+        with db.transaction() as c:
+            write_events(c, session.token, events)
+        analytics_cache.invalidate(session.token)
+        print(f"💾 Saved {len(events)} events of idle session {session.token[:8]}...")
+
+sessions = SessionManager(on_evict=save_evicted_session)
+# Landmarkers for uploaded frames: caps how many detections run at once (created on the first upload)
+analyzers = None
+_analyzers_lock = threading.Lock()
+
+def get_analyzers():
+    global analyzers
+    if analyzers is None and CAMERA_AVAILABLE:
+        with _analyzers_lock:
+            if analyzers is None:
+                from camera import LandmarkerPool
+                analyzers = LandmarkerPool()
+    return analyzers
+
+def get_token():
+    """User token from the X-User-Token header (or ?token=, for EventSource which can't send headers)"""
+    return request.headers.get('X-User-Token') or request.args.get('token')
+
+def get_session(user_token):
+    """The token's own session (uploaded frames / multi mode), otherwise the local camera's"""
+    if user_token:
+        session = sessions.get(user_token, create=SESSION_MODE == "multi")
+        if session is not None:
+            return session
+    return global_camera.session
+
 # --- ROUTES ---
 
 @app.route('/')
@@ -105,7 +297,7 @@ def home():
 def dashboard():
     print("🚀 Accessing Dashboard Route...")
     
-    # Load settings from your folders
+    # Load settings from your folders (from the asset manifest, no directory listing per request)
     backgrounds = get_files('background')
     alarms = get_files('alarm')
     
@@ -113,7 +305,8 @@ def dashboard():
     if not os.path.exists('pages/dashboard.html'):
         return "❌ ERROR: 'pages/dashboard.html' not found! Check your folder name."
         
-    return render_template('dashboard.html', backgrounds=backgrounds, alarms=alarms)
+    return render_template('dashboard.html', backgrounds=backgrounds, alarms=alarms,
+                           asset_urls={'background': assets.urls('background'), 'alarm': assets.urls('alarm')})
 
 @app.route('/analytics')
 def analytics():
@@ -130,20 +323,17 @@ def get_stats():
     user_token = request.headers.get('X-User-Token')
     if not user_token:
         # If no token, return just current session stats
-        return jsonify(global_camera.stats)
+        return jsonify(global_camera.session.stats)
+    session = get_session(user_token)
 
     try:
-        conn = sqlite3.connect(DB_NAME)
-        c = conn.cursor()
-        
         # Get lifetime counts from DB for this user
-        c.execute("SELECT type, COUNT(*) FROM events WHERE user_token=? GROUP BY type", (user_token,))
-        db_stats = dict(c.fetchall())
-        conn.close()
+        db_stats = dict(db.query("SELECT type, count FROM event_totals WHERE user_token=?", (user_token,)))
         
         # Combine with current in-memory stats (not yet saved to DB)
-        current_distracted = global_camera.stats['distracted']
-        current_sleep = global_camera.stats['sleep']
+        current_stats = session.stats
+        current_distracted = current_stats['distracted']
+        current_sleep = current_stats['sleep']
         
         total_distracted = db_stats.get('distracted', 0) + current_distracted
         total_sleep = db_stats.get('sleep', 0) + current_sleep
@@ -151,12 +341,37 @@ def get_stats():
         return jsonify({
             'distracted': total_distracted,
             'sleep': total_sleep,
-            'current_session': global_camera.stats
+            'current_session': current_stats
         })
     except Exception as e:
         print(f"❌ Error fetching stats: {e}")
         return jsonify({'error': str(e)}), 500
 
+# Per-user query results, valid until that user's data version changes
+analytics_cache = ResultCache()
+
+def cached_json(user_token, key, compute):
+    """
+    JSON response for a per-user DB query, cached until the user's next write.
+    Sends an ETag; a matching If-None-Match gets a 304 without running anything.
+    """
+    row = db.query_one("SELECT version FROM user_data_versions WHERE user_token=?", (user_token,))
+    version = row[0] if row else 0
+    etag = ResultCache.etag(user_token, key, version)
+    if request.if_none_match.contains(etag):
+        metrics.ANALYTICS_CACHE.inc(label="not_modified")
+        response = Response(status=304)
+    else:
+        body = analytics_cache.get(user_token, key, version)
+        if body is None:
+            body = json.dumps(compute(), separators=(',', ':'))
+            analytics_cache.put(user_token, key, version, body)
+        response = Response(body, mimetype='application/json')
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache' # Always revalidate (cheap: 304)
+    response.vary.add('X-User-Token')
+    return response
+
 @app.route('/api/session/history', methods=['GET'])
 def get_session_history():
     """Returns past sessions for charts"""
@@ -164,20 +379,56 @@ def get_session_history():
     if not user_token:
         return jsonify([])
 
-    try:
-        conn = sqlite3.connect(DB_NAME)
-        c = conn.cursor()
-        
+    def last_sessions():
         # Get last 50 sessions ordered by time
-        c.execute("SELECT type, duration, timestamp FROM sessions WHERE user_token=? ORDER BY timestamp DESC LIMIT 50", (user_token,))
-        sessions = [{'type': row[0], 'duration': row[1], 'timestamp': row[2]} for row in c.fetchall()]
-        
-        conn.close()
-        return jsonify(sessions)
+        rows = db.query("SELECT type, duration, timestamp FROM sessions WHERE user_token=? ORDER BY timestamp DESC LIMIT 50", (user_token,))
+        return [{'type': row[0], 'duration': row[1], 'timestamp': row[2]} for row in rows]
+
+    try:
+        return cached_json(user_token, 'history', last_sessions)
     except Exception as e:
         print(f"❌ Error fetching history: {e}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/analytics', methods=['GET'])
+def get_analytics():
+    """
+    Events and sessions per hour/day/week between ?from= and ?to= (UTC ISO dates),
+    as columnar arrays: {'time': [...], 'events': {type: {'count': [...], 'seconds': [...]}}, 'sessions': {...}}
+    """
+    user_token = request.headers.get('X-User-Token')
+    if not user_token:
+        return jsonify({'error': 'Token missing'}), 400
+    bucket = request.args.get('bucket', 'day')
+    try:
+        first, last = parse_range(request.args.get('from'), request.args.get('to'), bucket)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    def compute():
+        with db.connection() as conn:
+            return timeseries(conn, user_token, first, last, bucket)
+
+    try:
+        return cached_json(user_token, f"{bucket}:{first.isoformat()}:{last.isoformat()}", compute)
+    except Exception as e:
+        print(f"❌ Error fetching analytics: {e}")
+        return jsonify({'error': str(e)}), 500
+
+def write_events(c, user_token, events):
+    """Writes a pending() snapshot of camera events in one executemany (upserts on event_key)"""
+    if events:
+        c.executemany(INSERT_EVENT, [e.row(user_token) for e in events])
+
+def session_telemetry(session):
+    """JSON summary of the frames recorded since the last completed session, or None"""
+    try:
+        summary = session.telemetry_summary()
+    except Exception as e:
+        print(f"⚠️ Telemetry summary failed: {e}")
+        return None
+    return json.dumps(summary, separators=(',', ':')) if summary else None
+
 @app.route('/api/session/complete', methods=['POST'])
 def complete_session():
     """Saves a completed session AND any accumulated events to DB"""
@@ -190,28 +441,22 @@ def complete_session():
     duration = data.get('duration') # in seconds
     
     try:
-        conn = sqlite3.connect(DB_NAME)
-        c = conn.cursor()
-        
-        # 1. Save Session
-        c.execute("INSERT INTO sessions (user_token, type, duration) VALUES (?, ?, ?)", 
-                  (user_token, session_type, duration))
-        
-        # 2. Save Pending Events from Camera (Flush buffer)
-        # We save 'current' events to DB now so they persist
-        # Note: In a real app, you might want more precise timestamping for each event
-        for _ in range(global_camera.stats['distracted']):
-            c.execute("INSERT INTO events (user_token, type) VALUES (?, 'distracted')", (user_token,))
-        
-        for _ in range(global_camera.stats['sleep']):
-            c.execute("INSERT INTO events (user_token, type) VALUES (?, 'sleep')", (user_token,))
+        session = get_session(user_token)
+        events = session.events.pending()
+        summary = session_telemetry(session)
+        with db.transaction() as c:
+            # 1. Save Session (with its per-minute EAR/status summary when telemetry is on)
+            c.execute("INSERT INTO sessions (user_token, type, duration, telemetry) VALUES (?, ?, ?, ?)", 
+                      (user_token, session_type, duration, summary))
             
-        conn.commit()
-        conn.close()
+            # 2. Save Pending Events from Camera (Flush buffer)
+            # Each event keeps the time it actually happened, its duration and lowest EAR
+            write_events(c, user_token, events)
         
         # RESET Camera Stats after saving (Start fresh for next session)
-        global_camera.stats['distracted'] = 0
-        global_camera.stats['sleep'] = 0
+        session.ack_events(events)
+        session.reset_counters()
+        analytics_cache.invalidate(user_token)
         
         print(f"💾 Session & Events saved for user {user_token[:8]}...")
         return jsonify({'status': 'success'})
@@ -228,29 +473,19 @@ def sync_stats():
         return jsonify({'error': 'Token missing'}), 400
 
     try:
-        conn = sqlite3.connect(DB_NAME)
-        c = conn.cursor()
-        
-        # Save accumulated stats to DB
-        distracted_count = global_camera.stats['distracted']
-        sleep_count = global_camera.stats['sleep']
+        # Save buffered events to DB
+        session = get_session(user_token)
+        events = session.events.pending()
+        if not events:
+            return jsonify({'status': 'synced'}) # Nothing to write, don't take the write lock
         
-        if distracted_count > 0:
-            print(f"🔄 Syncing {distracted_count} distractions...")
-            for _ in range(distracted_count):
-                c.execute("INSERT INTO events (user_token, type) VALUES (?, 'distracted')", (user_token,))
-            # Reset counter after successful sync
-            global_camera.stats['distracted'] = 0
-            
-        if sleep_count > 0:
-            print(f"🔄 Syncing {sleep_count} sleep events...")
-            for _ in range(sleep_count):
-                c.execute("INSERT INTO events (user_token, type) VALUES (?, 'sleep')", (user_token,))
-            # Reset counter after successful sync
-            global_camera.stats['sleep'] = 0
-            
-        conn.commit()
-        conn.close()
+        print(f"🔄 Syncing {len(events)} events...")
+        with db.transaction() as c:
+            write_events(c, user_token, events)
+
+        # Only after a successful commit: a failed sync keeps the events (same keys) for the retry
+        session.ack_events(events)
+        analytics_cache.invalidate(user_token)
         
         return jsonify({'status': 'synced'})
     except Exception as e:
@@ -265,12 +500,14 @@ def get_tasks():
     user_token = request.headers.get('X-User-Token')
     if not user_token: return jsonify([])
 
+    def load():
+        rows = db.query("SELECT id, title, priority, is_completed, total_seconds FROM tasks WHERE user_token=? ORDER BY is_completed ASC, priority DESC, created_at DESC", (user_token,))
+        return [{'id': r[0], 'title': r[1], 'priority': r[2], 'is_completed': bool(r[3]), 'total_seconds': r[4]} for r in rows]
+
     try:
-        conn = sqlite3.connect(DB_NAME)
-        c = conn.cursor()
-        c.execute("SELECT id, title, priority, is_completed, total_seconds FROM tasks WHERE user_token=? ORDER BY is_completed ASC, priority DESC, created_at DESC", (user_token,))
-        tasks = [{'id': r[0], 'title': r[1], 'priority': r[2], 'is_completed': bool(r[3]), 'total_seconds': r[4]} for r in c.fetchall()]
-        conn.close()
+        # Includes updates still waiting for the next flush; they may change the order (stable sort keeps created_at DESC)
+        tasks = task_writer.read(user_token, load)
+        tasks.sort(key=lambda t: (t['is_completed'], -t['priority']))
         return jsonify(tasks)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -283,47 +520,62 @@ def create_task():
     if not user_token or not data.get('title'): return jsonify({'error': 'Missing data'}), 400
 
     try:
-        conn = sqlite3.connect(DB_NAME)
-        c = conn.cursor()
-        c.execute("INSERT INTO tasks (user_token, title, priority) VALUES (?, ?, ?)", 
-                  (user_token, data['title'], data.get('priority', 1)))
-        conn.commit()
-        task_id = c.lastrowid
-        conn.close()
+        _, task_id = db.execute("INSERT INTO tasks (user_token, title, priority) VALUES (?, ?, ?)", 
+                                (user_token, data['title'], data.get('priority', 1)))
         return jsonify({'id': task_id, 'status': 'success'})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def owned_tasks(user_token, task_ids):
+    """The subset of task_ids that belong to user_token (one read, no write lock)"""
+    task_ids = list(task_ids)
+    if not task_ids:
+        return set()
+    marks = ", ".join("?" * len(task_ids))
+    rows = db.query(f"SELECT id FROM tasks WHERE user_token=? AND id IN ({marks})", [user_token] + task_ids)
+    return {r[0] for r in rows}
+
 @app.route('/api/tasks/<int:task_id>', methods=['PUT'])
 def update_task(task_id):
-    """Update task status, priority, or add time"""
+    """Update task status, priority, or add time (queued: written on the next flush, see taskwriter.py)"""
     user_token = request.headers.get('X-User-Token')
     data = request.json
     if not user_token: return jsonify({'error': 'Token missing'}), 400
 
     try:
-        conn = sqlite3.connect(DB_NAME)
-        c = conn.cursor()
-        
+        fields, add_seconds = parse_changes(data)
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': f"Bad update: {e}"}), 400
+
+    try:
         # Verify ownership
-        c.execute("SELECT user_token FROM tasks WHERE id=?", (task_id,))
-        row = c.fetchone()
-        if not row or row[0] != user_token:
-            conn.close()
+        if task_id not in owned_tasks(user_token, [task_id]):
             return jsonify({'error': 'Unauthorized'}), 403
+        task_writer.update(user_token, task_id, fields, add_seconds)
+        return jsonify({'status': 'success'})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
 
-        if 'is_completed' in data:
-            c.execute("UPDATE tasks SET is_completed=? WHERE id=?", (data['is_completed'], task_id))
-        
-        if 'priority' in data:
-            c.execute("UPDATE tasks SET priority=? WHERE id=?", (data['priority'], task_id))
+@app.route('/api/tasks', methods=['PUT'])
+def update_tasks():
+    """Many task updates in one request: [{"id": 3, "add_seconds": 60}, {"id": 5, "is_completed": true}, ...]"""
+    user_token = request.headers.get('X-User-Token')
+    data = request.json
+    if not user_token: return jsonify({'error': 'Token missing'}), 400
+    if not isinstance(data, list):
+        return jsonify({'error': 'Expected a list of updates'}), 400
 
-        if 'add_seconds' in data:
-            c.execute("UPDATE tasks SET total_seconds = total_seconds + ? WHERE id=?", (data['add_seconds'], task_id))
-            
-        conn.commit()
-        conn.close()
-        return jsonify({'status': 'success'})
+    try:
+        updates = [(int(item['id']),) + parse_changes(item) for item in data]
+    except (KeyError, TypeError, ValueError) as e:
+        return jsonify({'error': f"Bad update: {e}"}), 400
+
+    try:
+        owned = owned_tasks(user_token, {task_id for task_id, _, _ in updates})
+        allowed = [u for u in updates if u[0] in owned]
+        rejected = {task_id for task_id, _, _ in updates if task_id not in owned}
+        task_writer.update_many(user_token, allowed)
+        return jsonify({'status': 'success', 'updated': len(allowed), 'unauthorized': sorted(rejected)})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -334,35 +586,242 @@ def delete_task(task_id):
     if not user_token: return jsonify({'error': 'Token missing'}), 400
 
     try:
-        conn = sqlite3.connect(DB_NAME)
-        c = conn.cursor()
-        c.execute("DELETE FROM tasks WHERE id=? AND user_token=?", (task_id, user_token))
-        conn.commit()
-        conn.close()
+        task_writer.discard(user_token, task_id)
+        db.execute("DELETE FROM tasks WHERE id=? AND user_token=?", (task_id, user_token))
         return jsonify({'status': 'success'})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 
 # --- VIDEO FEED LOGIC ---
-def gen(camera):
-    while True:
-        frame = camera.get_frame()
-        if frame:
-            yield (b'--frame\r\n'
-                   b'Content-Type: image/jpeg\r\n\r\n' + frame + b'\r\n\r\n')
+FRAME_HEAD = b'--frame\r\nContent-Type: image/jpeg\r\n\r\n'
+FRAME_TAIL = b'\r\n\r\n'
+
+
+def gen(camera, width=None, fps=None, quality=None):
+    # Head, JPEG and tail are yielded separately: the shared JPEG bytes are written
+    # as-is instead of being copied into a new multipart chunk for every viewer
+    if isinstance(camera, LazyCamera):
+        camera.wait() # First viewer: the stream starts once the camera has loaded
+    if not hasattr(camera, 'stream'):
+        # Mock camera: nothing to stream
+        while True:
+            frame = camera.get_frame()
+            if frame:
+                yield FRAME_HEAD
+                yield frame
+                yield FRAME_TAIL
+            else:
+                time.sleep(0.5)
+
+    # Each viewer just subscribes to the shared producer (AI runs once per frame, and
+    # each profile is encoded once per frame). The 1-frame buffer means a viewer whose
+    # socket is backed up, or who is paced below the camera rate, skips to the newest frame
+    subscriber = camera.stream(width, quality).subscribe(buffer_size=1)
+    interval = 1.0 / fps if fps else 0
+    next_send = 0
+    try:
+        while True:
+            if interval:
+                delay = next_send - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+            frame = subscriber.get(timeout=1.0)
+            if frame:
+                if interval:
+                    next_send = max(next_send + interval, time.monotonic())
+                yield FRAME_HEAD
+                yield frame
+                yield FRAME_TAIL
+    finally:
+        subscriber.close()
+        metrics.FRAMES_DROPPED.inc(subscriber.dropped, label="viewer")
 
 @app.route('/video_feed')
 def video_feed():
+    """MJPEG stream. Optional ?width=&fps=&quality= ask for a smaller, slower or lighter stream"""
+    width = request.args.get('width', type=int)
+    fps = request.args.get('fps', type=float)
+    quality = request.args.get('quality', type=int)
+    if width is not None and width < 80:
+        width = 80
+    if fps is not None:
+        fps = min(fps, 60.0) if fps > 0 else None
     # Use the global camera instead of creating a new one every time
-    return Response(gen(global_camera),
+    return Response(gen(global_camera, width, fps, quality),
                     mimetype='multipart/x-mixed-replace; boundary=frame')
     
 
 @app.route('/status')
 def get_status():
     # This lets JS ask "What is the status?"
-    return jsonify({'status': global_camera.current_status})
+    return jsonify({'status': get_session(get_token()).current_status, 'camera': camera_state()})
+
+def broadcast_events(broadcaster, first=None, on_keepalive=None, keepalive=15.0):
+    """Server-Sent Events: `first` (if any), then one message per published update"""
+    subscriber = broadcaster.subscribe(buffer_size=1)
+    try:
+        if first is not None:
+            yield f"data: {json.dumps(first)}\n\n"
+        while True:
+            # Buffer of 1: a slow client skips straight to the newest state
+            update = subscriber.get(timeout=keepalive)
+            if update is None:
+                if on_keepalive is not None:
+                    on_keepalive()
+                yield ": keepalive\n\n" # Also how we notice a client that went away
+            else:
+                yield f"data: {json.dumps(update)}\n\n"
+    finally:
+        subscriber.close()
+
+def status_events(session, keepalive=15.0):
+    """The current status, then one message per status change"""
+    latest = session.status_broadcaster.latest or {'status': session.current_status}
+    if session is global_camera.session:
+        latest = dict(latest, camera=camera_state())
+    # An open dashboard keeps its session from being evicted
+    return broadcast_events(session.status_broadcaster, latest, session.touch, keepalive)
+
+@app.route('/status/stream')
+def status_stream():
+    """Pushes status changes (alarm / Away countdown / EAR) instead of 1 Hz /status polling"""
+    return Response(status_events(get_session(get_token())), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/overlay/stream')
+def overlay_stream():
+    """NEUROMO_OVERLAY=client: eye points/status/EAR of every analyzed frame, drawn by the browser"""
+    if isinstance(global_camera, LazyCamera):
+        global_camera.wait()
+    if getattr(global_camera, 'overlay_mode', None) != "client":
+        return Response(status=204) # Overlay is in the video: EventSource stops retrying
+    return Response(broadcast_events(global_camera.overlay_broadcaster), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/api/frame', methods=['POST'])
+def upload_frame():
+    """Analyzes one frame from the user's own camera (JPEG/PNG body, or a 'frame' file field)"""
+    user_token = request.headers.get('X-User-Token')
+    if not user_token:
+        return jsonify({'error': 'Token missing'}), 400
+    pool = get_analyzers()
+    if pool is None:
+        return jsonify({'error': 'Analysis unavailable on this server'}), 503
+    import cv2
+
+    upload = request.files.get('frame')
+    data = upload.read() if upload else request.get_data()
+    frame = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR) if data else None
+    if frame is None:
+        return jsonify({'error': 'Could not decode image'}), 400
+
+    session = sessions.get(user_token)
+    h, w, _ = frame.shape
+    try:
+        result = pool.detect(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB), timeout=2.0)
+    except TimeoutError:
+        return jsonify({'error': 'Server busy, retry'}), 503
+    with session.lock:
+        face = session.process_detection(result, w, h)
+    return jsonify({'status': session.current_status, 'code': session.state.status_code,
+                    'ear': round(face[3], 3) if face else None})
+
+# Frames per /api/landmarks request (~2 minutes at 30 fps)
+MAX_UPLOAD_FRAMES = 3600
+MAX_UPLOAD_BYTES = MAX_UPLOAD_FRAMES * features.PACKED_FRAME_DTYPE.itemsize
+# JSON is ~4x bigger per frame than the packed format, ~60x with the full 478-point mesh
+MAX_JSON_UPLOAD_BYTES = int(os.environ.get("NEUROMO_MAX_JSON_UPLOAD", str(16 << 20)))
+
+def _json_frames(data):
+    """
+    {"frames": [{"t": unix seconds, "points": [[x, y, z], ...] or null}, ...]} -> (times, points).
+    Raises ValueError on a missing / non-numeric time or points that aren't one face
+    """
+    frames = data['frames']
+    n = len(features.FEATURE_INDICES)
+    times = np.empty(len(frames), dtype=np.float64)
+    points = np.full((len(frames), n, 3), np.nan, dtype=np.float32)
+    for i, frame in enumerate(frames):
+        t = frame.get('t') # Required: the state machine runs on frame times
+        if isinstance(t, bool) or not isinstance(t, (int, float)):
+            raise ValueError(f"frame {i}: 't' must be a number")
+        times[i] = t
+        if frame.get('points') is not None:
+            face = np.asarray(frame['points'], dtype=np.float32)
+            if face.shape == (features.NUM_LANDMARKS, 3):
+                face = face[features.FEATURE_INDICES] # Full mesh sent: keep the compact subset
+            elif face.shape != (n, 3):
+                raise ValueError(f"frame {i}: expected {n} or {features.NUM_LANDMARKS} [x, y, z] points, "
+                                 f"got shape {face.shape}")
+            points[i] = face
+    return times, points
+
+def _read_body(limit):
+    """The request body, or None if it is over `limit` bytes (checked before reading any further)"""
+    if request.content_length is not None and request.content_length > limit:
+        return None
+    chunks, size = [], 0
+    while size <= limit: # Chunked bodies have no Content-Length
+        chunk = request.stream.read(min(1 << 16, limit + 1 - size))
+        if not chunk:
+            break
+        chunks.append(chunk)
+        size += len(chunk)
+    return b''.join(chunks) if size <= limit else None
+
+@app.route('/api/landmarks', methods=['GET'])
+def landmark_format():
+    """Which landmarks /api/landmarks expects, in order, and the packed frame size"""
+    return jsonify({'indices': features.FEATURE_INDICES.tolist(),
+                    'frame_bytes': features.PACKED_FRAME_DTYPE.itemsize,
+                    'max_frames': MAX_UPLOAD_FRAMES, 'max_json_bytes': MAX_JSON_UPLOAD_BYTES})
+
+@app.route('/api/landmarks', methods=['POST'])
+def upload_landmarks():
+    """
+    Attention logic for landmarks detected in the browser (no video decode or inference here).
+    Body: packed float16 frames (application/octet-stream, see features.PACKED_FRAME_DTYPE)
+    or a JSON batch. ?w=&h= give the video size the normalized points refer to.
+    """
+    user_token = request.headers.get('X-User-Token')
+    if not user_token:
+        return jsonify({'error': 'Token missing'}), 400
+    w = request.args.get('w', 640, type=float)
+    h = request.args.get('h', 480, type=float)
+
+    is_json = request.mimetype == 'application/json'
+    limit = MAX_JSON_UPLOAD_BYTES if is_json else MAX_UPLOAD_BYTES
+    data = _read_body(limit)
+    if data is None:
+        return jsonify({'error': f"At most {MAX_UPLOAD_FRAMES} frames ({limit} bytes) per request"}), 413
+
+    try:
+        if is_json:
+            times, points = _json_frames(json.loads(data))
+        else:
+            times, points = features.unpack_frames(data)
+    except (ValueError, TypeError, KeyError, AttributeError) as e:
+        return jsonify({'error': f"Bad landmark data: {e}"}), 400
+    if not np.isfinite(times).all():
+        return jsonify({'error': "Bad landmark data: frame times must be finite"}), 400
+    if len(times) > MAX_UPLOAD_FRAMES:
+        return jsonify({'error': f"At most {MAX_UPLOAD_FRAMES} frames per request"}), 413
+
+    session = sessions.get(user_token)
+    with session.lock:
+        faces = session.process_batch(times, points, w, h) if len(times) else 0
+    return jsonify({'frames': len(times), 'faces': faces,
+                    'status': session.current_status, 'code': session.state.status_code})
+
+@app.route('/metrics')
+def get_metrics():
+    """Prometheus text format (or JSON with ?format=json). ?source=camera: the camera service's metrics"""
+    if request.args.get('source') == 'camera' and CAMERA_MODE == "remote":
+        return Response(global_camera.call('metrics'), mimetype='text/plain; version=0.0.4')
+    if request.args.get('format') == 'json':
+        return jsonify(metrics.as_dict())
+    return Response(metrics.render_prometheus(), mimetype='text/plain; version=0.0.4')
 
 if __name__ == '__main__':
     port = int(os.environ.get("PORT", 8969))
@@ -371,8 +830,8 @@ if __name__ == '__main__':
     def open_browser():
         webbrowser.open_new(f"http://127.0.0.1:{port}")
     
-    # Only open browser if not in debug mode reloader
-    if os.environ.get("WERKZEUG_RUN_MAIN") != "true":
+    # Only open browser if not in debug mode reloader (NEUROMO_OPEN_BROWSER=0: never)
+    if os.environ.get("WERKZEUG_RUN_MAIN") != "true" and os.environ.get("NEUROMO_OPEN_BROWSER", "1") != "0":
         threading.Timer(1.5, open_browser).start()
 
     print(f"🟢 Starting Server on http://127.0.0.1:{port}")
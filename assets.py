@@ -0,0 +1,177 @@
+"""
+Static asset manifest: content-hashed URLs for everything under static/.
+
+  /assets/<hash>/background/Calm Room.gif   -> Cache-Control: immutable, Range requests
+
+The manifest is built once at startup and re-checked (a stat walk, no hashing
+unless a file changed) at most every NEUROMO_ASSET_CHECK seconds, so a new
+background or alarm shows up without a restart and a changed file gets a new URL.
+Text assets (script.js, loading.json, logo.svg) are gzipped once in memory.
+
+Optional lighter variants of the GIF backgrounds (animated WebP, needs Pillow) are
+built ahead of time and served to browsers that accept them:
+
+  python assets.py
+"""
+import gzip
+import hashlib
+import mimetypes
+import os
+import sys
+import threading
+import time
+from urllib.parse import quote
+
+VARIANT_DIR = ".variants" # Inside the static folder; dot-folders are not assets themselves
+COMPRESSIBLE = ('.js', '.json', '.svg', '.css', '.html', '.txt')
+MAX_GZIP_BYTES = 1 << 20
+IMMUTABLE = "public, max-age=31536000, immutable"
+
+
+def file_digest(path):
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 16), b''):
+            h.update(chunk)
+    return h.hexdigest()[:12]
+
+
+def variant_path(root, name, digest, ext):
+    """Where the `ext` variant of asset `name` lives; keyed by the source's hash, so stale ones are never used"""
+    base = os.path.splitext(name)[0]
+    return os.path.join(root, VARIANT_DIR, f"{base}.{digest}{ext}")
+
+
+class Asset(object):
+    """One file under static/, its content hash and whatever smaller encodings it has"""
+    __slots__ = ('name', 'path', 'digest', 'stat', 'mimetype', 'gzip', 'webp')
+
+    def __init__(self, name, path, stat):
+        self.name = name # Relative to static/, '/'-separated
+        self.path = path
+        self.stat = stat # (size, mtime_ns): unchanged -> no need to hash again
+        self.digest = file_digest(path)
+        self.mimetype = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+        self.gzip = None
+        if name.endswith(COMPRESSIBLE) and stat[0] <= MAX_GZIP_BYTES:
+            with open(path, 'rb') as f:
+                data = gzip.compress(f.read(), compresslevel=9, mtime=0)
+            if len(data) < stat[0]:
+                self.gzip = data
+        self.webp = None
+
+    @property
+    def url(self):
+        return f"/assets/{self.digest}/{quote(self.name)}"
+
+
+class AssetManifest(object):
+    """
+    name -> Asset for every file under `root`. Lookups re-check the tree when
+    `check_interval` seconds have passed since the last check.
+    """
+
+    def __init__(self, root, check_interval=None):
+        if check_interval is None:
+            check_interval = float(os.environ.get("NEUROMO_ASSET_CHECK", "2"))
+        self.root = root
+        self.check_interval = check_interval
+        self._assets = {}
+        self._checked = 0.0
+        self._lock = threading.Lock()
+        self.refresh()
+
+    def _walk(self):
+        for dirpath, dirnames, filenames in os.walk(self.root):
+            dirnames[:] = [d for d in dirnames if not d.startswith('.')]
+            for filename in filenames:
+                if filename.startswith('.'):
+                    continue
+                path = os.path.join(dirpath, filename)
+                yield os.path.relpath(path, self.root).replace(os.sep, '/'), path
+
+    def refresh(self):
+        """Re-reads the tree; only new or changed files are hashed. Returns True if anything changed"""
+        with self._lock:
+            self._checked = time.monotonic()
+            assets, changed = {}, False
+            for name, path in self._walk():
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue # Removed while walking
+                stat = (st.st_size, st.st_mtime_ns)
+                asset = self._assets.get(name)
+                if asset is None or asset.stat != stat:
+                    asset, changed = Asset(name, path, stat), True
+                # Variants are built separately (main()), so look for them on every check
+                webp = variant_path(self.root, name, asset.digest, '.webp')
+                asset.webp = webp if asset.name.endswith('.gif') and os.path.exists(webp) else None
+                assets[name] = asset
+            changed = changed or assets.keys() != self._assets.keys()
+            self._assets = assets
+        if changed:
+            print(f"📂 Asset manifest: {len(assets)} files")
+        return changed
+
+    def _current(self):
+        if time.monotonic() - self._checked > self.check_interval:
+            self.refresh()
+        return self._assets
+
+    def get(self, name):
+        return self._current().get(name)
+
+    def url(self, name):
+        """Hashed URL of a static file (plain /static/ URL if it isn't in the manifest)"""
+        asset = self.get(name)
+        return asset.url if asset is not None else f"/static/{quote(name)}"
+
+    def files(self, folder):
+        """File names directly in static/<folder>, sorted"""
+        prefix = folder.rstrip('/') + '/'
+        return sorted(name[len(prefix):] for name in self._current()
+                      if name.startswith(prefix) and '/' not in name[len(prefix):])
+
+    def urls(self, folder):
+        """{file name: hashed URL} for static/<folder>, for the dashboard script"""
+        assets = self._current()
+        return {name: assets[f"{folder}/{name}"].url for name in self.files(folder)}
+
+
+def build_variants(root):
+    """
+    Writes an animated WebP next to (in static/.variants) each GIF it makes smaller.
+    A GIF whose WebP isn't smaller gets an empty .rejected marker instead, so it is
+    only tried again once its content (hash) changes.
+    """
+    try:
+        from PIL import Image
+    except ImportError:
+        print("⚠️ Pillow is not installed: pip install pillow to build WebP variants")
+        return 0
+    built = 0
+    for name, asset in AssetManifest(root, check_interval=float('inf'))._assets.items():
+        if not name.endswith('.gif'):
+            continue
+        out = variant_path(root, name, asset.digest, '.webp')
+        rejected = variant_path(root, name, asset.digest, '.webp.rejected')
+        if os.path.exists(out) or os.path.exists(rejected):
+            continue
+        os.makedirs(os.path.dirname(out), exist_ok=True)
+        with Image.open(asset.path) as im:
+            im.save(out + '.tmp', 'WEBP', save_all=True, quality=80, method=4)
+        size = os.path.getsize(out + '.tmp')
+        if size < asset.stat[0]:
+            os.replace(out + '.tmp', out)
+            built += 1
+            print(f"🖼️ {name}: {asset.stat[0] // 1024} KB -> {size // 1024} KB")
+        else:
+            os.remove(out + '.tmp') # Not worth it
+            open(rejected, 'wb').close()
+    return built
+
+
+if __name__ == '__main__':
+    static = sys.argv[1] if len(sys.argv) > 1 else os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+    print(f"✅ Built {build_variants(static)} WebP variants")
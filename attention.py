@@ -0,0 +1,269 @@
+import math
+import time
+
+import numpy as np
+
+from features import EAR_THRESHOLD
+
+# Compact status codes (for offline output and telemetry)
+STATUS_CODES = {
+    "No Face": 0,
+    "Focused": 1,
+    "Drowsy?": 2,
+    "SLEEPING !!!": 3,
+    "Away": 4,
+    "DISTRACTED!": 5,
+}
+
+# Overlay colors (BGR)
+GREEN = (0, 255, 0)
+YELLOW = (0, 255, 255)
+ORANGE = (0, 165, 255)
+RED = (0, 0, 255)
+
+
+# Defaults (all in seconds or EAR units, so behaviour doesn't depend on the analysis rate)
+EAR_HYSTERESIS = 0.02 # Closed eyes count as open again only above EAR_THRESHOLD + this
+EAR_SMOOTHING = 0.1 # EMA time constant of the EAR
+SMOOTHING_RESET = 1.0 # A gap this long between frames restarts the EMA
+SLEEP_SECONDS = 0.7 # Eyes closed this long -> "SLEEPING" (the old 20 frames at ~30 fps)
+DISTRACTION_SECONDS = 2 * 2 # Looking away this long -> "DISTRACTED"
+
+
+def _alpha(dt, tau):
+    """EMA weight of a new sample `dt` seconds after the previous one"""
+    return 1.0 - math.exp(-max(dt, 0.0) / tau) if tau > 0 else 1.0
+
+
+class AttentionStateMachine(object):
+    """
+    Focused / Drowsy / Sleeping / Away / Distracted logic, shared by the live
+    camera and offline scoring. Feed it one analyzed frame at a time via update().
+
+    Everything is driven by the frame timestamps: the EAR is smoothed with a
+    time-constant EMA, eyes count as closed below EAR_THRESHOLD and as open
+    again only above EAR_THRESHOLD + EAR_HYSTERESIS, and sleep / distraction
+    need the eyes closed / the head turned for a number of seconds. So analysis
+    at 5 fps or 30 fps raises the same alerts. AttentionBatch runs the same
+    logic for many sessions at once.
+    """
+
+    def __init__(self, ear_threshold=EAR_THRESHOLD, sleep_seconds=SLEEP_SECONDS,
+                 distraction_limit=DISTRACTION_SECONDS, ear_smoothing=EAR_SMOOTHING,
+                 ear_hysteresis=EAR_HYSTERESIS, verbose=True):
+        # Tuning Variables
+        self.EAR_THRESHOLD = ear_threshold
+        self.EAR_HYSTERESIS = ear_hysteresis
+        self.EAR_SMOOTHING = ear_smoothing
+        self.SLEEP_SECONDS = sleep_seconds # Seconds with eyes closed before "SLEEPING"
+        self.DISTRACTION_LIMIT = distraction_limit # Seconds looking away before "DISTRACTED"
+        self.verbose = verbose
+
+        self.current_status = "Active"
+        self.status_code = STATUS_CODES["No Face"]
+
+        # Analytics Counters
+        self.stats = {
+            'distracted': 0,
+            'sleep': 0
+        }
+        # State Tracking (For Rising Edge Detection)
+        self.is_distracted_state = False
+        self.is_sleepy_state = False
+        self.ear_smoothed = None
+        self.eyes_closed = False
+        self.eyes_closed_since = None
+        self.distraction_start_time = None
+        self._last_time = None
+
+        # Set for exactly one update() when a sleep/distraction event starts
+        self.new_event = None
+
+    def _smooth(self, avg_ear, now):
+        if self.ear_smoothed is None or now - self._last_time > SMOOTHING_RESET:
+            self.ear_smoothed = avg_ear
+        else:
+            self.ear_smoothed += _alpha(now - self._last_time, self.EAR_SMOOTHING) * (avg_ear - self.ear_smoothed)
+        self._last_time = now
+        # Schmitt trigger: no flicker while the EAR hovers around the threshold
+        limit = self.EAR_THRESHOLD + self.EAR_HYSTERESIS if self.eyes_closed else self.EAR_THRESHOLD
+        self.eyes_closed = self.ear_smoothed < limit
+        return self.eyes_closed
+
+    def update(self, avg_ear, is_looking_away, now=None):
+        """Advances the state machine by one analyzed frame taken at `now`. Returns (status, color)"""
+        if not math.isfinite(avg_ear):
+            # No usable eyes (zero eye width, NaN points): a frame without a face, as in AttentionBatch
+            self.no_face()
+            return "No Face", ORANGE
+        if now is None:
+            now = time.time()
+        self.new_event = None
+
+        # 1. PRIMARY: SLEEP (Eyes closed)
+        if self._smooth(avg_ear, now):
+            if self.eyes_closed_since is None:
+                self.eyes_closed_since = now
+            status = "Drowsy?"
+            color = YELLOW
+            self.status_code = STATUS_CODES["Drowsy?"]
+
+            if now - self.eyes_closed_since >= self.SLEEP_SECONDS:
+                status = "SLEEPING !!!"
+                color = RED
+                self.current_status = "alarm"
+                self.status_code = STATUS_CODES["SLEEPING !!!"]
+
+                # TRACKING: Sleep Event (Rising Edge)
+                if not self.is_sleepy_state:
+                    self.stats['sleep'] += 1
+                    self.is_sleepy_state = True
+                    self.new_event = 'sleep'
+                    if self.verbose:
+                        print(f"😴 Sleep Event Detected! Total: {self.stats['sleep']}")
+
+            # Reset distraction timer if sleeping (Sleep takes priority)
+            self.distraction_start_time = None
+
+        # 2. SECONDARY: DISTRACTION (Looking away - With grace period)
+        elif is_looking_away:
+            self.eyes_closed_since = None
+            self.is_sleepy_state = False # Reset sleep state
+
+            # A. Start the timer if it hasn't started yet
+            if self.distraction_start_time is None:
+                self.distraction_start_time = now
+
+            # B. Check how much time has passed
+            elapsed_time = now - self.distraction_start_time
+            remaining_time = self.DISTRACTION_LIMIT - elapsed_time
+
+            if elapsed_time > self.DISTRACTION_LIMIT:
+                # Time is up! Trigger Alarm
+                status = "DISTRACTED!"
+                color = RED
+                self.current_status = "alarm"
+                self.status_code = STATUS_CODES["DISTRACTED!"]
+
+                # TRACKING: Distraction Event (Rising Edge)
+                if not self.is_distracted_state:
+                    self.stats['distracted'] += 1
+                    self.is_distracted_state = True
+                    self.new_event = 'distracted'
+                    if self.verbose:
+                        print(f"👀 Distraction Event Detected! Total: {self.stats['distracted']}")
+
+            else:
+                # Still in "Grace Period"
+                status = f"Away: {int(remaining_time)}s"
+                color = ORANGE
+                self.current_status = "active"
+                self.status_code = STATUS_CODES["Away"]
+                # Do not count as distracted yet
+
+        # 3. FOCUSED (Reset everything)
+        else:
+            self.eyes_closed_since = None
+            self.is_sleepy_state = False
+            self.distraction_start_time = None # Reset the timer completely
+            self.is_distracted_state = False # Reset distraction state
+
+            status = "Focused"
+            color = GREEN
+            self.current_status = "active"
+            self.status_code = STATUS_CODES["Focused"]
+
+        return status, color
+
+    def no_face(self):
+        """Called for analyzed frames where no face was found"""
+        self.new_event = None
+        self.status_code = STATUS_CODES["No Face"]
+
+
+class AttentionBatch(object):
+    """
+    AttentionStateMachine for `n` sessions at once: the state is one array per
+    field, and step() advances every session by one frame from arrays of EARs,
+    looking-away flags and timestamps (a NaN or infinite EAR = no face in that frame). Same
+    transitions as update() / no_face(), without the per-session Python loop.
+    """
+
+    def __init__(self, n, ear_threshold=EAR_THRESHOLD, sleep_seconds=SLEEP_SECONDS,
+                 distraction_limit=DISTRACTION_SECONDS, ear_smoothing=EAR_SMOOTHING,
+                 ear_hysteresis=EAR_HYSTERESIS):
+        self.EAR_THRESHOLD = ear_threshold
+        self.EAR_HYSTERESIS = ear_hysteresis
+        self.EAR_SMOOTHING = ear_smoothing
+        self.SLEEP_SECONDS = sleep_seconds
+        self.DISTRACTION_LIMIT = distraction_limit
+
+        self.status_code = np.full(n, STATUS_CODES["No Face"], dtype=np.uint8)
+        self.alarm = np.zeros(n, dtype=bool) # current_status == "alarm"
+        self.stats = {'distracted': np.zeros(n, dtype=np.int64), 'sleep': np.zeros(n, dtype=np.int64)}
+        self.is_sleepy_state = np.zeros(n, dtype=bool)
+        self.is_distracted_state = np.zeros(n, dtype=bool)
+        self.ear_smoothed = np.full(n, np.nan)
+        self.eyes_closed = np.zeros(n, dtype=bool)
+        self.eyes_closed_since = np.full(n, np.nan) # NaN = not closed / timer off
+        self.distraction_start_time = np.full(n, np.nan)
+        self._last_time = np.full(n, np.nan)
+
+    def step(self, ears, looking_away, now):
+        """
+        One frame for every session. Returns (status codes, new_sleep, new_distracted):
+        the last two flag the sessions whose event started on this frame.
+        """
+        ears = np.asarray(ears, dtype=np.float64)
+        looking_away = np.asarray(looking_away, dtype=bool)
+        now = np.broadcast_to(np.asarray(now, dtype=np.float64), ears.shape)
+        face = np.isfinite(ears)
+
+        # EMA (restarted after a gap) + Schmitt trigger, as in AttentionStateMachine._smooth
+        dt = now - self._last_time
+        fresh = face & (np.isnan(self.ear_smoothed) | ~(dt <= SMOOTHING_RESET))
+        if self.EAR_SMOOTHING > 0:
+            with np.errstate(invalid='ignore'):
+                alpha = 1.0 - np.exp(-np.maximum(dt, 0.0) / self.EAR_SMOOTHING)
+        else:
+            alpha = np.ones_like(ears)
+        smoothed = np.where(fresh, ears, self.ear_smoothed + alpha * (ears - self.ear_smoothed))
+        self.ear_smoothed = np.where(face, smoothed, self.ear_smoothed)
+        self._last_time = np.where(face, now, self._last_time)
+        limit = self.EAR_THRESHOLD + np.where(self.eyes_closed, self.EAR_HYSTERESIS, 0.0)
+        self.eyes_closed = np.where(face, self.ear_smoothed < limit, self.eyes_closed)
+
+        closed = face & self.eyes_closed
+        away = face & ~closed & looking_away
+        focused = face & ~closed & ~looking_away
+
+        # 1. Sleep
+        self.eyes_closed_since = np.where(closed & np.isnan(self.eyes_closed_since), now, self.eyes_closed_since)
+        sleeping = closed & (now - self.eyes_closed_since >= self.SLEEP_SECONDS)
+        new_sleep = sleeping & ~self.is_sleepy_state
+        self.stats['sleep'] += new_sleep
+        self.is_sleepy_state |= sleeping
+        self.distraction_start_time[closed] = np.nan
+
+        # 2. Distraction
+        self.eyes_closed_since[away | focused] = np.nan
+        self.is_sleepy_state[away | focused] = False
+        self.distraction_start_time = np.where(away & np.isnan(self.distraction_start_time), now,
+                                               self.distraction_start_time)
+        distracted = away & (now - self.distraction_start_time > self.DISTRACTION_LIMIT)
+        new_distracted = distracted & ~self.is_distracted_state
+        self.stats['distracted'] += new_distracted
+        self.is_distracted_state |= distracted
+
+        # 3. Focused
+        self.distraction_start_time[focused] = np.nan
+        self.is_distracted_state[focused] = False
+
+        code = np.select(
+            [~face, sleeping, closed, distracted, away],
+            [STATUS_CODES["No Face"], STATUS_CODES["SLEEPING !!!"], STATUS_CODES["Drowsy?"],
+             STATUS_CODES["DISTRACTED!"], STATUS_CODES["Away"]],
+            STATUS_CODES["Focused"])
+        self.status_code = code.astype(np.uint8)
+        self.alarm = np.where(sleeping | distracted, True, np.where(face & ~closed, False, self.alarm))
+        return self.status_code, new_sleep, new_distracted
@@ -0,0 +1,279 @@
+"""
+Offline scoring of recorded session videos.
+
+Runs the same landmarker + attention state machine as the live camera, but
+without overlay drawing or JPEG encoding, spread across a process pool (one
+landmarker per worker). For every input video it writes:
+  <name>.frames.npz  - per-frame columns: time, left_ear, right_ear, ear, ratio, mar, pitch, status
+  <name>.events.npz  - event timeline columns: type, start, end, min_ear
+<name> is the video's path below the inputs' common directory, without the
+extension (kept when two videos differ only by it): a/session.mp4 -> a/session.
+
+Usage:
+  python batch_score.py recordings/ --out scores/ --workers 4 --ear-threshold 0.24
+
+With --rescore, the inputs are .frames.npz files (or directories of them) from an
+earlier run: only the attention state machine is re-run, for every file at once,
+e.g. to try other thresholds without running the landmarker again.
+  python batch_score.py scores/ --rescore --ear-threshold 0.24 --sleep-seconds 1
+"""
+import argparse
+import os
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import cv2
+import mediapipe as mp
+import numpy as np
+
+import features
+from attention import DISTRACTION_SECONDS, SLEEP_SECONDS, AttentionBatch, AttentionStateMachine
+from events import EventLog
+from camera import create_landmarker, ensure_model
+
+VIDEO_EXTENSIONS = ('.mp4', '.avi', '.mov', '.mkv', '.webm')
+FRAMES_SUFFIX = '.frames.npz'
+
+# One landmarker per worker process
+_detector = None
+_timestamp_offset_ms = 0
+_detect_width = None
+
+
+def _init_worker(detect_width):
+    global _detector, _detect_width
+    _detector = create_landmarker("video")
+    _detect_width = detect_width
+
+
+def find_videos(paths, extensions=VIDEO_EXTENSIONS):
+    """Expands files and directories into a sorted list of files ending in one of `extensions`"""
+    videos = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, files in os.walk(path):
+                videos.extend(os.path.join(root, f) for f in files if f.lower().endswith(extensions))
+        elif os.path.isfile(path):
+            videos.append(path)
+        else:
+            print(f"⚠️ Skipping '{path}': not found")
+    unique = {}
+    for video in videos: # Found through more than one argument: score it once
+        unique.setdefault(os.path.abspath(video), video)
+    return sorted(unique.values())
+
+
+def output_names(paths):
+    """{path: output name}: unique, '/'-separated paths relative to the inputs' common directory"""
+    paths = [os.path.abspath(p) for p in paths]
+    root = os.path.commonpath([os.path.dirname(p) for p in paths]) if paths else ''
+    rel = {p: os.path.relpath(p, root).replace(os.sep, '/') for p in paths}
+    stems = Counter(os.path.splitext(r)[0] for r in rel.values())
+    names = {}
+    for p, r in rel.items():
+        stem = os.path.splitext(r)[0]
+        names[p] = stem if stems[stem] == 1 else r # x.mp4 and x.avi: keep the extension
+    clashes = sorted(name for name, n in Counter(names.values()).items() if n > 1)
+    if clashes:
+        raise ValueError(f"Videos would overwrite each other's scores: {', '.join(clashes)}")
+    return names
+
+
+def _detect_points(path, stride):
+    """Runs the landmarker over a video. Returns (times, points, w, h, fps)"""
+    global _timestamp_offset_ms
+    cap = cv2.VideoCapture(path)
+    if not cap.isOpened():
+        raise IOError(f"Cannot open video '{path}'")
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+    w = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    h = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+
+    times = []
+    points = []
+    no_face = np.full((len(features.FEATURE_INDICES), 3), np.nan, dtype=np.float32)
+    frame_index = 0
+    timestamp_ms = _timestamp_offset_ms
+    try:
+        while True:
+            if frame_index % stride:
+                # Skipped frames: advance without decoding into a numpy array
+                if not cap.grab():
+                    break
+                frame_index += 1
+                continue
+            success, frame = cap.read()
+            if not success:
+                break
+
+            if _detect_width and frame.shape[1] > _detect_width:
+                small_h = int(frame.shape[0] * _detect_width / frame.shape[1])
+                frame = cv2.resize(frame, (_detect_width, small_h), interpolation=cv2.INTER_AREA)
+            rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+            mp_image = mp.Image(image_format=mp.ImageFormat.SRGB, data=rgb_frame)
+
+            # VIDEO mode needs increasing timestamps across every file this worker sees
+            timestamp_ms = _timestamp_offset_ms + int(frame_index * 1000 / fps)
+            result = _detector.detect_for_video(mp_image, timestamp_ms)
+
+            times.append(frame_index / fps)
+            if result.face_landmarks:
+                points.append(features.landmarks_to_array(result.face_landmarks[0]))
+            else:
+                points.append(no_face)
+            frame_index += 1
+    finally:
+        cap.release()
+        _timestamp_offset_ms = timestamp_ms + 1000
+
+    if not points:
+        return np.empty(0, np.float32), np.empty((0,) + no_face.shape, np.float32), w, h, fps
+    return np.asarray(times, dtype=np.float32), np.stack(points), w, h, fps
+
+
+def score_file(path, out_dir, ear_threshold, sleep_seconds, distraction_limit, stride=1, name=None):
+    """Scores one video and writes <out_dir>/<name>.frames.npz / .events.npz. Returns a summary dict"""
+    start = time.perf_counter()
+    times, points, w, h, fps = _detect_points(path, stride)
+
+    # Features for the whole file in one vectorized call
+    scores = features.score_frames(points, w, h, ear_threshold=ear_threshold)
+
+    # Time-based, so skipping frames (stride) needs no rescaling
+    state = AttentionStateMachine(
+        ear_threshold=ear_threshold,
+        sleep_seconds=sleep_seconds,
+        distraction_limit=distraction_limit,
+        verbose=False,
+    )
+    has_face = np.isfinite(scores['ear'])
+    status = np.zeros(len(times), dtype=np.uint8)
+    event_log = EventLog(maxlen=None) # Same event tracking as the live camera, unbounded
+    for i in range(len(times)):
+        t = float(times[i])
+        if has_face[i]:
+            ear = float(scores['ear'][i])
+            state.update(ear, bool(scores['looking_away'][i]), now=t)
+        else:
+            ear = None
+            state.no_face()
+        status[i] = state.status_code
+        event_log.observe(state, ear, now=t)
+    events = event_log.pending()
+
+    if name is None:
+        name = os.path.splitext(os.path.basename(path))[0]
+    out = os.path.join(out_dir, *name.split('/'))
+    os.makedirs(os.path.dirname(out), exist_ok=True)
+    np.savez_compressed(
+        f"{out}{FRAMES_SUFFIX}",
+        time=times, left_ear=scores['left_ear'], right_ear=scores['right_ear'], ear=scores['ear'],
+        ratio=scores['ratio'], mar=scores['mar'], pitch=scores['pitch'], status=status,
+    )
+    np.savez_compressed(
+        f"{out}.events.npz",
+        type=np.array([e.type for e in events], dtype='U10'),
+        start=np.array([e.start for e in events], dtype=np.float32),
+        end=np.array([e.end for e in events], dtype=np.float32),
+        min_ear=np.array([e.min_ear for e in events], dtype=np.float32),
+    )
+
+    elapsed = time.perf_counter() - start
+    duration = len(times) * stride / fps
+    return {
+        'path': path,
+        'frames': len(times),
+        'duration': duration,
+        'elapsed': elapsed,
+        'speedup': duration / elapsed if elapsed else 0.0,
+        'sleep': state.stats['sleep'],
+        'distracted': state.stats['distracted'],
+    }
+
+
+def rescore(paths, ear_threshold, sleep_seconds, distraction_limit):
+    """
+    Re-runs the attention state machine over saved .frames.npz files. All files are
+    stepped together, one AttentionBatch session per file (shorter files are padded
+    with no-face frames). Returns a summary dict per file
+    """
+    runs = []
+    for path in paths:
+        with np.load(path) as data:
+            runs.append((data['time'], data['ear'], data['ratio']))
+    length = max((len(t) for t, _, _ in runs), default=0)
+    times = np.zeros((length, len(runs)))
+    ears = np.full((length, len(runs)), np.nan)
+    away = np.zeros((length, len(runs)), dtype=bool)
+    for j, (t, ear, ratio) in enumerate(runs):
+        times[:len(t), j], ears[:len(t), j] = t, ear
+        # Same rule as features.score_frames
+        away[:len(t), j] = ~np.isnan(ratio) & ((ratio > features.RATIO_MAX) | (ratio < features.RATIO_MIN))
+
+    batch = AttentionBatch(len(runs), ear_threshold=ear_threshold, sleep_seconds=sleep_seconds,
+                           distraction_limit=distraction_limit)
+    for k in range(length):
+        batch.step(ears[k], away[k], times[k])
+    return [{'path': path, 'frames': len(runs[j][0]), 'sleep': int(batch.stats['sleep'][j]),
+             'distracted': int(batch.stats['distracted'][j])} for j, path in enumerate(paths)]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Re-score recorded Neuromo sessions offline")
+    parser.add_argument('paths', nargs='+', help="Video files or directories")
+    parser.add_argument('--out', default='scores', help="Output directory (default: scores)")
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help="Worker processes")
+    parser.add_argument('--ear-threshold', type=float, default=features.EAR_THRESHOLD, help="Eyes closed below this EAR")
+    parser.add_argument('--sleep-seconds', type=float, default=SLEEP_SECONDS, help="Seconds with eyes closed before sleep")
+    parser.add_argument('--distraction-limit', type=float, default=DISTRACTION_SECONDS,
+                        help="Seconds looking away before distraction")
+    parser.add_argument('--stride', type=int, default=1, help="Analyze every Nth frame")
+    parser.add_argument('--detect-width', type=int, default=None, help="Downscale frames to this width for detection")
+    parser.add_argument('--rescore', action='store_true', help=f"Re-score saved {FRAMES_SUFFIX} files instead of videos")
+    args = parser.parse_args(argv)
+
+    if args.rescore:
+        files = find_videos(args.paths, extensions=(FRAMES_SUFFIX,))
+        if not files:
+            print(f"❌ No {FRAMES_SUFFIX} files found.")
+            return 1
+        for s in rescore(files, args.ear_threshold, args.sleep_seconds, args.distraction_limit):
+            print(f"✅ {s['path']}: {s['frames']} frames, sleep={s['sleep']} distracted={s['distracted']}")
+        return 0
+
+    videos = find_videos(args.paths)
+    if not videos:
+        print("❌ No videos found.")
+        return 1
+    try:
+        names = output_names(videos)
+    except ValueError as e:
+        print(f"❌ {e}")
+        return 1
+    os.makedirs(args.out, exist_ok=True)
+    ensure_model() # Download once here, not in every worker
+    print(f"🎬 Scoring {len(videos)} video(s) with {args.workers} worker(s)...")
+
+    failed = 0
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=_init_worker,
+                             initargs=(args.detect_width,)) as pool:
+        futures = {
+            pool.submit(score_file, path, args.out, args.ear_threshold, args.sleep_seconds,
+                        args.distraction_limit, max(1, args.stride), names[os.path.abspath(path)]): path
+            for path in videos
+        }
+        for future in as_completed(futures):
+            try:
+                s = future.result()
+            except Exception as e:
+                failed += 1
+                print(f"❌ {futures[future]}: {e}")
+                continue
+            print(f"✅ {s['path']}: {s['frames']} frames, {s['duration']:.0f}s in {s['elapsed']:.1f}s "
+                  f"({s['speedup']:.1f}x), sleep={s['sleep']} distracted={s['distracted']}")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
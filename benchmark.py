@@ -0,0 +1,371 @@
+"""
+Reproducible benchmarks for the camera frame path and the Flask API.
+
+  python benchmark.py frame --clip session.mp4 --resolutions 320x240,640x480,1280x720
+  python benchmark.py api --tokens 50 --concurrency 16 --requests 5000
+  python benchmark.py startup --runs 5
+  python benchmark.py all --out bench.json
+
+Results are JSON with p50/p95/p99 (milliseconds) per stage / per route so
+runs from different releases can be diffed.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import types
+import urllib.request
+from collections import defaultdict
+
+import numpy as np
+
+
+def summarize(samples_ms):
+    """p50/p95/p99/mean/max of a list of millisecond samples"""
+    if not samples_ms:
+        return {'count': 0}
+    a = np.asarray(samples_ms, dtype=np.float64)
+    p50, p95, p99 = np.percentile(a, [50, 95, 99])
+    return {
+        'count': int(a.size),
+        'mean': round(float(a.mean()), 3),
+        'p50': round(float(p50), 3),
+        'p95': round(float(p95), 3),
+        'p99': round(float(p99), 3),
+        'max': round(float(a.max()), 3),
+    }
+
+
+# --- FRAME PATH ---
+
+def _load_frames(clip, count):
+    """First `count` frames of the clip (or synthetic frames) plus per-frame read times"""
+    import cv2
+    from sources import SyntheticSource
+
+    frames, read_ms = [], []
+    if clip:
+        capture = cv2.VideoCapture(clip)
+        if not capture.isOpened():
+            raise IOError(f"Cannot open clip '{clip}'")
+    else:
+        capture = SyntheticSource(fps=0)
+    while len(frames) < count:
+        t0 = time.perf_counter()
+        success, frame = capture.read()
+        read_ms.append((time.perf_counter() - t0) * 1000)
+        if not success:
+            break
+        frames.append(frame)
+    capture.release()
+    return frames, read_ms
+
+
+def _fake_landmarks():
+    """A plausible face (eyes open, looking ahead) so feature/overlay stages run without a real face"""
+    import features
+    rng = np.random.default_rng(0)
+    points = rng.uniform(0.35, 0.65, size=(features.NUM_LANDMARKS, 3))
+    return [types.SimpleNamespace(x=float(p[0]), y=float(p[1]), z=float(p[2])) for p in points]
+
+
+def bench_frame(clip=None, resolutions=("640x480",), frames=150, running_mode="video"):
+    import cv2
+    import mediapipe as mp
+    import features
+    from camera import VideoCamera
+    from sources import SyntheticSource
+
+    source_frames, read_ms = _load_frames(clip, frames)
+    if not source_frames:
+        raise RuntimeError("No frames to benchmark")
+    fallback_landmarks = _fake_landmarks()
+    results = {'clip': clip or 'synthetic', 'frames': len(source_frames), 'running_mode': running_mode,
+               'read': summarize(read_ms), 'resolutions': {}}
+
+    for res in resolutions:
+        w, h = (int(v) for v in res.lower().split('x'))
+        # Fresh camera (not started) per resolution so tracking state doesn't carry over
+        camera = VideoCamera(source=SyntheticSource(w, h, fps=0), running_mode=running_mode, autostart=False)
+        camera.ADAPTIVE_RATE = False
+        camera.state.verbose = False
+        timings = defaultdict(list)
+        faces = 0
+        timestamp_ms = 0
+
+        for src in source_frames:
+            frame = cv2.resize(src, (w, h), interpolation=cv2.INTER_AREA)
+
+            t0 = time.perf_counter()
+            rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+            t1 = time.perf_counter()
+            mp_image = mp.Image(image_format=mp.ImageFormat.SRGB, data=rgb_frame)
+            if running_mode == "video":
+                timestamp_ms += 33
+                result = camera.detector.detect_for_video(mp_image, timestamp_ms)
+            else:
+                result = camera.detector.detect(mp_image)
+            t2 = time.perf_counter()
+
+            if result.face_landmarks:
+                faces += 1
+                landmarks = result.face_landmarks[0]
+            else:
+                landmarks = fallback_landmarks
+            points = features.landmarks_to_array(landmarks, camera._points)
+            frame_features = features.compute_features(points, w, h)
+            status, color = camera.state.update(float(frame_features['ear']), False)
+            t3 = time.perf_counter()
+
+            camera.draw_overlay(frame, landmarks, status, color, float(frame_features['ear']))
+            t4 = time.perf_counter()
+            camera.encode_frame(frame)
+            t5 = time.perf_counter()
+
+            timings['cvtColor'].append((t1 - t0) * 1000)
+            timings['detect'].append((t2 - t1) * 1000)
+            timings['features'].append((t3 - t2) * 1000)
+            timings['overlay'].append((t4 - t3) * 1000)
+            timings['imencode'].append((t5 - t4) * 1000)
+            timings['total'].append((t5 - t0) * 1000)
+
+        camera.detector.close()
+        stages = {name: summarize(samples) for name, samples in timings.items()}
+        stages['face_ratio'] = round(faces / len(source_frames), 3)
+        stages['fps'] = round(1000.0 / stages['total']['mean'], 1) if stages['total']['mean'] else None
+        results['resolutions'][res] = stages
+        print(f"🎞️ {res}: {stages['total']['p50']:.2f} ms/frame p50 (detect {stages['detect']['p50']:.2f} ms)")
+    return results
+
+
+# --- API LOAD ---
+
+def _request(base_url, method, path, token=None, body=None):
+    headers = {'Content-Type': 'application/json'}
+    if token:
+        headers['X-User-Token'] = token
+    data = json.dumps(body).encode() if body is not None else None
+    req = urllib.request.Request(base_url + path, data=data, headers=headers, method=method)
+    with urllib.request.urlopen(req, timeout=30) as resp:
+        return resp.status, resp.read()
+
+
+def _start_local_server(db_path):
+    """Runs app.py in-process on a free port, pointed at a temp database"""
+    os.environ.setdefault("NEUROMO_SOURCE", "synthetic")
+    # Set before the import: importing app opens (and migrates) its database
+    os.environ["NEUROMO_DB"] = db_path
+    from werkzeug.serving import WSGIRequestHandler, make_server
+    import app as neuromo_app
+
+    class QuietHandler(WSGIRequestHandler):
+        def log_request(self, *args, **kwargs):
+            pass # Per-request access logs would dominate the timings
+
+    # The camera is not under test here; keep it (and its threads) from loading at all
+    neuromo_app.global_camera = neuromo_app.MockCamera()
+    if neuromo_app.DB_NAME != db_path:
+        # app was imported earlier, against another database: move it and its task writer over
+        from db import Database
+        neuromo_app.task_writer.flush()
+        neuromo_app.db.close_all()
+        neuromo_app.DB_NAME = db_path
+        neuromo_app.db = neuromo_app.task_writer.db = Database(db_path)
+        neuromo_app.init_db()
+
+    server = make_server('127.0.0.1', 0, neuromo_app.app, threaded=True, request_handler=QuietHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+
+def bench_api(url=None, tokens=50, concurrency=16, requests=5000, seed=0):
+    tmp_dir = None
+    server = None
+    if url is None:
+        tmp_dir = tempfile.mkdtemp(prefix="neuromo-bench-")
+        server, url = _start_local_server(os.path.join(tmp_dir, 'bench.db'))
+    url = url.rstrip('/')
+
+    rng = random.Random(seed)
+    user_tokens = [f"bench-{i:04d}" for i in range(tokens)]
+    # Seed a few tasks per user so /api/tasks has rows to return
+    for token in user_tokens:
+        for p in range(3):
+            _request(url, 'POST', '/api/tasks', token, {'title': f"Task {p}", 'priority': p + 1})
+
+    # Weighted mix, roughly what open dashboards generate
+    routes = [
+        ('GET', '/status', 0.55),
+        ('GET', '/api/stats', 0.2),
+        ('GET', '/api/tasks', 0.2),
+        ('POST', '/api/stats/sync', 0.05),
+    ]
+    plan = [(m, p, rng.choice(user_tokens))
+            for m, p, _ in rng.choices(routes, weights=[r[2] for r in routes], k=requests)]
+
+    latencies = defaultdict(list)
+    errors = defaultdict(int)
+    lock = threading.Lock()
+    cursor = iter(plan)
+
+    def worker():
+        while True:
+            with lock:
+                item = next(cursor, None)
+            if item is None:
+                return
+            method, path, token = item
+            t0 = time.perf_counter()
+            try:
+                status, _ = _request(url, method, path, token, {} if method == 'POST' else None)
+                ok = status < 400
+            except Exception:
+                ok = False
+            elapsed = (time.perf_counter() - t0) * 1000
+            with lock:
+                latencies[path].append(elapsed)
+                if not ok:
+                    errors[path] += 1
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - start
+
+    if server is not None:
+        server.shutdown()
+    if tmp_dir:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    routes_out = {}
+    for path, samples in latencies.items():
+        routes_out[path] = summarize(samples)
+        routes_out[path]['errors'] = errors[path]
+    all_samples = [s for samples in latencies.values() for s in samples]
+    print(f"🌐 {requests} requests in {wall:.2f}s ({requests / wall:.0f} req/s)")
+    return {
+        'url': url if server is None else 'in-process',
+        'tokens': tokens,
+        'concurrency': concurrency,
+        'requests': requests,
+        'wall_seconds': round(wall, 3),
+        'throughput_rps': round(requests / wall, 1),
+        'overall': summarize(all_samples),
+        'routes': routes_out,
+    }
+
+
+# --- COLD START ---
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def bench_startup(runs=3, timeout=120.0):
+    """
+    Launches `python app.py` (desktop mode, synthetic source, temp database) and
+    measures how long until the server answers /status, and until the camera it
+    starts loading in the background reports ready.
+    """
+    here = os.path.dirname(os.path.abspath(__file__))
+    server_ms, camera_ms, states = [], [], []
+    for _ in range(runs):
+        tmp_dir = tempfile.mkdtemp(prefix="neuromo-start-")
+        model = os.path.join(here, 'face_landmarker.task')
+        if os.path.exists(model):
+            os.symlink(model, os.path.join(tmp_dir, 'face_landmarker.task')) # Don't time a download
+        port = _free_port()
+        env = dict(os.environ, PORT=str(port), NEUROMO_OPEN_BROWSER="0")
+        env.setdefault("NEUROMO_SOURCE", "synthetic")
+        url = f"http://127.0.0.1:{port}"
+        t0 = time.perf_counter()
+        proc = subprocess.Popen([sys.executable, os.path.join(here, 'app.py')], cwd=tmp_dir, env=env,
+                                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            state, t_server = None, None
+            while time.perf_counter() - t0 < timeout:
+                try:
+                    _, body = _request(url, 'GET', '/status')
+                except OSError:
+                    time.sleep(0.01)
+                    continue
+                state = json.loads(body).get('camera')
+                if t_server is None:
+                    t_server = time.perf_counter()
+                if state not in ('idle', 'loading'):
+                    break
+                time.sleep(0.02)
+            t_camera = time.perf_counter()
+        finally:
+            proc.terminate()
+            proc.wait()
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+        if t_server is None:
+            raise RuntimeError(f"Server did not answer within {timeout:.0f}s")
+        server_ms.append((t_server - t0) * 1000)
+        camera_ms.append((t_camera - t0) * 1000)
+        states.append(state)
+    print(f"🚀 Server up in {np.median(server_ms):.0f} ms, camera {states[-1]} in {np.median(camera_ms):.0f} ms (median)")
+    return {
+        'runs': runs,
+        'server_ready': summarize(server_ms),
+        'camera_ready': summarize(camera_ms),
+        'camera_state': states[-1],
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Neuromo benchmarks (JSON output)")
+    parser.add_argument('suite', choices=['frame', 'api', 'startup', 'all'])
+    parser.add_argument('--clip', help="Recorded clip for the frame benchmark (default: synthetic frames)")
+    parser.add_argument('--resolutions', default="320x240,640x480,1280x720")
+    parser.add_argument('--frames', type=int, default=150)
+    parser.add_argument('--running-mode', default="video", choices=['image', 'video'])
+    parser.add_argument('--url', help="Benchmark a running server instead of an in-process one")
+    parser.add_argument('--tokens', type=int, default=50)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--requests', type=int, default=5000)
+    parser.add_argument('--runs', type=int, default=3, help="Cold starts to time (startup suite)")
+    parser.add_argument('--out', help="Write JSON here instead of stdout")
+    args = parser.parse_args(argv)
+
+    report = {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+        }
+    }
+    if args.suite in ('frame', 'all'):
+        report['frame'] = bench_frame(args.clip, args.resolutions.split(','), args.frames, args.running_mode)
+    if args.suite in ('api', 'all'):
+        report['api'] = bench_api(args.url, args.tokens, args.concurrency, args.requests)
+    if args.suite in ('startup', 'all'):
+        report['startup'] = bench_startup(args.runs)
+
+    output = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, 'w') as f:
+            f.write(output)
+        print(f"💾 Results written to {args.out}")
+    else:
+        print(output)
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -6,32 +6,132 @@ import numpy as np
 import os
 import urllib.request
 import time
+import threading
+import queue
+
+from framering import FrameRing
+from overlay import OverlayRenderer
+from streaming import FrameBroadcaster, StreamProfiles
+from sources import open_source
+from sessions import UserSession
+import features
+import metrics
+
+MODEL_PATH = 'face_landmarker.task'
+MODEL_URL = 'https://storage.googleapis.com/mediapipe-models/face_landmarker/face_landmarker/float16/1/face_landmarker.task'
+
+# MediaPipe running modes: "image" re-detects the face every frame,
+# "video" / "live_stream" reuse tracking between frames (much cheaper on CPU)
+RUNNING_MODES = {
+    "image": vision.RunningMode.IMAGE,
+    "video": vision.RunningMode.VIDEO,
+    "live_stream": vision.RunningMode.LIVE_STREAM,
+}
+
+
+def ensure_model(model_path=MODEL_PATH):
+    """Downloads the face landmarker model if it is missing"""
+    if not os.path.exists(model_path):
+        print("Downloading face landmarker model...")
+        urllib.request.urlretrieve(MODEL_URL, model_path)
+        print("Model downloaded!")
+    return model_path
+
+
+def create_landmarker(running_mode="video", result_callback=None, model_path=MODEL_PATH):
+    """Builds a single-face MediaPipe Face Landmarker for the given running mode"""
+    base_options = python.BaseOptions(model_asset_path=ensure_model(model_path))
+    options = vision.FaceLandmarkerOptions(
+        base_options=base_options,
+        running_mode=RUNNING_MODES[running_mode],
+        output_face_blendshapes=False,
+        output_facial_transformation_matrixes=False,
+        num_faces=1,
+        min_face_detection_confidence=0.5,
+        min_face_presence_confidence=0.5,
+        min_tracking_confidence=0.5,
+        result_callback=result_callback if running_mode == "live_stream" else None
+    )
+    return vision.FaceLandmarker.create_from_options(options)
+
+
+class LandmarkerPool(object):
+    """
+    IMAGE-mode landmarkers shared by every uploaded-frame request. At most `size`
+    detections run at once (one per landmarker); landmarkers are created on first use.
+    """
+
+    def __init__(self, size=None, model_path=MODEL_PATH):
+        if size is None:
+            size = int(os.environ.get("NEUROMO_MAX_ANALYZERS", "2"))
+        self.size = size
+        self.model_path = model_path
+        self._idle = queue.LifoQueue()
+        self._slots = threading.Semaphore(size)
+        metrics.ANALYZERS_BUSY.set_function(lambda: self.size - self._slots._value)
+
+    def detect(self, rgb_frame, timeout=None):
+        """Runs one detection. Raises TimeoutError if no analyzer frees up within `timeout` seconds"""
+        if not self._slots.acquire(timeout=timeout):
+            raise TimeoutError("All analyzers are busy")
+        try:
+            try:
+                detector = self._idle.get_nowait()
+            except queue.Empty:
+                detector = create_landmarker("image", model_path=self.model_path)
+            try:
+                return detector.detect(mp.Image(image_format=mp.ImageFormat.SRGB, data=rgb_frame))
+            finally:
+                self._idle.put(detector)
+        finally:
+            self._slots.release()
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+def _put_latest(q, item):
+    """Puts item on a bounded queue, dropping the oldest entry if it is full. Returns True if one was dropped"""
+    dropped = False
+    while True:
+        try:
+            q.put_nowait(item)
+            return dropped
+        except queue.Full:
+            try:
+                q.get_nowait()
+                dropped = True
+            except queue.Empty:
+                pass
 
 class VideoCamera(object):
-    def __init__(self):
-        # 1. Initialize Webcam
-        self.video = cv2.VideoCapture(0)
+    RUNNING_MODES = RUNNING_MODES
+
+    def __init__(self, pipelined=None, running_mode=None, source=None, autostart=True, session=None):
+        # 1. Initialize Frame Source (webcam unless NEUROMO_SOURCE says otherwise, see sources.py)
+        self.video = source if source is not None else open_source()
+        print(f"📷 Frame source: {self.video!r}")
         
         # 2. Download Model (Auto-download if missing)
-        model_path = 'face_landmarker.task'
-        if not os.path.exists(model_path):
-            print("Downloading face landmarker model...")
-            url = 'https://storage.googleapis.com/mediapipe-models/face_landmarker/face_landmarker/float16/1/face_landmarker.task'
-            urllib.request.urlretrieve(url, model_path)
-            print("Model downloaded!")
+        model_path = ensure_model()
 
         # 3. Setup MediaPipe Face Landmarker
-        base_options = python.BaseOptions(model_asset_path=model_path)
-        options = vision.FaceLandmarkerOptions(
-            base_options=base_options,
-            output_face_blendshapes=False,
-            output_facial_transformation_matrixes=False,
-            num_faces=1,
-            min_face_detection_confidence=0.5,
-            min_face_presence_confidence=0.5,
-            min_tracking_confidence=0.5
-        )
-        self.detector = vision.FaceLandmarker.create_from_options(options)
+        # Set NEUROMO_RUNNING_MODE=image|video|live_stream (default: video)
+        if running_mode is None:
+            running_mode = os.environ.get("NEUROMO_RUNNING_MODE", "video")
+        running_mode = running_mode.lower()
+        if running_mode not in self.RUNNING_MODES:
+            print(f"⚠️ Unknown running mode '{running_mode}', using 'video'")
+            running_mode = "video"
+        self.running_mode = running_mode
+        self._last_timestamp_ms = -1
+        self._latest_overlay = None # Last LIVE_STREAM result, drawn on following frames
+
+        self.detector = create_landmarker(running_mode, self._on_live_result, model_path)
 
         # 4. Define Eye Indices (Your constants)
         self.LEFT_EYE = [386, 374, 263, 362] 
@@ -41,198 +141,402 @@ class VideoCamera(object):
         self.NOSE_TIP = 1
         self.LEFT_CHEEK = 454
         self.RIGHT_CHEEK = 234
-        
-        # 6. Tuning Variables
-        self.EAR_THRESHOLD = 0.26
-        self.CONFIDENCE_THRESHOLD = 20
-        self.current_status= "Active"
-        
-        # NEW: Analytics Counters (Lifetime of the camera object)
-        self.stats = {
-            'distracted': 0,
-            'sleep': 0
-        }
-        # State Tracking (For Rising Edge Detection)
-        self.is_distracted_state = False
-        self.is_sleepy_state = False
-        self.sleep_frames = 0
-        
-        # NEW: Time Tracking Variables
-        self.distraction_start_time = None
-        self.DISTRACTION_LIMIT = 2 * 2
+
+        # Overlay: NEUROMO_OVERLAY=server draws it into the video (default); "client" skips
+        # drawing and publishes the points/status/EAR per analyzed frame for the browser to draw
+        self.overlay = OverlayRenderer(self.LEFT_EYE + self.RIGHT_EYE)
+        self.overlay_mode = os.environ.get("NEUROMO_OVERLAY", "server").lower()
+        self.overlay_broadcaster = FrameBroadcaster(buffer_size=1)
+
+        # 6. Status Logic: state machine, counters, event buffer and status push
+        # channel live in the camera's UserSession (the same class per-token sessions use)
+        self.session = session if session is not None else UserSession("local")
+        self.state = self.session.state
+        # NEW: Analytics Counters (Lifetime of the camera object, same dict as self.state.stats)
+        self.stats = self.session.stats
+        self.events = self.session.events
+        self.status_broadcaster = self.session.status_broadcaster
+        self._points = self.session._points
+        self.last_features = None
+
+        # 7. Adaptive Analysis Rate
+        # While the user stays "Focused" we only run the landmarker a few times a second,
+        # and jump straight back to full rate on any EAR drop or head-ratio change
+        self.ADAPTIVE_RATE = os.environ.get("NEUROMO_ADAPTIVE_RATE", "1") != "0"
+        self.IDLE_ANALYSIS_FPS = 5
+        self.STABLE_SECONDS = 3 # How long "Focused" must hold before slowing down
+        self.EAR_JUMP = 0.03 # EAR change that counts as "something is happening"
+        self.RATIO_JUMP = 0.5 # Head-ratio change that counts as a turn starting
+        self.last_ear = None
+        self.last_ratio = None
+        self._stable_since = None
+        self._last_analysis_time = 0
+        self.frames_analyzed = 0
+        self.frames_skipped = 0
+
+        # 8. Detection Input: "full", "downscale" (to DETECT_WIDTH) or "roi" (crop around last face)
+        # Landmarks are mapped back to full-frame coordinates, so EAR/ratio math is unchanged
+        self.detect_mode = os.environ.get("NEUROMO_DETECT_MODE", "full").lower()
+        self.DETECT_WIDTH = 320
+        self.ROI_MARGIN = 0.35 # Extra space around the last face box (fraction of its size)
+        self._last_bbox = None # (x0, y0, x1, y1) in pixels, from the previous landmarks
+        self._pending_rois = {} # LIVE_STREAM: timestamp -> (roi, w, h) for the callback
+
+        # 9. Threaded Pipeline (grab -> infer -> encode)
+        # Set NEUROMO_PIPELINE=0 to use one serial producer thread instead
+        if pipelined is None:
+            pipelined = os.environ.get("NEUROMO_PIPELINE", "1") != "0"
+        self.pipelined = pipelined
+        self.QUEUE_SIZE = 1 # Only ever keep the freshest frame per stage
+        # Captured frames are written in place into a ring of preallocated slots and
+        # passed between stages as (seq, view), never copied (allocated on the first frame)
+        self.RING_SLOTS = int(os.environ.get("NEUROMO_RING_SLOTS", "8"))
+        self._ring = None
+        self._rgb = None # Reused cvtColor output for the landmarker input
+        self._raw_queue = queue.Queue(maxsize=self.QUEUE_SIZE)
+        self._encode_queue = queue.Queue(maxsize=self.QUEUE_SIZE)
+        # Every encoded frame is published once and fanned out to all viewers
+        self.broadcaster = FrameBroadcaster()
+        # Smaller/lower-quality copies for viewers that ask for them (/video_feed?width=&quality=)
+        self.JPEG_QUALITY = int(os.environ.get("NEUROMO_JPEG_QUALITY", "95"))
+        self.profiles = StreamProfiles(self.broadcaster, self.JPEG_QUALITY)
+        self._reader = threading.local() # Remembers the last frame each get_frame() caller saw
+        self._threads = []
+        self._running = False
+        self._capture_rate = metrics.Rate(metrics.CAPTURE_FPS)
+        if autostart:
+            self.start()
+
+    @property
+    def current_status(self):
+        return self.state.current_status
+
+    @current_status.setter
+    def current_status(self, value):
+        self.state.current_status = value
 
     def __del__(self):
+        self.stop()
         self.video.release()
+        self.detector.close()
+
+    # --- PIPELINE CONTROL ---
+    def start(self):
+        """Starts the single producer (pipelined or serial) that feeds the broadcaster"""
+        if self._running:
+            return
+        self._running = True
+        if self.pipelined:
+            self._threads = [
+                threading.Thread(target=self._grab_loop, name="neuromo-grab", daemon=True),
+                threading.Thread(target=self._infer_loop, name="neuromo-infer", daemon=True),
+                threading.Thread(target=self._encode_loop, name="neuromo-encode", daemon=True),
+            ]
+        else:
+            self._threads = [
+                threading.Thread(target=self._serial_loop, name="neuromo-serial", daemon=True),
+            ]
+        for t in self._threads:
+            t.start()
+
+        # Read at scrape time, so they cost nothing per frame
+        metrics.QUEUE_DEPTH.set_function(self._raw_queue.qsize, "raw")
+        metrics.QUEUE_DEPTH.set_function(self._encode_queue.qsize, "encode")
+        metrics.STREAM_SUBSCRIBERS.set_function(lambda: self.broadcaster.subscriber_count)
+        metrics.STATUS_SUBSCRIBERS.set_function(lambda: self.status_broadcaster.subscriber_count)
+        mode = "grab -> infer -> encode" if self.pipelined else "serial"
+        print(f"🎥 Camera producer started ({mode})")
+
+    def stop(self):
+        """Stops the pipeline threads (safe to call more than once)"""
+        if not getattr(self, '_running', False):
+            return
+        self._running = False
+        for t in self._threads:
+            if t is not threading.current_thread():
+                t.join(timeout=1.0)
+        self._threads = []
+
+    def _read_frame(self):
+        """Reads one frame into the next ring slot. Returns (seq, frame view), or None on failure"""
+        if self._ring is None:
+            success, frame = self.video.read()
+            if not success:
+                return None
+            self._ring = FrameRing(self.RING_SLOTS, frame.nbytes)
+            self._frame_shape = frame.shape
+            index = self._ring.begin_write()
+            slot = self._ring.slot(index, frame.shape)
+            slot[...] = frame
+        else:
+            index = self._ring.begin_write()
+            slot = self._ring.slot(index, self._frame_shape)
+            try:
+                success = self.video.read_into(slot)
+            except ValueError as e:
+                print(f"⚠️ {e}: reallocating the frame ring")
+                self._ring = None
+                return None
+            if not success:
+                return None
+        if metrics.ENABLED:
+            metrics.FRAMES_CAPTURED.inc()
+            self._capture_rate.mark()
+        return self._ring.commit(index, slot.nbytes), slot
+
+    def _still_valid(self, seq):
+        """False if the grab thread has lapped the ring and overwritten frame `seq` meanwhile"""
+        ring = self._ring
+        if ring is not None and ring.valid(seq):
+            return True
+        metrics.FRAMES_DROPPED.inc(label="torn")
+        return False
 
-    def calculate_ear(self, landmarks, indices, w, h):
-        """Calculates Eye Aspect Ratio"""
-        # Get coordinates of the 4 key points
-        top = np.array([landmarks[indices[0]].x * w, landmarks[indices[0]].y * h])
-        bottom = np.array([landmarks[indices[1]].x * w, landmarks[indices[1]].y * h])
-        left = np.array([landmarks[indices[2]].x * w, landmarks[indices[2]].y * h])
-        right = np.array([landmarks[indices[3]].x * w, landmarks[indices[3]].y * h])
-
-        # Calculate distances
-        vertical_dist = np.linalg.norm(top - bottom)
-        horizontal_dist = np.linalg.norm(left - right)
-
-        # The Magic Formula
-        return vertical_dist / horizontal_dist
-
-    def get_frame(self):
-        """Reads a frame, runs AI, returns JPEG bytes for the web"""
-        success, frame = self.video.read()
-        if not success:
+    def _run_analysis(self, frame):
+        """analyze_frame() with timing and error logging. Returns False if it failed"""
+        t0 = time.perf_counter() if metrics.ENABLED else 0
+        try:
+            self.analyze_frame(frame)
+        except Exception as e:
+            print(f"❌ Inference failed: {e}")
+            return False
+        if metrics.ENABLED:
+            metrics.INFERENCE_SECONDS.observe(time.perf_counter() - t0)
+        return True
+
+    def _encode_and_publish(self, seq, frame):
+        # Full size for the main broadcaster, plus once per reduced profile being watched
+        self.profiles.frame_width = frame.shape[1]
+        encoded = []
+        for (width, quality), broadcaster in [((None, self.JPEG_QUALITY), self.broadcaster)] + self.profiles.active():
+            t0 = time.perf_counter() if metrics.ENABLED else 0
+            jpeg = self.encode_frame(frame, quality, width)
+            if metrics.ENABLED:
+                metrics.ENCODE_SECONDS.observe(time.perf_counter() - t0)
+            if jpeg is not None:
+                encoded.append((broadcaster, jpeg))
+        # A frame overwritten while we encoded it may be torn: skip it
+        if encoded and self._still_valid(seq):
+            for broadcaster, jpeg in encoded:
+                broadcaster.publish(jpeg)
+
+    def stream(self, width=None, quality=None):
+        """Broadcaster of the closest stream profile (the full-size one by default)"""
+        return self.profiles.get(width, quality)
+
+    def _grab_loop(self):
+        # Reads as fast as the camera delivers; stale frames are dropped
+        while self._running:
+            item = self._read_frame()
+            if item is None:
+                time.sleep(0.05)
+                continue
+            if _put_latest(self._raw_queue, item):
+                metrics.FRAMES_DROPPED.inc(label="raw")
+
+    def _infer_loop(self):
+        while self._running:
+            try:
+                seq, frame = self._raw_queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            if not self._run_analysis(frame) or not self._still_valid(seq):
+                continue
+            if _put_latest(self._encode_queue, (seq, frame)):
+                metrics.FRAMES_DROPPED.inc(label="encode")
+
+    def _encode_loop(self):
+        while self._running:
+            try:
+                seq, frame = self._encode_queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            self._encode_and_publish(seq, frame)
+
+    def _serial_loop(self):
+        # Read -> AI -> encode on one thread, still only once per captured frame
+        while self._running:
+            item = self._read_frame()
+            if item is None:
+                time.sleep(0.05)
+                continue
+            if self._run_analysis(item[1]):
+                self._encode_and_publish(*item)
+
+    def get_frame(self, timeout=1.0):
+        """Returns the latest JPEG bytes for the web (never runs AI itself)"""
+        # Block until a frame newer than the one this thread last saw is ready
+        last_seq = getattr(self._reader, 'seq', 0)
+        seq, jpeg = self.broadcaster.wait_newer(last_seq, timeout)
+        if seq == last_seq:
             return None
-        
+        self._reader.seq = seq
+        return jpeg
+
+    def encode_frame(self, frame, quality=None, width=None):
+        """Encodes a BGR frame to JPEG bytes, optionally downscaled to `width`"""
         h, w, _ = frame.shape
-        
+        if width is not None and width < w:
+            frame = cv2.resize(frame, (width, int(h * width / w)), interpolation=cv2.INTER_AREA)
+        if quality is None:
+            quality = self.JPEG_QUALITY
+        ret, jpeg = cv2.imencode('.jpg', frame, (cv2.IMWRITE_JPEG_QUALITY, quality))
+        if not ret:
+            return None
+        return jpeg.tobytes()
+
+    def _next_timestamp_ms(self):
+        """Monotonic, strictly increasing timestamps for VIDEO/LIVE_STREAM mode"""
+        ts = int(time.monotonic() * 1000)
+        if ts <= self._last_timestamp_ms:
+            ts = self._last_timestamp_ms + 1
+        self._last_timestamp_ms = ts
+        return ts
+
+    def _on_live_result(self, result, output_image, timestamp_ms):
+        """LIVE_STREAM callback: feeds the state machine as soon as a result is ready"""
+        roi, w, h = self._pending_rois.pop(timestamp_ms, (None, output_image.width, output_image.height))
+        self._map_to_frame(result, roi, w, h)
+        self._latest_overlay = self.process_result(result, w, h)
+
+    def _should_analyze(self, now):
+        """Adaptive scheduler: full rate unless the user has been stably focused"""
+        if not self.ADAPTIVE_RATE or self._stable_since is None:
+            return True
+        if now - self._stable_since < self.STABLE_SECONDS:
+            return True
+        return now - self._last_analysis_time >= 1.0 / self.IDLE_ANALYSIS_FPS
+
+    def _update_stability(self, status, avg_ear, ratio):
+        """Marks the stream as stable (Focused, no big EAR/ratio change) or unstable"""
+        changed = status != "Focused"
+        if self.last_ear is not None and abs(avg_ear - self.last_ear) > self.EAR_JUMP:
+            changed = True
+        if ratio is not None and self.last_ratio is not None and abs(ratio - self.last_ratio) > self.RATIO_JUMP:
+            changed = True
+        self.last_ear = avg_ear
+        self.last_ratio = ratio
+
+        if changed:
+            self._stable_since = None
+        elif self._stable_since is None:
+            self._stable_since = time.monotonic()
+
+    def _detection_input(self, frame):
+        """Returns (image to run the landmarker on, roi) where roi = (x0, y0, cw, ch) or None"""
+        h, w, _ = frame.shape
+        if self.detect_mode == "roi" and self._last_bbox is not None:
+            x0, y0, x1, y1 = self._last_bbox
+            return frame[y0:y1, x0:x1], (x0, y0, x1 - x0, y1 - y0)
+        if self.detect_mode in ("downscale", "roi") and w > self.DETECT_WIDTH:
+            # Normalized landmarks don't care about scale, so no remapping is needed
+            small_h = int(h * self.DETECT_WIDTH / w)
+            return cv2.resize(frame, (self.DETECT_WIDTH, small_h), interpolation=cv2.INTER_AREA), None
+        return frame, None
+
+    def _map_to_frame(self, detection_result, roi, w, h):
+        """Converts crop-relative landmarks back to full-frame normalized coordinates"""
+        if not detection_result.face_landmarks:
+            self._last_bbox = None # Lost the face: next frame searches the whole image
+            return
+        if roi is not None:
+            x0, y0, cw, ch = roi
+            for face_landmarks in detection_result.face_landmarks:
+                for lm in face_landmarks:
+                    lm.x = (x0 + lm.x * cw) / w
+                    lm.y = (y0 + lm.y * ch) / h
+        if self.detect_mode == "roi":
+            self._update_bbox(detection_result.face_landmarks[0], w, h)
+
+    def _update_bbox(self, face_landmarks, w, h):
+        """Face box (plus margin) from the current landmarks, used to crop the next frame"""
+        xs = [lm.x for lm in face_landmarks]
+        ys = [lm.y for lm in face_landmarks]
+        min_x, max_x = min(xs) * w, max(xs) * w
+        min_y, max_y = min(ys) * h, max(ys) * h
+        mx = (max_x - min_x) * self.ROI_MARGIN
+        my = (max_y - min_y) * self.ROI_MARGIN
+        x0, y0 = max(0, int(min_x - mx)), max(0, int(min_y - my))
+        x1, y1 = min(w, int(max_x + mx)), min(h, int(max_y + my))
+        if x1 - x0 < 32 or y1 - y0 < 32:
+            self._last_bbox = None
+        else:
+            self._last_bbox = (x0, y0, x1, y1)
+
+    def analyze_frame(self, frame):
+        """Runs AI + status logic on a BGR frame and draws the overlay in place"""
+        h, w, _ = frame.shape
+
+        # Adaptive rate: on skipped frames just redraw the last known result
+        now = time.monotonic()
+        if not self._should_analyze(now):
+            self.frames_skipped += 1
+            metrics.FRAMES_SKIPPED.inc()
+            if self._latest_overlay is not None and self.overlay_mode == "server":
+                self.draw_overlay(frame, *self._latest_overlay)
+            return frame
+        self._last_analysis_time = now
+        self.frames_analyzed += 1
+
         # --- AI PROCESSING START ---
-        # Convert to RGB for MediaPipe
-        rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        # Convert to RGB for MediaPipe (on the downscaled / cropped image if enabled)
+        detect_image, roi = self._detection_input(frame)
+        rgb_frame = self._to_rgb(detect_image)
         mp_image = mp.Image(image_format=mp.ImageFormat.SRGB, data=rgb_frame)
         
         # Detect landmarks
-        detection_result = self.detector.detect(mp_image)
-        
-        status = "Active"
-        color = (0, 255, 0) # Green
+        if self.running_mode == "live_stream":
+            # Result arrives in _on_live_result; draw the most recent one we have
+            timestamp_ms = self._next_timestamp_ms()
+            if len(self._pending_rois) > 30:
+                # MediaPipe drops inputs when busy, so some entries never get a callback
+                for stale in list(self._pending_rois)[:-10]:
+                    self._pending_rois.pop(stale, None)
+            self._pending_rois[timestamp_ms] = (roi, w, h)
+            self.detector.detect_async(mp_image, timestamp_ms)
+            overlay = self._latest_overlay
+        else:
+            if self.running_mode == "video":
+                detection_result = self.detector.detect_for_video(mp_image, self._next_timestamp_ms())
+            else:
+                detection_result = self.detector.detect(mp_image)
+            self._map_to_frame(detection_result, roi, w, h)
+            overlay = self.process_result(detection_result, w, h)
+            self._latest_overlay = overlay
 
-        if detection_result.face_landmarks:
-            for face_landmarks in detection_result.face_landmarks:
-                # 1. Calculate EAR
-                left_ear = self.calculate_ear(face_landmarks, self.LEFT_EYE, w, h)
-                right_ear = self.calculate_ear(face_landmarks, self.RIGHT_EYE, w, h)
-                avg_ear = (left_ear + right_ear) / 2.0
-
-                # 2. Gaze/Head Logic (Distraction)
-                # We check the ratio of the nose to the cheeks
-                nose_x = face_landmarks[self.NOSE_TIP].x
-                left_cheek_x = face_landmarks[self.LEFT_CHEEK].x
-                right_cheek_x = face_landmarks[self.RIGHT_CHEEK].x
-                
-                # Calculate distances
-                dist_left = nose_x - right_cheek_x  # Note: MediaPipe mirrors coordinates usually
-                dist_right = left_cheek_x - nose_x
-                
-                # Check for Head Turn (Distraction)
-                # If nose is too close to one cheek, user is looking away
-                is_looking_away = False
-                if dist_right != 0: # Avoid division by zero
-                    ratio = dist_left / dist_right
-                    # --- ADD THIS DEBUG LINE TEMPORARILY ---
-                    #print(f"Head Ratio: {ratio:.2f}") 
-                    # ---------------------------------------
-                    if ratio > 4 or ratio < 0: # Tuned thresholds
-                        is_looking_away = True
-
-                # --- FINAL STATUS DECISION ---
-                if avg_ear < self.EAR_THRESHOLD:
-                    self.sleep_frames += 1
-                    status = "Drowsy?"
-                    color = (0, 255, 255) # Yellow
-                    
-                    if self.sleep_frames > self.CONFIDENCE_THRESHOLD:
-                        status = "SLEEPING !!!"
-                        color = (0, 0, 255) # Red
-                        self.current_status = "alarm"
-                        
-                        # TRACKING: Sleep Event (Rising Edge)
-                        if not self.is_sleepy_state:
-                            self.stats['sleep'] += 1
-                            self.is_sleepy_state = True
-                            print(f"😴 Sleep Event Detected! Total: {self.stats['sleep']}")
-                    
-                    # Reset distraction timer if sleeping (Sleep takes priority)
-                    self.distraction_start_time = None
-
-                # 2. SECONDARY: DISTRACTION (Looking away - With 5 min buffer)
-                elif is_looking_away:
-                    self.sleep_frames = 0 
-                    self.is_sleepy_state = False # Reset sleep state
-                    
-                    # A. Start the timer if it hasn't started yet
-                    if self.distraction_start_time is None:
-                        self.distraction_start_time = time.time()
-                    
-                    # B. Check how much time has passed
-                    elapsed_time = time.time() - self.distraction_start_time
-                    remaining_time = self.DISTRACTION_LIMIT - elapsed_time
-                    
-                    if elapsed_time > self.DISTRACTION_LIMIT:
-                        # Time is up! Trigger Alarm
-                        status = "DISTRACTED!"
-                        color = (0, 0, 255) # Red
-                        self.current_status = "alarm"
-                        
-                        # TRACKING: Distraction Event (Rising Edge)
-                        if not self.is_distracted_state:
-                            self.stats['distracted'] += 1
-                            self.is_distracted_state = True
-                            print(f"👀 Distraction Event Detected! Total: {self.stats['distracted']}")
-
-                    else:
-                        # Still in "Grace Period"
-                        status = f"Away: {int(remaining_time)}s"
-                        color = (0, 165, 255) # Orange warning
-                        self.current_status = "active"
-                        # Do not count as distracted yet
-
-                # 3. FOCUSED (Reset everything)
-                else:
-                    self.sleep_frames = 0
-                    self.is_sleepy_state = False
-                    self.distraction_start_time = None # Reset the timer completely
-                    self.is_distracted_state = False # Reset distraction state
-                    
-                    status = "Focused"
-                    color = (0, 255, 0) # Green
-                    self.current_status = "active"
-
-                # 3. Draw Visuals on the Frame
-                # ... (Your logic for determining status/color is above this) ...
-
-                # --- NEW DRAWING LOGIC (CENTERED) ---
-                
-                # 1. Draw EAR at UPPER MIDDLE
-                ear_text = f"EAR: {avg_ear:.2f}"
-                font = cv2.FONT_HERSHEY_SIMPLEX
-                scale = 0.6
-                thickness = 2
-                
-                # Calculate size to center it
-                (text_w, text_h), _ = cv2.getTextSize(ear_text, font, scale, thickness)
-                x_pos = (w - text_w) // 2
-                y_pos = 30 # 30 pixels from top
-                
-                # Draw black outline for readability
-                cv2.putText(frame, ear_text, (x_pos, y_pos), font, scale, (0, 0, 0), thickness + 2)
-                # Draw white text
-                cv2.putText(frame, ear_text, (x_pos, y_pos), font, scale, (255, 255, 255), thickness)
-
-                # 2. Draw STATUS at BOTTOM MIDDLE
-                status_text = f"{status}" # Removed "Status:" prefix to make it cleaner
-                scale = 0.8
-                
-                (text_w, text_h), _ = cv2.getTextSize(status_text, font, scale, thickness)
-                x_pos = (w - text_w) // 2
-                y_pos = h - 20 # 20 pixels from bottom
-                
-                # Draw black outline
-                cv2.putText(frame, status_text, (x_pos, y_pos), font, scale, (0, 0, 0), thickness + 2)
-                # Draw colored text (Green/Red/Yellow)
-                cv2.putText(frame, status_text, (x_pos, y_pos), font, scale, color, thickness)
-                
-                # Draw Eye Points (Cyberpunk Look) - Keep this as is
-                for idx in self.LEFT_EYE + self.RIGHT_EYE:
-                    lm = face_landmarks[idx]
-                    cv2.circle(frame, (int(lm.x*w), int(lm.y*h)), 2, (0, 255, 255), -1)
-                # Draw Eye Points (Cyberpunk Look)
-                for idx in self.LEFT_EYE + self.RIGHT_EYE:
-                    lm = face_landmarks[idx]
-                    cv2.circle(frame, (int(lm.x*w), int(lm.y*h)), 2, (0, 255, 255), -1)
+        if overlay is not None and self.overlay_mode == "server":
+            self.draw_overlay(frame, *overlay)
         # --- AI PROCESSING END ---
+        return frame
+
+    def _to_rgb(self, image):
+        """BGR -> RGB into a buffer reused across frames (mp.Image copies it, so reuse is safe)"""
+        if self._rgb is None or self._rgb.shape != image.shape:
+            self._rgb = np.empty_like(image) # First frame, or the ROI crop changed size
+        return cv2.cvtColor(image, cv2.COLOR_BGR2RGB, dst=self._rgb)
+
+    def process_result(self, detection_result, w, h):
+        """Updates the status state machine. Returns (landmarks, status, color, ear) or None"""
+        result = self.session.process_detection(detection_result, w, h)
+        if result is None:
+            self._stable_since = None # No face: stay at full rate until we find one
+            self._publish_overlay(None)
+            return None
+        face_landmarks, status, color, avg_ear, ratio = result
+        self.last_features = self.session.last_features
+        self._update_stability(status, avg_ear, ratio)
+        overlay = (face_landmarks, status, color, avg_ear)
+        self._publish_overlay(overlay)
+        return overlay
+
+    def _publish_overlay(self, overlay):
+        """Client overlay mode: sends this frame's overlay data to /overlay/stream listeners"""
+        if self.overlay_mode != "client" or not self.overlay_broadcaster.subscriber_count:
+            return
+        data = self.overlay.metadata(*overlay) if overlay is not None else {'points': []}
+        data['time'] = time.time()
+        self.overlay_broadcaster.publish(data)
 
-        # Encode frame to JPEG for the website
-        ret, jpeg = cv2.imencode('.jpg', frame)
-        return jpeg.tobytes()
\ No newline at end of file
+    def draw_overlay(self, frame, face_landmarks, status, color, avg_ear):
+        """Draws the EAR/status text and eye points onto the frame (cached label sprites, see overlay.py)"""
+        self.overlay.draw(frame, face_landmarks, status, color, avg_ear)
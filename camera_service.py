@@ -0,0 +1,345 @@
+"""
+Dedicated camera process for production (multi-worker) deployments.
+
+One process owns the frame source and the inference loop (VideoCamera) and
+serves encoded frames, status updates and the local session's counters and
+events over a local socket. Every web worker talks to it through a
+RemoteCamera, which has the parts of VideoCamera's interface app.py uses, so
+any number of gunicorn workers can stream and sync without opening the camera
+more than once. On a unix socket, frames themselves go through a shared-memory
+FrameRing: the socket only carries each frame's sequence number.
+
+  python camera_service.py                                  # gunicorn.conf.py starts this for you
+  NEUROMO_CAMERA=remote gunicorn -c gunicorn.conf.py app:app
+"""
+import os
+import threading
+import time
+from multiprocessing.connection import Client, Listener
+
+import metrics
+from framering import FrameRing
+from streaming import FrameBroadcaster, StreamProfiles
+
+DEFAULT_ADDRESS = "/tmp/neuromo-camera.sock"
+JPEG_RING_SLOTS = 8
+MIN_JPEG_SLOT_BYTES = 1 << 20
+
+
+def service_address(spec=None):
+    """$NEUROMO_CAMERA_SOCKET: a unix socket path (default) or host:port"""
+    if spec is None:
+        spec = os.environ.get("NEUROMO_CAMERA_SOCKET", DEFAULT_ADDRESS)
+    host, sep, port = spec.rpartition(':')
+    if sep and port.isdigit() and '/' not in spec:
+        return (host or '127.0.0.1', int(port))
+    return spec
+
+
+def _authkey(address):
+    key = os.environ.get("NEUROMO_CAMERA_AUTHKEY")
+    if key:
+        return key.encode()
+    if isinstance(address, tuple):
+        # Messages are pickles: never accept unauthenticated TCP peers
+        raise RuntimeError("Set NEUROMO_CAMERA_AUTHKEY when the camera service listens on TCP")
+    return None # Unix socket: protected by its 0600 file mode
+
+
+class CameraService(object):
+    """
+    Serves one VideoCamera to web workers. Each connection asks for 'frames'
+    (JPEG bytes), ('frames', width, quality) (a reduced profile), 'ring'
+    (shared-memory ring name, then sequence numbers), 'status', 'overlay'
+    (client overlay mode data) or 'rpc'.
+    """
+
+    def __init__(self, camera, address=None):
+        self.camera = camera
+        self.address = service_address(address)
+        self.authkey = _authkey(self.address)
+        session = camera.session
+        # The only calls a worker can make
+        self._calls = {
+            'stats': lambda: dict(session.stats),
+            'current_status': lambda: session.current_status,
+            'pending_events': session.events.pending,
+            'ack_events': session.ack_events,
+            'reset_counters': session.reset_counters,
+            'telemetry_summary': session.telemetry_summary,
+            'metrics': metrics.render_prometheus,
+        }
+        self._ring = None
+        self._ring_seqs = FrameBroadcaster(buffer_size=1)
+        self._ring_ready = threading.Event()
+
+    def serve_forever(self):
+        if isinstance(self.address, str) and os.path.exists(self.address):
+            os.unlink(self.address) # Stale socket from a previous run
+        listener = Listener(self.address, authkey=self.authkey)
+        if isinstance(self.address, str):
+            os.chmod(self.address, 0o600)
+        print(f"📡 Camera service listening on {self.address}")
+        threading.Thread(target=self._fill_ring, daemon=True).start()
+        try:
+            while True:
+                try:
+                    conn = listener.accept()
+                except Exception as e:
+                    print(f"⚠️ Rejected camera service client: {e}")
+                    continue
+                threading.Thread(target=self._handle, args=(conn,), daemon=True).start()
+        finally:
+            listener.close()
+            if self._ring is not None:
+                self._ring.close()
+
+    def _fill_ring(self):
+        """Copies each JPEG once into shared memory; 'ring' clients are only sent its seq"""
+        with self.camera.broadcaster.subscribe() as subscriber:
+            while True:
+                jpeg = subscriber.get(timeout=5.0)
+                if jpeg is None:
+                    continue
+                if self._ring is None:
+                    # Sized from the first frame, with room for busier scenes
+                    slot_bytes = max(MIN_JPEG_SLOT_BYTES, 4 * len(jpeg))
+                    self._ring = FrameRing(JPEG_RING_SLOTS, slot_bytes, name=f"neuromo-{os.getpid()}")
+                    self._ring_ready.set()
+                if len(jpeg) > self._ring.slot_bytes:
+                    metrics.FRAMES_DROPPED.inc(label="oversize")
+                    continue
+                self._ring_seqs.publish(self._ring.write(jpeg))
+
+    def _handle(self, conn):
+        try:
+            kind = conn.recv()
+            if kind == 'frames':
+                self._stream(self.camera.broadcaster, conn.send_bytes)
+            elif isinstance(kind, tuple) and kind[0] == 'frames':
+                self._stream(self.camera.stream(*kind[1:]), conn.send_bytes)
+            elif kind == 'ring':
+                while not self._ring_ready.wait(timeout=5.0):
+                    conn.send(None) # No frame yet (also notices a worker that went away)
+                ring = self._ring
+                conn.send((ring.name, ring.slots, ring.slot_bytes))
+                self._stream(self._ring_seqs, conn.send)
+            elif kind == 'status':
+                self._stream(self.camera.status_broadcaster, conn.send)
+            elif kind == 'overlay':
+                self._stream(self.camera.overlay_broadcaster, conn.send)
+            elif kind == 'rpc':
+                self._serve_calls(conn)
+        except (EOFError, OSError):
+            pass # Worker went away
+        finally:
+            conn.close()
+
+    def _stream(self, broadcaster, send):
+        # Same drop-oldest subscriber a local viewer gets: a slow worker just skips frames
+        with broadcaster.subscribe() as subscriber:
+            if broadcaster.latest is not None:
+                send(broadcaster.latest)
+            while True:
+                item = subscriber.get(timeout=5.0)
+                if item is not None:
+                    send(item)
+
+    def _serve_calls(self, conn):
+        while True:
+            method, args = conn.recv()
+            call = self._calls.get(method)
+            if call is None:
+                conn.send((False, f"Unknown call '{method}'"))
+                continue
+            try:
+                conn.send((True, call(*args)))
+            except Exception as e:
+                conn.send((False, str(e)))
+
+
+class RemoteEvents(object):
+    """The camera session's EventLog, read through the camera service"""
+
+    def __init__(self, camera):
+        self._camera = camera
+
+    def pending(self):
+        return self._camera.call('pending_events')
+
+
+class RemoteSession(object):
+    """The camera process's UserSession as seen from a web worker"""
+    token = "local"
+
+    def __init__(self, camera):
+        self._camera = camera
+        self.events = RemoteEvents(camera)
+        self.status_broadcaster = camera.status_broadcaster
+
+    @property
+    def stats(self):
+        try:
+            return self._camera.call('stats')
+        except OSError:
+            return {'distracted': 0, 'sleep': 0} # Camera service down: nothing in flight
+
+    @property
+    def current_status(self):
+        # Every status change is pushed to us, so the last push is the current status
+        latest = self.status_broadcaster.latest
+        if latest is not None:
+            return latest['status']
+        try:
+            return self._camera.call('current_status')
+        except OSError:
+            return "camera_disabled"
+
+    def ack_events(self, events):
+        return self._camera.call('ack_events', events)
+
+    def reset_counters(self):
+        return self._camera.call('reset_counters')
+
+    def telemetry_summary(self):
+        return self._camera.call('telemetry_summary')
+
+    def touch(self):
+        pass
+
+
+class RemoteCamera(object):
+    """
+    Web-worker side of the camera service. Frames, status and overlay updates are relayed
+    into local broadcasters (one connection each per worker, however many viewers),
+    everything else is a small request/response call.
+    """
+
+    def __init__(self, address=None, retry_seconds=1.0):
+        self.address = service_address(address)
+        self.authkey = _authkey(self.address)
+        self.retry_seconds = retry_seconds
+        self.broadcaster = FrameBroadcaster()
+        self.status_broadcaster = FrameBroadcaster(buffer_size=1)
+        self.overlay_broadcaster = FrameBroadcaster(buffer_size=1)
+        self.overlay_mode = os.environ.get("NEUROMO_OVERLAY", "server").lower() # Same env as the service
+        # One relay per reduced profile in use; the service encodes it once for all workers
+        self.profiles = StreamProfiles(self.broadcaster, on_create=self._start_profile_relay)
+        self.session = RemoteSession(self)
+        self._rpc = None
+        self._rpc_lock = threading.Lock()
+        self._ring = None
+        # Shared memory only works on this host: use it with the (local) unix socket
+        self.use_ring = isinstance(self.address, str)
+        for kind in ('frames', 'status', 'overlay'):
+            threading.Thread(target=self._relay, args=(kind,), daemon=True).start()
+        print(f"📡 Using camera service at {self.address}")
+
+    @property
+    def current_status(self):
+        return self.session.current_status
+
+    def stop(self):
+        pass # The camera belongs to the service process
+
+    def stream(self, width=None, quality=None):
+        # Snapping happens again in the service, whose default quality is the real one
+        return self.profiles.get(width, quality)
+
+    def _start_profile_relay(self, key, broadcaster):
+        threading.Thread(target=self._relay, args=(('frames',) + key, broadcaster), daemon=True).start()
+
+    def _connect(self, kind):
+        conn = Client(self.address, authkey=self.authkey)
+        conn.send(kind)
+        return conn
+
+    def _relay(self, kind, broadcaster=None):
+        """Copies one stream from the camera service into a local broadcaster, reconnecting as needed"""
+        frames = kind not in ('status', 'overlay')
+        lazy = kind != 'status'
+        if broadcaster is None:
+            broadcaster = {'frames': self.broadcaster, 'status': self.status_broadcaster,
+                           'overlay': self.overlay_broadcaster}[kind]
+        while True:
+            # Frames (and per-frame overlay data) only flow while someone in this worker is watching
+            while lazy and broadcaster.subscriber_count == 0:
+                time.sleep(0.2)
+            ring = kind == 'frames' and self.use_ring
+            try:
+                conn = self._connect('ring' if ring else kind)
+            except OSError:
+                time.sleep(self.retry_seconds)
+                continue
+            try:
+                if ring:
+                    self._attach_ring(conn)
+                while True:
+                    if ring:
+                        jpeg = self._read_ring(conn.recv())
+                        if jpeg is not None:
+                            broadcaster.publish(jpeg)
+                    else:
+                        broadcaster.publish(conn.recv_bytes() if frames else conn.recv())
+                    if lazy and broadcaster.subscriber_count == 0:
+                        break
+            except (EOFError, OSError):
+                if not frames:
+                    broadcaster.latest = None # Don't report a stale status while disconnected
+                time.sleep(self.retry_seconds)
+            finally:
+                conn.close()
+
+    def _attach_ring(self, conn):
+        info = conn.recv()
+        while info is None: # Service has not produced a frame yet
+            info = conn.recv()
+        name, slots, slot_bytes = info
+        if self._ring is not None and self._ring.name != name:
+            self._ring.close() # Service restarted with a new ring
+            self._ring = None
+        if self._ring is None:
+            try:
+                self._ring = FrameRing.attach(name, slots, slot_bytes)
+            except FileNotFoundError:
+                self.use_ring = False # Service is not on this host after all: plain frames
+                raise EOFError(name)
+
+    def _read_ring(self, seq):
+        """bytes of frame `seq` from shared memory, or None if it was overwritten before we got it"""
+        view = self._ring.read(seq)
+        jpeg = bytes(view) if view is not None else None # The one copy: WSGI servers want bytes
+        if jpeg is None or not self._ring.valid(seq):
+            metrics.FRAMES_DROPPED.inc(label="torn")
+            return None
+        return jpeg
+
+    def call(self, method, *args):
+        """Calls a camera session method in the service process (one retry on a dropped connection)"""
+        with self._rpc_lock:
+            for attempt in range(2):
+                try:
+                    if self._rpc is None:
+                        self._rpc = self._connect('rpc')
+                    self._rpc.send((method, args))
+                    ok, result = self._rpc.recv()
+                    break
+                except (EOFError, OSError):
+                    if self._rpc is not None:
+                        self._rpc.close()
+                    self._rpc = None
+                    if attempt:
+                        raise
+        if not ok:
+            raise RuntimeError(f"Camera service: {result}")
+        return result
+
+
+def main():
+    from camera import VideoCamera
+    camera = VideoCamera()
+    CameraService(camera).serve_forever()
+
+
+if __name__ == '__main__':
+    main()
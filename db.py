@@ -0,0 +1,107 @@
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+import metrics
+
+# Applied to every new connection. WAL lets readers run while a writer commits,
+# so dashboard reads don't queue up behind /api/stats/sync writes.
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",   # Safe with WAL, far fewer fsyncs than FULL
+    "PRAGMA cache_size=-8000",     # ~8 MB page cache per connection
+    "PRAGMA mmap_size=67108864",   # 64 MB memory-mapped reads
+    "PRAGMA temp_store=MEMORY",
+)
+
+
+def add_missing_columns(conn, table, columns):
+    """Schema migration: ALTER TABLE ADD COLUMN for each (name, type) the table doesn't have yet"""
+    existing = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+    for name, decl in columns:
+        if name not in existing:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN {name} {decl}")
+
+
+class Database(object):
+    """
+    Small pooled SQLite data layer. Connections are reused across requests
+    (any thread may borrow one; they are created with check_same_thread=False)
+    and keep their prepared-statement cache warm between calls.
+    """
+
+    def __init__(self, path, pool_size=8, busy_timeout=5.0, cached_statements=256):
+        self.path = path
+        self.busy_timeout = busy_timeout
+        self.cached_statements = cached_statements
+        self._pool = queue.LifoQueue(maxsize=pool_size) # LIFO: hottest connection first
+        self._all = []
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        conn = sqlite3.connect(
+            self.path,
+            timeout=self.busy_timeout, # Sets busy_timeout: wait for locks instead of failing
+            check_same_thread=False,
+            cached_statements=self.cached_statements,
+            factory=metrics.TimedConnection if metrics.ENABLED else sqlite3.Connection,
+        )
+        for pragma in PRAGMAS:
+            conn.execute(pragma)
+        with self._lock:
+            self._all.append(conn)
+        return conn
+
+    @contextmanager
+    def connection(self):
+        """Borrows a pooled connection for the duration of the block"""
+        try:
+            conn = self._pool.get_nowait()
+        except queue.Empty:
+            conn = self._connect()
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback() # Never hand out a connection mid-transaction
+            try:
+                self._pool.put_nowait(conn)
+            except queue.Full:
+                with self._lock:
+                    self._all.remove(conn)
+                conn.close()
+
+    @contextmanager
+    def transaction(self):
+        """Connection with one write transaction: commits on success, rolls back on error"""
+        with self.connection() as conn:
+            conn.execute("BEGIN IMMEDIATE") # Take the write lock up front (no upgrade deadlocks)
+            try:
+                yield conn
+            except Exception:
+                conn.rollback()
+                raise
+            conn.commit()
+
+    def query(self, sql, params=()):
+        """Runs a read query and returns all rows"""
+        with self.connection() as conn:
+            return conn.execute(sql, params).fetchall()
+
+    def query_one(self, sql, params=()):
+        with self.connection() as conn:
+            return conn.execute(sql, params).fetchone()
+
+    def execute(self, sql, params=()):
+        """Runs one write statement in its own transaction. Returns (rowcount, lastrowid)"""
+        with self.transaction() as conn:
+            cur = conn.execute(sql, params)
+            return cur.rowcount, cur.lastrowid
+
+    def close_all(self):
+        with self._lock:
+            conns, self._all = self._all, []
+        for conn in conns:
+            conn.close()
+        self._pool = queue.LifoQueue(maxsize=self._pool.maxsize)
@@ -0,0 +1,113 @@
+import datetime
+import threading
+import time
+import uuid
+from collections import deque
+
+import metrics
+
+
+class Event(object):
+    """One sleep/distraction episode. `key` is stable, so re-sending it is idempotent"""
+    __slots__ = ('key', 'type', 'start', 'end', 'min_ear', 'closed', 'synced')
+
+    def __init__(self, key, event_type, start, min_ear):
+        self.key = key
+        self.type = event_type
+        self.start = start
+        self.end = start
+        self.min_ear = min_ear
+        self.closed = False
+        self.synced = False
+
+    def copy(self):
+        other = Event(self.key, self.type, self.start, self.min_ear)
+        other.end, other.closed, other.synced = self.end, self.closed, self.synced
+        return other
+
+    @property
+    def duration(self):
+        return self.end - self.start
+
+    def row(self, user_token):
+        """Parameters for INSERT_EVENT"""
+        timestamp = datetime.datetime.fromtimestamp(self.start, datetime.timezone.utc)
+        return (user_token, self.type, timestamp.strftime('%Y-%m-%d %H:%M:%S'),
+                round(self.duration, 3), self.min_ear, self.key)
+
+
+# Upsert on the idempotency key: a retried sync (or a re-sent open event whose
+# duration has grown since) updates the existing row instead of adding another.
+INSERT_EVENT = (
+    "INSERT INTO events (user_token, type, timestamp, duration, min_ear, event_key) VALUES (?, ?, ?, ?, ?, ?) "
+    "ON CONFLICT(event_key) DO UPDATE SET duration=excluded.duration, min_ear=excluded.min_ear"
+)
+
+
+class EventLog(object):
+    """
+    Bounded in-memory ring buffer of sleep/distraction events with their real
+    start time, duration and lowest EAR. Feed it the AttentionStateMachine after
+    every update(); flush with pending() -> one executemany -> ack().
+    """
+
+    def __init__(self, maxlen=1024):
+        self.session_id = uuid.uuid4().hex[:12] # Keys stay unique across camera restarts
+        self._events = deque(maxlen=maxlen)
+        self._open = None
+        self._seq = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._events)
+
+    def observe(self, state, ear=None, now=None):
+        """Opens an event on the state machine's rising edge and extends it while it lasts"""
+        if now is None:
+            now = time.time()
+        with self._lock:
+            if state.new_event:
+                if self._open is not None:
+                    self._open.closed = True
+                self._seq += 1
+                self._open = Event(f"{self.session_id}-{self._seq}", state.new_event, now, ear)
+                if self._events.maxlen and len(self._events) == self._events.maxlen:
+                    metrics.EVENTS_DROPPED.inc() # Oldest event falls off unsynced
+                self._events.append(self._open)
+            elif self._open is not None:
+                still_on = state.is_sleepy_state if self._open.type == 'sleep' else state.is_distracted_state
+                if still_on:
+                    self._open.end = now
+                    if ear is not None and (self._open.min_ear is None or ear < self._open.min_ear):
+                        self._open.min_ear = ear
+                else:
+                    self._open.closed = True
+                    self._open = None
+
+    def pending(self):
+        """Snapshot of the buffered events (including one still in progress), oldest first"""
+        with self._lock:
+            return [e.copy() for e in self._events]
+
+    def ack(self, snapshot):
+        """
+        Marks a pending() snapshot as written. Events that were closed in it leave
+        the buffer; one still in progress stays so its final duration is upserted
+        by the next flush. Returns {type: count} of events written for the first time.
+        """
+        written = {e.key: e for e in snapshot}
+        new_counts = {}
+        with self._lock:
+            kept = deque(maxlen=self._events.maxlen)
+            for e in self._events:
+                sent = written.get(e.key)
+                if sent is None:
+                    kept.append(e)
+                    continue
+                if not e.synced:
+                    e.synced = True
+                    new_counts[e.type] = new_counts.get(e.type, 0) + 1
+                if not sent.closed:
+                    kept.append(e)
+            self._events = kept
+        return new_counts
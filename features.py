@@ -0,0 +1,155 @@
+import numpy as np
+
+# MediaPipe Face Landmarker indices (478 points per face)
+NUM_LANDMARKS = 478
+
+# Eye points per eye: [top, bottom, outer corner, inner corner]
+EYE_INDICES = np.array([
+    [386, 374, 263, 362], # Left eye
+    [159, 145, 33, 133],  # Right eye
+])
+
+# Head turn: nose tip vs. both cheeks
+NOSE_TIP = 1
+LEFT_CHEEK = 454
+RIGHT_CHEEK = 234
+
+# Head nod: forehead / chin around the nose tip
+FOREHEAD = 10
+CHIN = 152
+
+# Mouth: [upper inner lip, lower inner lip, left corner, right corner]
+MOUTH_INDICES = np.array([13, 14, 61, 291])
+
+# Same thresholds as VideoCamera
+EAR_THRESHOLD = 0.26
+RATIO_MIN = 0
+RATIO_MAX = 4
+
+# Compact layout: only the landmarks the features need, in this order
+FEATURE_INDICES = np.unique(np.concatenate([
+    EYE_INDICES.ravel(), [NOSE_TIP, LEFT_CHEEK, RIGHT_CHEEK, FOREHEAD, CHIN], MOUTH_INDICES
+]))
+
+
+# Packed upload format (POST /api/landmarks as application/octet-stream): little-endian
+# records of a float64 unix timestamp + the FEATURE_INDICES points as float16 (x, y, z),
+# 110 bytes per frame. A frame without a face has NaN points.
+PACKED_FRAME_DTYPE = np.dtype([('t', '<f8'), ('points', '<f2', (len(FEATURE_INDICES), 3))])
+
+def _build_layout(position):
+    return {
+        'eyes': position(EYE_INDICES),
+        'mouth': position(MOUTH_INDICES),
+        'nose': position(NOSE_TIP),
+        'left_cheek': position(LEFT_CHEEK),
+        'right_cheek': position(RIGHT_CHEEK),
+        'forehead': position(FOREHEAD),
+        'chin': position(CHIN),
+    }
+
+# Index arrays for full (478 points) and compact (FEATURE_INDICES) inputs
+_FULL_LAYOUT = _build_layout(lambda idx: idx)
+_COMPACT_LAYOUT = _build_layout(lambda idx: np.searchsorted(FEATURE_INDICES, idx))
+
+
+def landmarks_to_array(face_landmarks, out=None, indices=FEATURE_INDICES):
+    """
+    Copies a MediaPipe landmark list into one (N, 3) float32 array, reusing `out` if given.
+    By default only the compact FEATURE_INDICES subset is copied; pass indices=None for all points.
+    """
+    if indices is not None:
+        face_landmarks = [face_landmarks[i] for i in indices]
+    n = len(face_landmarks)
+    if out is None or out.shape != (n, 3):
+        out = np.empty((n, 3), dtype=np.float32)
+    for row, lm in zip(out, face_landmarks):
+        row[0] = lm.x
+        row[1] = lm.y
+        row[2] = lm.z
+    return out
+
+
+def _safe_divide(a, b):
+    """a / b, with NaN where b is 0"""
+    return np.divide(a, b, out=np.full(np.shape(a), np.nan, dtype=np.float32), where=b != 0)
+
+
+def _distance(a, b):
+    """Euclidean distance over the last (x, y) axis"""
+    d = a - b
+    return np.hypot(d[..., 0], d[..., 1])
+
+
+def compute_features(points, w, h):
+    """
+    Computes attention features from normalized landmarks.
+
+    `points` is (N, 3) for one frame or (frames, N, 3) for a whole recording, where N is
+    either all 478 landmarks or the compact FEATURE_INDICES subset. Every value in the
+    returned dict has the matching leading shape:
+      left_ear, right_ear, ear  - Eye Aspect Ratio (in pixel space: eye height / eye width)
+      ratio                     - nose/cheek head-turn ratio (NaN if undefined)
+      mar                       - Mouth Aspect Ratio (yawns)
+      pitch                     - forehead-nose / nose-chin ratio (head nod)
+    """
+    points = np.asarray(points, dtype=np.float32)
+    layout = _COMPACT_LAYOUT if points.shape[-2] == len(FEATURE_INDICES) else _FULL_LAYOUT
+    scale = np.array([w, h], dtype=np.float32)
+    xy = points[..., :2] * scale
+
+    # Both eyes at once: (..., 2 eyes, 4 points, 2)
+    eyes = xy[..., layout['eyes'], :]
+    vertical = _distance(eyes[..., 0, :], eyes[..., 1, :])
+    horizontal = _distance(eyes[..., 2, :], eyes[..., 3, :])
+    eye_ratios = _safe_divide(vertical, horizontal)
+
+    # Head turn uses normalized x (same as the original per-frame code)
+    nose_x = points[..., layout['nose'], 0]
+    dist_left = nose_x - points[..., layout['right_cheek'], 0]
+    dist_right = points[..., layout['left_cheek'], 0] - nose_x
+
+    nose_y = points[..., layout['nose'], 1]
+    dist_up = nose_y - points[..., layout['forehead'], 1]
+    dist_down = points[..., layout['chin'], 1] - nose_y
+
+    mouth = xy[..., layout['mouth'], :]
+    mouth_open = _distance(mouth[..., 0, :], mouth[..., 1, :])
+    mouth_wide = _distance(mouth[..., 2, :], mouth[..., 3, :])
+
+    return {
+        'left_ear': eye_ratios[..., 0],
+        'right_ear': eye_ratios[..., 1],
+        'ear': (eye_ratios[..., 0] + eye_ratios[..., 1]) * 0.5,
+        'ratio': _safe_divide(dist_left, dist_right),
+        'mar': _safe_divide(mouth_open, mouth_wide),
+        'pitch': _safe_divide(dist_up, dist_down),
+    }
+
+
+def pack_frames(times, points):
+    """Encodes timestamps (frames,) and compact points (frames, N, 3) in the packed upload format"""
+    packed = np.empty(len(times), dtype=PACKED_FRAME_DTYPE)
+    packed['t'] = times
+    packed['points'] = points
+    return packed.tobytes()
+
+
+def unpack_frames(data):
+    """Decodes the packed upload format. Returns (times float64, points float32 (frames, N, 3))"""
+    if len(data) % PACKED_FRAME_DTYPE.itemsize:
+        raise ValueError(f"Body is not a whole number of {PACKED_FRAME_DTYPE.itemsize}-byte frames")
+    frames = np.frombuffer(data, dtype=PACKED_FRAME_DTYPE) # No copy: a view over the request body
+    return frames['t'], frames['points'].astype(np.float32)
+
+
+def score_frames(points, w, h, ear_threshold=EAR_THRESHOLD):
+    """
+    Batch API for offline scoring: features for a (frames, N, 3) array plus
+    per-frame `eyes_closed` and `looking_away` flags, all in one call.
+    """
+    features = compute_features(points, w, h)
+    ratio = features['ratio']
+    features['eyes_closed'] = features['ear'] < ear_threshold
+    features['looking_away'] = ~np.isnan(ratio) & ((ratio > RATIO_MAX) | (ratio < RATIO_MIN))
+    return features
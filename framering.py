@@ -0,0 +1,100 @@
+import numpy as np
+from multiprocessing import resource_tracker, shared_memory
+
+# Per-slot header: sequence number of the frame in the slot (0 = being written) and its size
+SLOT_HEADER = np.dtype([('seq', '<u8'), ('nbytes', '<u8')])
+_RING_HEADER_BYTES = 16 # Last committed sequence number (+ padding)
+
+
+class FrameRing(object):
+    """
+    Fixed-slot ring of preallocated frame buffers with sequence numbers.
+
+    A writer fills the next slot in place (begin_write -> slot view -> commit); readers
+    get numpy/memoryview views of a slot, no copies, and call valid(seq) afterwards to
+    find out whether the writer lapped them meanwhile (seqlock style, no reader locks).
+    With a `name` the ring lives in multiprocessing.shared_memory, so another process
+    can attach to the same slots with FrameRing.attach(name).
+    """
+
+    def __init__(self, slots, slot_bytes, name=None, _shm=None):
+        self.slots = slots
+        self.slot_bytes = slot_bytes
+        size = _RING_HEADER_BYTES + slots * (SLOT_HEADER.itemsize + slot_bytes)
+        self._shm = _shm
+        if self._shm is None and name is not None:
+            self._shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        buf = self._shm.buf if self._shm is not None else bytearray(size)
+        self.name = self._shm.name if self._shm is not None else None
+        self._last = np.ndarray((1,), dtype='<u8', buffer=buf)
+        self._headers = np.ndarray((slots,), dtype=SLOT_HEADER, buffer=buf, offset=_RING_HEADER_BYTES)
+        self._data = np.ndarray((slots, slot_bytes), dtype=np.uint8, buffer=buf,
+                                offset=_RING_HEADER_BYTES + slots * SLOT_HEADER.itemsize)
+        self._owner = _shm is None
+
+    @classmethod
+    def attach(cls, name, slots, slot_bytes):
+        """Maps a ring another process created"""
+        shm = shared_memory.SharedMemory(name=name)
+        try:
+            # Only the creating process may unlink it (Python < 3.13 would on our exit)
+            resource_tracker.unregister(shm._name, "shared_memory")
+        except Exception:
+            pass
+        return cls(slots, slot_bytes, _shm=shm)
+
+    @property
+    def last_seq(self):
+        return int(self._last[0])
+
+    def begin_write(self):
+        """Claims the next slot for writing. Returns its index"""
+        index = self.last_seq % self.slots
+        self._headers[index]['seq'] = 0 # Readers of the old frame now see it as gone
+        return index
+
+    def slot(self, index, shape=None, dtype=np.uint8):
+        """Writable view of a slot, optionally shaped (e.g. (h, w, 3) for a BGR frame)"""
+        view = self._data[index]
+        if shape is not None:
+            dtype = np.dtype(dtype)
+            view = view[:int(np.prod(shape)) * dtype.itemsize].view(dtype).reshape(shape)
+        return view
+
+    def commit(self, index, nbytes):
+        """Publishes the slot just written. Returns its sequence number"""
+        seq = self.last_seq + 1
+        self._headers[index]['nbytes'] = nbytes
+        self._headers[index]['seq'] = seq
+        self._last[0] = seq
+        return seq
+
+    def write(self, data):
+        """Copies a bytes-like object (e.g. an encoded JPEG) into the next slot. Returns its seq"""
+        data = np.frombuffer(data, dtype=np.uint8)
+        if data.size > self.slot_bytes:
+            raise ValueError(f"{data.size} bytes do not fit a {self.slot_bytes}-byte slot")
+        index = self.begin_write()
+        self._data[index, :data.size] = data
+        return self.commit(index, data.size)
+
+    def read(self, seq):
+        """memoryview of frame `seq` (no copy), or None if it was already overwritten"""
+        index = (seq - 1) % self.slots
+        header = self._headers[index]
+        if int(header['seq']) != seq:
+            return None
+        return memoryview(self._data[index, :int(header['nbytes'])])
+
+    def valid(self, seq):
+        """True while frame `seq` is still in its slot (check after reading a view)"""
+        return seq > 0 and int(self._headers[(seq - 1) % self.slots]['seq']) == seq
+
+    def close(self):
+        # Views must go before the shared memory can be unmapped
+        self._last = self._headers = self._data = None
+        if self._shm is not None:
+            self._shm.close()
+            if self._owner:
+                self._shm.unlink()
+            self._shm = None
@@ -0,0 +1,48 @@
+"""
+Production server:
+
+  NEUROMO_CAMERA=remote gunicorn -c gunicorn.conf.py app:app
+
+Starts camera_service.py (the only process that opens the camera and runs
+inference) next to the web workers, which stream and sync through it.
+"""
+import multiprocessing
+import os
+import subprocess
+import sys
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8969')}"
+# Per-token sessions (NEUROMO_SESSIONS=multi: /api/frame, /api/landmarks, /status?token=) live in
+# one worker's memory, and nothing routes a user back to the same worker: one worker by default
+MULTI_SESSIONS = os.environ.get("NEUROMO_SESSIONS", "local").lower() == "multi"
+workers = int(os.environ.get("WEB_CONCURRENCY", 1 if MULTI_SESSIONS else min(4, multiprocessing.cpu_count())))
+# Every open /video_feed or /status/stream holds a thread (or greenlet with "gevent")
+worker_class = os.environ.get("NEUROMO_WORKER_CLASS", "gthread")
+threads = int(os.environ.get("NEUROMO_THREADS", "32"))
+# Workers need to know they aren't alone (e.g. taskwriter.py writes task updates through)
+raw_env = ["NEUROMO_CAMERA=remote", f"NEUROMO_WEB_WORKERS={workers}"]
+
+_camera_service = None
+
+
+def on_starting(server):
+    """Starts the camera process once, in the master, before any worker"""
+    global _camera_service
+    if MULTI_SESSIONS and workers > 1:
+        server.log.warning("NEUROMO_SESSIONS=multi with %s workers: each user's uploads and status requests "
+                           "must reach the same worker (sticky routing), or their sessions split", workers)
+    # "external": the camera service runs elsewhere (e.g. its own container); "multi": no local camera
+    if os.environ.get("NEUROMO_CAMERA_SERVICE", "spawn") != "spawn" or MULTI_SESSIONS:
+        return
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "camera_service.py")
+    _camera_service = subprocess.Popen([sys.executable, script])
+    server.log.info("Started camera service (pid %s)", _camera_service.pid)
+
+
+def on_exit(server):
+    if _camera_service is not None and _camera_service.poll() is None:
+        _camera_service.terminate()
+        try:
+            _camera_service.wait(10)
+        except subprocess.TimeoutExpired:
+            _camera_service.kill()
@@ -0,0 +1,77 @@
+import threading
+import time
+
+from sessions import UserSession
+
+
+class LazyCamera(object):
+    """
+    Stands in for the local camera so the web server can start right away.
+    The first request that needs the camera calls start(), which builds it on a
+    background thread (importing cv2/mediapipe, downloading the model, opening
+    the source). Until it is ready -- or if it fails -- this behaves like the
+    disabled camera. The UserSession exists from the start and is handed to the
+    camera, so status listeners subscribed early keep receiving updates.
+    """
+
+    def __init__(self, factory):
+        self._factory = factory # session -> camera
+        self.session = UserSession("local")
+        self.stats = self.session.stats
+        self.events = self.session.events
+        self.camera = None
+        self.state = "idle" # idle -> loading -> ready | failed
+        self.error = None
+        self.startup_seconds = None
+        self._ready = threading.Event()
+        self._lock = threading.Lock()
+
+    @property
+    def current_status(self):
+        return self.session.current_status
+
+    def start(self):
+        """Begins loading in the background (only the first call does anything)"""
+        with self._lock:
+            if self.state != "idle":
+                return
+            self.state = "loading"
+        self._publish_state()
+        threading.Thread(target=self._load, name="neuromo-camera-init", daemon=True).start()
+
+    def _load(self):
+        t0 = time.perf_counter()
+        try:
+            camera = self._factory(self.session)
+        except Exception as e:
+            print(f"❌ Camera init failed: {e}")
+            self.error = str(e)
+            self.session.current_status = "camera_disabled" # What the mock camera reports
+            self.state = "failed"
+        else:
+            self.camera = camera
+            self.state = "ready"
+            self.startup_seconds = round(time.perf_counter() - t0, 3)
+            print(f"✅ Camera ready in {self.startup_seconds:.2f}s")
+        self._ready.set()
+        self._publish_state()
+
+    def _publish_state(self):
+        # Lets an open /status/stream know without waiting for the next status change
+        self.session.status_broadcaster.publish({'status': self.current_status, 'camera': self.state})
+
+    def wait(self, timeout=None):
+        """Starts loading if needed and waits. Returns the camera, or None if it failed / isn't ready yet"""
+        self.start()
+        self._ready.wait(timeout)
+        return self.camera
+
+    def get_frame(self):
+        return self.camera.get_frame() if self.camera is not None else None
+
+    def __getattr__(self, name):
+        # Everything else (broadcaster, stream, overlay_mode, ...) is the real camera's
+        camera = self.__dict__.get('camera')
+        if camera is None:
+            raise AttributeError(name)
+        return getattr(camera, name)
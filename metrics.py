@@ -0,0 +1,251 @@
+import os
+import sqlite3
+import threading
+import time
+from bisect import bisect_left
+
+# Set NEUROMO_METRICS=0 to turn every metric into a no-op
+ENABLED = os.environ.get("NEUROMO_METRICS", "1") != "0"
+
+# Seconds; tuned for frame stages (ms) up to slow HTTP/SQLite calls
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+_registry = []
+
+
+def _format_labels(label_name, label, extra=None):
+    parts = []
+    if label_name and label is not None:
+        parts.append(f'{label_name}="{label}"')
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class _Metric(object):
+    kind = None
+
+    def __init__(self, name, help_text, label_name=None):
+        self.name = name
+        self.help = help_text
+        self.label_name = label_name
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name, help_text, label_name=None):
+        super().__init__(name, help_text, label_name)
+        self._values = {}
+
+    def inc(self, amount=1, label=None):
+        if not ENABLED:
+            return
+        with self._lock:
+            self._values[label] = self._values.get(label, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            return dict(self._values)
+
+
+class Gauge(_Metric):
+    """A value that is either set directly or read from a callback at scrape time"""
+    kind = "gauge"
+
+    def __init__(self, name, help_text, label_name=None):
+        super().__init__(name, help_text, label_name)
+        self._values = {}
+        self._functions = {}
+
+    def set(self, value, label=None):
+        if ENABLED:
+            self._values[label] = value
+
+    def set_function(self, fn, label=None):
+        self._functions[label] = fn
+
+    def samples(self):
+        values = dict(self._values)
+        for label, fn in list(self._functions.items()):
+            try:
+                values[label] = fn()
+            except Exception:
+                continue
+        return values
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, label_name=None, buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, label_name)
+        self.buckets = tuple(buckets)
+        self._series = {} # label -> [bucket counts..., +Inf count, sum]
+
+    def observe(self, value, label=None):
+        if not ENABLED:
+            return
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label)
+            if series is None:
+                series = self._series[label] = [0] * (len(self.buckets) + 2)
+            series[i] += 1
+            series[-1] += value
+
+    def samples(self):
+        with self._lock:
+            return {label: list(series) for label, series in self._series.items()}
+
+    def quantile(self, series, q):
+        """Estimates a quantile from bucket counts (linear within the bucket)"""
+        counts = series[:-1]
+        total = sum(counts)
+        if not total:
+            return None
+        target = q * total
+        seen = 0
+        lower = 0.0
+        for i, count in enumerate(counts):
+            upper = self.buckets[i] if i < len(self.buckets) else self.buckets[-1]
+            if seen + count >= target:
+                if not count or i == len(self.buckets):
+                    return upper
+                return lower + (upper - lower) * (target - seen) / count
+            seen += count
+            lower = upper
+        return self.buckets[-1]
+
+
+class Rate(object):
+    """Events per second over the last ~second (e.g. capture fps), exported as a gauge"""
+
+    def __init__(self, gauge, label=None, window=1.0):
+        self.gauge = gauge
+        self.label = label
+        self.window = window
+        self._start = time.monotonic()
+        self._count = 0
+
+    def mark(self):
+        if not ENABLED:
+            return
+        self._count += 1
+        now = time.monotonic()
+        elapsed = now - self._start
+        if elapsed >= self.window:
+            self.gauge.set(round(self._count / elapsed, 2), self.label)
+            self._start = now
+            self._count = 0
+
+
+def render_prometheus():
+    """All metrics in the Prometheus text exposition format"""
+    lines = []
+    for metric in _registry:
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        if metric.kind == "histogram":
+            for label, series in metric.samples().items():
+                cumulative = 0
+                for i, upper in enumerate(metric.buckets):
+                    cumulative += series[i]
+                    le = _format_labels(metric.label_name, label, f'le="{upper}"')
+                    lines.append(f"{metric.name}_bucket{le} {cumulative}")
+                cumulative += series[len(metric.buckets)]
+                inf = _format_labels(metric.label_name, label, 'le="+Inf"')
+                plain = _format_labels(metric.label_name, label)
+                lines.append(f"{metric.name}_bucket{inf} {cumulative}")
+                lines.append(f"{metric.name}_sum{plain} {series[-1]}")
+                lines.append(f"{metric.name}_count{plain} {cumulative}")
+        else:
+            for label, value in metric.samples().items():
+                lines.append(f"{metric.name}{_format_labels(metric.label_name, label)} {value}")
+    return "\n".join(lines) + "\n"
+
+
+def as_dict():
+    """All metrics as plain JSON-friendly data (histograms as count/mean/p50/p95/p99 in ms)"""
+    out = {'enabled': ENABLED}
+    for metric in _registry:
+        if metric.kind == "histogram":
+            data = {}
+            for label, series in metric.samples().items():
+                count = sum(series[:-1])
+                data[label or ""] = {
+                    'count': count,
+                    'mean_ms': round(series[-1] / count * 1000, 3) if count else None,
+                    'p50_ms': _ms(metric.quantile(series, 0.50)),
+                    'p95_ms': _ms(metric.quantile(series, 0.95)),
+                    'p99_ms': _ms(metric.quantile(series, 0.99)),
+                }
+        else:
+            data = {label or "": value for label, value in metric.samples().items()}
+        out[metric.name] = data
+    return out
+
+
+def _ms(seconds):
+    return round(seconds * 1000, 3) if seconds is not None else None
+
+
+class TimedCursor(sqlite3.Cursor):
+    """sqlite3 cursor that records every statement in SQLITE_SECONDS"""
+
+    def execute(self, sql, parameters=()):
+        t0 = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            SQLITE_SECONDS.observe(time.perf_counter() - t0)
+
+    def executemany(self, sql, seq_of_parameters):
+        t0 = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            SQLITE_SECONDS.observe(time.perf_counter() - t0)
+
+
+class TimedConnection(sqlite3.Connection):
+    """Use as sqlite3.connect(..., factory=TimedConnection) to time every query"""
+
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+# --- NEUROMO METRICS ---
+
+# Camera / frame pipeline
+FRAMES_CAPTURED = Counter("neuromo_frames_captured_total", "Frames read from the frame source")
+CAPTURE_FPS = Gauge("neuromo_capture_fps", "Frames read per second")
+FRAMES_DROPPED = Counter("neuromo_frames_dropped_total", "Stale frames dropped by a pipeline stage", "stage")
+FRAMES_SKIPPED = Counter("neuromo_frames_skipped_total", "Frames not analyzed by the adaptive scheduler")
+INFERENCE_SECONDS = Histogram("neuromo_inference_seconds", "Landmarker + status logic + overlay per frame")
+ENCODE_SECONDS = Histogram("neuromo_encode_seconds", "JPEG encode time per frame")
+QUEUE_DEPTH = Gauge("neuromo_queue_depth", "Frames waiting in a pipeline queue", "queue")
+STREAM_SUBSCRIBERS = Gauge("neuromo_stream_subscribers", "Open /video_feed viewers")
+STATUS_SUBSCRIBERS = Gauge("neuromo_status_subscribers", "Open /status/stream listeners")
+
+# Per-user sessions (uploaded frames / landmarks)
+ACTIVE_SESSIONS = Gauge("neuromo_active_sessions", "Per-token monitoring sessions in memory")
+SESSIONS_EVICTED = Counter("neuromo_sessions_evicted_total", "Sessions dropped for being idle or over the cap")
+ANALYZERS_BUSY = Gauge("neuromo_analyzers_busy", "Pooled landmarkers currently running a detection")
+EVENTS_DROPPED = Counter("neuromo_events_dropped_total", "Unsynced events pushed out of the event ring buffer")
+
+# Web / database
+REQUEST_SECONDS = Histogram("neuromo_http_request_seconds", "Flask request latency", "route")
+REQUESTS = Counter("neuromo_http_requests_total", "Flask requests by route", "route")
+SQLITE_SECONDS = Histogram("neuromo_sqlite_query_seconds", "SQLite statement execution time")
+ANALYTICS_CACHE = Counter("neuromo_analytics_cache_total", "Analytics result cache lookups", "result")
+TASK_UPDATES = Counter("neuromo_task_updates_total", "Task updates queued by requests / rows written by flushes", "stage")
+PENDING_TASK_UPDATES = Gauge("neuromo_pending_task_updates", "Tasks with updates waiting for the next flush")
@@ -0,0 +1,115 @@
+import threading
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+FONT = cv2.FONT_HERSHEY_SIMPLEX
+THICKNESS = 2
+OUTLINE = (0, 0, 0)
+POINT_COLOR = (0, 255, 255)
+
+
+def _to_u8(values):
+    return np.clip(np.rint(values), 0, 255).astype(np.uint8)
+
+
+class Sprite(object):
+    """
+    One pre-rendered label: premultiplied text color and per-pixel transmittance
+    (how much of the frame shows through the antialiased outline + text, 255 = all),
+    plus where its baseline origin sits.
+    """
+    __slots__ = ('color', 'transmittance', 'origin', 'text_width')
+
+    def __init__(self, color, transmittance, origin, text_width):
+        self.color = color
+        self.transmittance = transmittance
+        self.origin = origin
+        self.text_width = text_width
+
+
+class OverlayRenderer(object):
+    """
+    Draws the EAR / status / eye-point overlay. Each distinct label is rendered
+    once (black outline + colored text) into a small sprite, so a frame costs two
+    small blends instead of getTextSize + putText x2 per label. The blend matches
+    drawing the text straight onto the frame (outline first, then text on top).
+    """
+
+    def __init__(self, eye_points, max_sprites=256):
+        self.eye_points = list(eye_points)
+        self.max_sprites = max_sprites # EAR labels alone can take ~100 values
+        self._sprites = OrderedDict()
+        self._lock = threading.Lock()
+
+    def sprite(self, text, scale, color):
+        key = (text, scale, color)
+        with self._lock:
+            cached = self._sprites.get(key)
+            if cached is not None:
+                self._sprites.move_to_end(key)
+                return cached
+        cached = self._render(text, scale, color)
+        with self._lock:
+            self._sprites[key] = cached
+            while len(self._sprites) > self.max_sprites:
+                self._sprites.popitem(last=False)
+        return cached
+
+    @staticmethod
+    def _render(text, scale, color):
+        (text_w, text_h), baseline = cv2.getTextSize(text, FONT, scale, THICKNESS)
+        pad = THICKNESS + 2 # Room for the outline stroke
+        origin = (pad, pad + text_h)
+        size = (text_h + baseline + 2 * pad, text_w + 2 * pad)
+        # Coverage of the outline and of the text (0..255, antialiased edges)
+        outline = np.zeros(size, dtype=np.uint8)
+        cv2.putText(outline, text, origin, FONT, scale, 255, THICKNESS + 2)
+        fill = np.zeros(size, dtype=np.uint8)
+        cv2.putText(fill, text, origin, FONT, scale, 255, THICKNESS)
+        a_outline = outline.astype(np.float32)[..., None] / 255
+        a_fill = fill.astype(np.float32)[..., None] / 255
+        # frame -> frame * (1 - a_outline) + OUTLINE * a_outline -> ... * (1 - a_fill) + color * a_fill
+        keep = (1 - a_outline) * (1 - a_fill)
+        premultiplied = np.float32(OUTLINE) * a_outline * (1 - a_fill) + np.float32(color) * a_fill
+        return Sprite(_to_u8(premultiplied), _to_u8(np.repeat(keep, 3, axis=2) * 255), origin, text_w)
+
+    @staticmethod
+    def blit(frame, sprite, x, y):
+        """Copies the sprite's text pixels so its baseline origin lands on (x, y), clipped to the frame"""
+        fh, fw = frame.shape[:2]
+        sh, sw = sprite.color.shape[:2]
+        x0, y0 = x - sprite.origin[0], y - sprite.origin[1]
+        fx0, fy0 = max(x0, 0), max(y0, 0)
+        fx1, fy1 = min(x0 + sw, fw), min(y0 + sh, fh)
+        if fx0 >= fx1 or fy0 >= fy1:
+            return
+        sx, sy = fx0 - x0, fy0 - y0
+        src = (slice(sy, sy + fy1 - fy0), slice(sx, sx + fx1 - fx0))
+        roi = frame[fy0:fy1, fx0:fx1]
+        # roi * transmittance + color, written straight into the frame view
+        cv2.add(cv2.multiply(roi, sprite.transmittance[src], scale=1 / 255.0), sprite.color[src], dst=roi)
+
+    def draw(self, frame, face_landmarks, status, color, avg_ear):
+        h, w, _ = frame.shape
+        # EAR at upper middle (white), status at bottom middle (status color)
+        ear = self.sprite(f"EAR: {avg_ear:.2f}", 0.6, (255, 255, 255))
+        self.blit(frame, ear, (w - ear.text_width) // 2, 30)
+        label = self.sprite(f"{status}", 0.8, tuple(color))
+        self.blit(frame, label, (w - label.text_width) // 2, h - 20)
+        # Eye points (Cyberpunk Look)
+        for idx in self.eye_points:
+            lm = face_landmarks[idx]
+            cv2.circle(frame, (int(lm.x * w), int(lm.y * h)), 2, POINT_COLOR, -1)
+
+    def metadata(self, face_landmarks, status, color, avg_ear):
+        """The same overlay as data, for clients that draw it themselves (normalized coordinates)"""
+        b, g, r = color
+        return {
+            'points': [[round(float(face_landmarks[idx].x), 4), round(float(face_landmarks[idx].y), 4)]
+                       for idx in self.eye_points],
+            'status': status,
+            'color': f"rgb({r}, {g}, {b})",
+            'ear': round(avg_ear, 3),
+        }
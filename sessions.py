@@ -0,0 +1,253 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+import features
+import metrics
+import telemetry
+from attention import AttentionStateMachine
+from events import EventLog
+from streaming import FrameBroadcaster
+
+
+class UserSession(object):
+    """
+    Monitoring state for one user: status state machine, counters, event buffer
+    and status push channel. The local camera owns one; per-token sessions fed
+    by uploaded frames/landmarks are held by a SessionManager.
+    """
+
+    def __init__(self, token, verbose=True):
+        self.token = token
+        self.state = AttentionStateMachine(verbose=verbose)
+        # Analytics Counters (same dict as self.state.stats)
+        self.stats = self.state.stats
+        # Each event with its real time/duration, waiting for /api/stats/sync to write it
+        self.events = EventLog()
+        # Status changes are pushed to /status/stream listeners (1-item buffer = latest state only)
+        self.status_broadcaster = FrameBroadcaster(buffer_size=1)
+        self._last_pushed = None
+        # Per-frame EAR/ratio/status recording (NEUROMO_TELEMETRY), None when off
+        self.telemetry = telemetry.recorder_for(token)
+
+        # Reused every frame: landmarks -> one (N, 3) array for the vectorized feature math
+        self._points = np.empty((len(features.FEATURE_INDICES), 3), dtype=np.float32)
+        self.last_features = None
+        self.last_seen = time.monotonic()
+        self.lock = threading.Lock() # One frame at a time per user (the state machine is not thread-safe)
+
+    @property
+    def current_status(self):
+        return self.state.current_status
+
+    @current_status.setter
+    def current_status(self, value):
+        self.state.current_status = value
+
+    def touch(self):
+        self.last_seen = time.monotonic()
+
+    def ack_events(self, events):
+        """After a commit: drops written events from the buffer and from the live counters"""
+        for event_type, count in self.events.ack(events).items():
+            self.stats[event_type] = max(0, self.stats[event_type] - count)
+
+    def reset_counters(self):
+        self.stats['distracted'] = 0
+        self.stats['sleep'] = 0
+
+    def telemetry_summary(self):
+        """Per-minute summary of the frames recorded since the last call (None if telemetry is off)"""
+        return self.telemetry.summary() if self.telemetry is not None else None
+
+    def close(self):
+        if self.telemetry is not None:
+            self.telemetry.close()
+
+    def process_detection(self, detection_result, w, h, now=None):
+        """Updates the status from a landmarker result. Returns (landmarks, status, color, ear, ratio) or None"""
+        result = None
+        if detection_result.face_landmarks:
+            for face_landmarks in detection_result.face_landmarks:
+                # Landmarks -> (N, 3) array once, then all features in one vectorized pass
+                points = features.landmarks_to_array(face_landmarks, self._points)
+                face = self.process_points(points, w, h, now)
+                if face is not None:
+                    result = (face_landmarks,) + face
+        else:
+            self.no_face()
+        return result
+
+    def process_points(self, points, w, h, now=None):
+        """
+        Updates the status from one face's (N, 3) feature points. Returns (status, color, ear, ratio),
+        or None when no EAR can be computed from them (counted as a frame without a face)
+        """
+        frame_features = features.compute_features(points, w, h)
+        if now is None:
+            now = time.time()
+        if not np.isfinite(frame_features['ear']):
+            self.no_face(now)
+            return None
+        self.last_features = frame_features
+        result = self._step(float(frame_features['ear']), float(frame_features['ratio']), now)
+        if self.telemetry is not None:
+            self.telemetry.record(now, frame_features['left_ear'], frame_features['right_ear'],
+                                  frame_features['ratio'], self.state.status_code)
+        return result
+
+    def process_batch(self, times, points, w, h):
+        """
+        Runs many frames at once: (frames, N, 3) points (NaN rows = no face) with
+        per-frame unix timestamps. Features are computed in one vectorized call;
+        only the state machine steps frame by frame. Frames without a finite EAR
+        count as no face. Returns the number of face frames.
+        """
+        times = np.asarray(times, dtype=np.float64)
+        if len(times) > 1 and np.any(np.diff(times) < 0):
+            order = np.argsort(times, kind='stable') # Batches may be reassembled out of order
+            times, points = times[order], points[order]
+        batch = features.compute_features(points, w, h)
+        ears = batch['ear'].tolist()
+        ratios = batch['ratio'].tolist()
+        has_face = np.isfinite(batch['ear']).tolist()
+        codes = np.empty(len(times), dtype=np.uint8)
+        for i, t in enumerate(times.tolist()):
+            if has_face[i]:
+                self._step(ears[i], ratios[i], t)
+            else:
+                self._no_face(t)
+            codes[i] = self.state.status_code
+        if self.telemetry is not None:
+            # No-face rows have NaN features already
+            self.telemetry.record_batch(times, batch['left_ear'], batch['right_ear'], batch['ratio'], codes)
+        if any(has_face):
+            last = len(has_face) - 1 - has_face[::-1].index(True)
+            self.last_features = {name: values[last] for name, values in batch.items()}
+        return sum(has_face)
+
+    def _step(self, avg_ear, ratio, now=None):
+        """One analyzed frame through the state machine. Returns (status, color, ear, ratio)"""
+        # Gaze/Head Logic (Distraction)
+        # We check the ratio of the nose to the cheeks (NaN if the cheek distance is 0)
+        # Note: MediaPipe mirrors coordinates usually
+        if ratio != ratio: # NaN
+            ratio = None
+
+        # Check for Head Turn (Distraction)
+        # If nose is too close to one cheek, user is looking away
+        is_looking_away = False
+        if ratio is not None:
+            # --- ADD THIS DEBUG LINE TEMPORARILY ---
+            #print(f"Head Ratio: {ratio:.2f}") 
+            # ---------------------------------------
+            if ratio > features.RATIO_MAX or ratio < features.RATIO_MIN: # Tuned thresholds
+                is_looking_away = True
+
+        # --- FINAL STATUS DECISION ---
+        if now is None:
+            now = time.time()
+        status, color = self.state.update(avg_ear, is_looking_away, now)
+        self.events.observe(self.state, avg_ear, now)
+        self._push_status(status, avg_ear, ratio)
+        return status, color, avg_ear, ratio
+
+    def no_face(self, now=None):
+        """Analyzed frame without a face"""
+        if now is None:
+            now = time.time()
+        self._no_face(now)
+        if self.telemetry is not None:
+            self.telemetry.record(now, np.nan, np.nan, np.nan, self.state.status_code)
+
+    def _no_face(self, now):
+        self.state.no_face()
+        self.events.observe(self.state, now=now)
+        self._push_status("No Face")
+
+    def _push_status(self, status, avg_ear=None, ratio=None):
+        """Publishes a status update, but only when the state (or the Away countdown) changes"""
+        key = (self.current_status, status)
+        if key == self._last_pushed:
+            return
+        self._last_pushed = key
+        self.status_broadcaster.publish({
+            'status': self.current_status,
+            'label': status,
+            'code': self.state.status_code,
+            'ear': round(avg_ear, 3) if avg_ear is not None else None,
+            'ratio': round(ratio, 2) if ratio is not None else None,
+            'time': time.time(),
+        })
+
+
+class SessionManager(object):
+    """
+    Per-token UserSessions for one server process. Sessions idle for longer than
+    `idle_timeout` seconds (or the least recently used ones beyond `max_sessions`)
+    are evicted; `on_evict(session)` gets a chance to save their pending events first.
+    """
+
+    def __init__(self, max_sessions=None, idle_timeout=None, on_evict=None):
+        if max_sessions is None:
+            max_sessions = int(os.environ.get("NEUROMO_MAX_SESSIONS", "200"))
+        if idle_timeout is None:
+            idle_timeout = float(os.environ.get("NEUROMO_SESSION_IDLE", "300"))
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self.on_evict = on_evict
+        self._sessions = OrderedDict() # token -> session, least recently used first
+        self._lock = threading.Lock()
+        self._last_sweep = time.monotonic()
+        metrics.ACTIVE_SESSIONS.set_function(self.__len__)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._sessions)
+
+    def __contains__(self, token):
+        with self._lock:
+            return token in self._sessions
+
+    def get(self, token, create=True):
+        """The token's session (created on first use), or None if it has none and create=False"""
+        evicted = []
+        with self._lock:
+            session = self._sessions.get(token)
+            if session is not None:
+                self._sessions.move_to_end(token)
+            elif create:
+                session = self._sessions[token] = UserSession(token, verbose=False)
+                while len(self._sessions) > self.max_sessions:
+                    evicted.append(self._sessions.popitem(last=False)[1])
+            if session is not None:
+                session.touch()
+            now = time.monotonic()
+            if now - self._last_sweep > min(self.idle_timeout, 30):
+                self._last_sweep = now
+                evicted.extend(self._pop_idle(now))
+        self._evict(evicted)
+        return session
+
+    def evict_idle(self):
+        with self._lock:
+            evicted = self._pop_idle(time.monotonic())
+        self._evict(evicted)
+        return len(evicted)
+
+    def _pop_idle(self, now):
+        idle = [token for token, s in self._sessions.items() if now - s.last_seen > self.idle_timeout]
+        return [self._sessions.pop(token) for token in idle]
+
+    def _evict(self, sessions):
+        for session in sessions:
+            metrics.SESSIONS_EVICTED.inc()
+            if self.on_evict is not None:
+                try:
+                    self.on_evict(session)
+                except Exception as e:
+                    print(f"⚠️ Could not save session {session.token[:8]} on eviction: {e}")
+            session.close()
@@ -0,0 +1,226 @@
+import abc
+import glob
+import os
+import time
+
+import cv2
+import numpy as np
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+
+class FrameSource(abc.ABC):
+    """
+    Anything VideoCamera can read BGR frames from. Same interface as
+    cv2.VideoCapture: read() -> (success, frame) and release().
+    """
+    fps = None
+
+    @abc.abstractmethod
+    def read(self):
+        """Next frame: (success, BGR frame or None)"""
+
+    def read_into(self, out):
+        """Reads the next frame into the preallocated array `out` (same shape). Returns success"""
+        success, frame = self.read()
+        if success and frame is not out:
+            if frame.shape != out.shape:
+                raise ValueError(f"Frame size changed to {frame.shape}, expected {out.shape}")
+            np.copyto(out, frame)
+        return success
+
+    def release(self):
+        pass
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}()"
+
+
+class _Pacer(object):
+    """Sleeps so frames come out at a fixed rate (like a real camera would)"""
+
+    def __init__(self, fps):
+        self.interval = 1.0 / fps if fps else 0
+        self._next = None
+
+    def wait(self):
+        if not self.interval:
+            return
+        now = time.monotonic()
+        if self._next is None or now - self._next > self.interval:
+            self._next = now # First frame, or we fell behind: don't try to catch up
+        elif self._next > now:
+            time.sleep(self._next - now)
+        self._next += self.interval
+
+
+class WebcamSource(FrameSource):
+    def __init__(self, index=0):
+        self.index = index
+        self.capture = cv2.VideoCapture(index)
+        self.fps = self.capture.get(cv2.CAP_PROP_FPS) or None
+
+    def read(self):
+        return self.capture.read()
+
+    def read_into(self, out):
+        # OpenCV decodes straight into `out` when the size matches
+        success, frame = self.capture.read(out)
+        if success and frame is not out:
+            np.copyto(out, frame)
+        return success
+
+    def release(self):
+        self.capture.release()
+
+    def __repr__(self):
+        return f"WebcamSource({self.index})"
+
+
+class VideoFileSource(FrameSource):
+    """Replays a recorded video at its native fps (or a fixed fps), looping at the end"""
+
+    def __init__(self, path, fps=None, loop=True):
+        self.path = path
+        self.loop = loop
+        self.capture = cv2.VideoCapture(path)
+        if not self.capture.isOpened():
+            raise IOError(f"Cannot open video '{path}'")
+        self.fps = fps or self.capture.get(cv2.CAP_PROP_FPS) or 30.0
+        self._pacer = _Pacer(self.fps)
+
+    def read(self, out=None):
+        self._pacer.wait()
+        success, frame = self.capture.read(out)
+        if not success and self.loop:
+            self.capture.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            success, frame = self.capture.read(out)
+        return success, frame
+
+    def read_into(self, out):
+        success, frame = self.read(out)
+        if success and frame is not out:
+            np.copyto(out, frame)
+        return success
+
+    def release(self):
+        self.capture.release()
+
+    def __repr__(self):
+        return f"VideoFileSource({self.path!r}, fps={self.fps})"
+
+
+class ImageSequenceSource(FrameSource):
+    """Plays a folder (or glob pattern) of images in name order, looping at the end"""
+
+    def __init__(self, pattern, fps=30.0, loop=True, preload=True):
+        if os.path.isdir(pattern):
+            paths = [os.path.join(pattern, f) for f in os.listdir(pattern)
+                     if f.lower().endswith(IMAGE_EXTENSIONS)]
+        else:
+            paths = glob.glob(pattern)
+        self.paths = sorted(paths)
+        if not self.paths:
+            raise IOError(f"No images found for '{pattern}'")
+        self.pattern = pattern
+        self.fps = fps
+        self.loop = loop
+        # Decoding once up front keeps disk/JPEG decode out of benchmarks
+        self._frames = [cv2.imread(p) for p in self.paths] if preload else None
+        self._index = 0
+        self._pacer = _Pacer(fps)
+
+    def read(self):
+        frame = self._next()
+        if frame is not None and self._frames is not None:
+            frame = frame.copy() # Callers draw on the frame in place
+        return frame is not None, frame
+
+    def read_into(self, out):
+        frame = self._next()
+        if frame is None:
+            return False
+        np.copyto(out, frame) # The only copy: preloaded image -> caller's buffer
+        return True
+
+    def _next(self):
+        if self._index >= len(self.paths):
+            if not self.loop:
+                return None
+            self._index = 0
+        self._pacer.wait()
+        if self._frames is not None:
+            frame = self._frames[self._index]
+        else:
+            frame = cv2.imread(self.paths[self._index])
+        self._index += 1
+        return frame
+
+    def __repr__(self):
+        return f"ImageSequenceSource({self.pattern!r}, {len(self.paths)} images, fps={self.fps})"
+
+
+class SyntheticSource(FrameSource):
+    """Generated frames (moving gradient + frame counter) for headless load tests"""
+
+    def __init__(self, width=640, height=480, fps=30.0):
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self._count = 0
+        self._pacer = _Pacer(fps)
+        # Precomputed gradient, shifted every frame so the JPEG encoder sees motion
+        x = np.linspace(0, 255, width, dtype=np.float32)
+        y = np.linspace(0, 255, height, dtype=np.float32)
+        self._base = np.dstack([
+            np.tile(x, (height, 1)),
+            np.tile(y[:, None], (1, width)),
+            np.full((height, width), 128, dtype=np.float32),
+        ]).astype(np.uint8)
+
+    def read(self):
+        frame = np.empty_like(self._base)
+        self.read_into(frame)
+        return True, frame
+
+    def read_into(self, out):
+        self._pacer.wait()
+        # Same as np.roll(base, shift, axis=1), written straight into `out`
+        shift = self._count * 4 % self.width
+        out[:, shift:] = self._base[:, :self.width - shift]
+        out[:, :shift] = self._base[:, self.width - shift:]
+        cv2.putText(out, f"#{self._count}", (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (255, 255, 255), 2)
+        self._count += 1
+        return True
+
+    def __repr__(self):
+        return f"SyntheticSource({self.width}x{self.height}, fps={self.fps})"
+
+
+def open_source(spec=None, fps=None):
+    """
+    Builds a frame source from a spec string (default: $NEUROMO_SOURCE or "webcam"):
+      webcam[:index]            - cv2.VideoCapture(index)
+      file:<path>               - video replay at native fps (or $NEUROMO_SOURCE_FPS)
+      images:<dir or glob>      - image sequence
+      synthetic[:<W>x<H>]       - generated frames
+    """
+    if spec is None:
+        spec = os.environ.get("NEUROMO_SOURCE", "webcam")
+    if fps is None and os.environ.get("NEUROMO_SOURCE_FPS"):
+        fps = float(os.environ["NEUROMO_SOURCE_FPS"])
+    kind, _, arg = spec.partition(':')
+    kind = kind.lower()
+
+    if kind == "webcam":
+        return WebcamSource(int(arg) if arg else 0)
+    if kind == "file":
+        return VideoFileSource(arg, fps=fps)
+    if kind == "images":
+        return ImageSequenceSource(arg, fps=fps or 30.0)
+    if kind == "synthetic":
+        width, height = 640, 480
+        if arg:
+            width, height = (int(v) for v in arg.lower().split('x'))
+        return SyntheticSource(width, height, fps=fps or 30.0)
+    raise ValueError(f"Unknown frame source '{spec}'")
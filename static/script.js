@@ -47,13 +47,14 @@ window.onload = function () {
 
 // 2. Change Background Dynamically
 function changeBackground(filename) {
-    document.body.style.backgroundImage = `url('/static/background/${filename}')`;
+    const url = ASSET_URLS.background[filename] || `/static/background/${filename}`;
+    document.body.style.backgroundImage = `url('${url}')`;
 }
 
 // 3. Change Alarm Dynamically
 function changeAlarm(filename) {
     const audio = document.getElementById('alarm-audio');
-    audio.src = `/static/alarm/${filename}`;
+    audio.src = ASSET_URLS.alarm[filename] || `/static/alarm/${filename}`;
 }
 
 // 4. Timer Logic
@@ -266,29 +267,51 @@ function toggleMusic() {
     }
 }
 
-// Check AI status every 1 second
+// React to an AI status update
+function applyStatus(data) {
+    const aiFeed = document.getElementById('ai-feed');
+
+    if (data.status === "alarm") {
+        // Play Alarm
+        document.getElementById('alarm-audio').play();
+
+        // Visual Warning (Red Border)
+        aiFeed.classList.remove('border-green-500');
+        aiFeed.classList.add('border-red-600', 'animate-pulse');
+    } else {
+        // Back to Normal
+        document.getElementById('alarm-audio').pause();
+        aiFeed.classList.remove('border-red-600', 'animate-pulse');
+        aiFeed.classList.add('border-green-500');
+    }
+}
+
+// AI status is pushed by the server on every change (Server-Sent Events).
+// EventSource reconnects by itself; browsers without it fall back to polling below.
+let statusStream = null;
+let latestStatus = null;
+if (window.EventSource) {
+    // EventSource can't send the X-User-Token header: the token goes in the URL
+    const token = localStorage.getItem('user_token') || '';
+    statusStream = new EventSource('/status/stream?token=' + encodeURIComponent(token));
+    statusStream.onmessage = (event) => {
+        latestStatus = JSON.parse(event.data);
+        // Only react if timer is running! (alarm latency: one analyzed frame)
+        if (isRunning) applyStatus(latestStatus);
+    };
+}
+
+// Every 1 second: stats sync check (and status polling without SSE)
 setInterval(() => {
     // Only check if timer is running!
     if (isRunning) {
-        fetch('/status')
-            .then(response => response.json())
-            .then(data => {
-                const aiFeed = document.getElementById('ai-feed');
-
-                if (data.status === "alarm") {
-                    // Play Alarm
-                    document.getElementById('alarm-audio').play();
-
-                    // Visual Warning (Red Border)
-                    aiFeed.classList.remove('border-green-500');
-                    aiFeed.classList.add('border-red-600', 'animate-pulse');
-                } else {
-                    // Back to Normal
-                    document.getElementById('alarm-audio').pause();
-                    aiFeed.classList.remove('border-red-600', 'animate-pulse');
-                    aiFeed.classList.add('border-green-500');
-                }
-            });
+        if (!statusStream) {
+            fetch('/status', { headers: { 'X-User-Token': localStorage.getItem('user_token') || '' } })
+                .then(response => response.json())
+                .then(applyStatus);
+        } else if (latestStatus) {
+            applyStatus(latestStatus); // Timer may have started mid-alarm: no request needed
+        }
 
         // Sync stats every 30 seconds (approx)
         const now = Date.now();
@@ -299,7 +322,62 @@ setInterval(() => {
     }
 }, 1000);
 
-// --- HELPER: Turn Camera On/Off ---
+// --- Client-side overlay (server runs with NEUROMO_OVERLAY=client) ---
+// The server then sends eye points/status/EAR per analyzed frame instead of drawing them
+// into the video. In the default mode /overlay/stream answers 204 and EventSource gives up.
+let overlayStream = null;
+
+function drawOverlay(canvas, img, data) {
+    const w = canvas.width = canvas.clientWidth;
+    const h = canvas.height = canvas.clientHeight;
+    const ctx = canvas.getContext('2d');
+    ctx.clearRect(0, 0, w, h);
+    if (!data || !data.points.length || !img.naturalWidth) return;
+
+    // Same mapping as the <img>'s object-cover (scaled to fill, centered, cropped)
+    const scale = Math.max(w / img.naturalWidth, h / img.naturalHeight);
+    const dx = (w - img.naturalWidth * scale) / 2;
+    const dy = (h - img.naturalHeight * scale) / 2;
+    ctx.fillStyle = 'rgb(255, 255, 0)';
+    for (const [x, y] of data.points) {
+        ctx.beginPath();
+        ctx.arc(dx + x * img.naturalWidth * scale, dy + y * img.naturalHeight * scale, 1.5, 0, 2 * Math.PI);
+        ctx.fill();
+    }
+
+    ctx.font = 'bold 10px sans-serif';
+    ctx.textAlign = 'center';
+    ctx.lineWidth = 3;
+    ctx.strokeStyle = 'black';
+    const labels = [[`EAR: ${data.ear.toFixed(2)}`, 'white', 22], [data.status, data.color, h - 16]];
+    for (const [text, color, y] of labels) {
+        ctx.strokeText(text, w / 2, y);
+        ctx.fillStyle = color;
+        ctx.fillText(text, w / 2, y);
+    }
+}
+
+function toggleOverlay(turnOn) {
+    if (overlayStream) {
+        overlayStream.close();
+        overlayStream = null;
+    }
+    let canvas = document.getElementById('camera-overlay');
+    if (!turnOn || !window.EventSource) {
+        if (canvas) drawOverlay(canvas, null, null);
+        return;
+    }
+    if (!canvas) {
+        canvas = document.createElement('canvas');
+        canvas.id = 'camera-overlay';
+        canvas.className = 'absolute inset-0 w-full h-full pointer-events-none';
+        document.getElementById('ai-feed').appendChild(canvas);
+    }
+    const img = document.getElementById('camera-stream');
+    overlayStream = new EventSource('/overlay/stream');
+    overlayStream.onmessage = (event) => drawOverlay(canvas, img, JSON.parse(event.data));
+}
+
 // --- HELPER: Turn Camera On/Off ---
 function toggleCamera(turnOn) {
     const streamImg = document.getElementById('camera-stream');
@@ -314,12 +392,15 @@ function toggleCamera(turnOn) {
 
     if (turnOn) {
         // 1. Reconnect the stream (Turns Camera Light ON)
-        streamImg.src = "/video_feed";
+        // The preview is a small circle: a 320px, 15 fps stream is plenty (and much cheaper)
+        streamImg.src = "/video_feed?width=320&fps=15&quality=70";
         aiFeed.classList.remove('hidden');
+        toggleOverlay(true);
     } else {
         // 2. Disconnect the stream (Turns Camera Light OFF)
         streamImg.src = "";
         aiFeed.classList.add('hidden');
+        toggleOverlay(false);
     }
 }
 
@@ -810,14 +891,20 @@ async function addTask() {
     }
 }
 
+// Any number of task changes in one request ([{ id, is_completed?, priority?, add_seconds? }, ...])
+async function sendTaskUpdates(token, updates) {
+    const res = await fetch('/api/tasks', {
+        method: 'PUT',
+        headers: { 'Content-Type': 'application/json', 'X-User-Token': token },
+        body: JSON.stringify(updates)
+    });
+    return res.json();
+}
+
 async function toggleTaskComplete(id, currentStatus) {
     const token = localStorage.getItem('user_token');
     try {
-        await fetch(`/api/tasks/${id}`, {
-            method: 'PUT',
-            headers: { 'Content-Type': 'application/json', 'X-User-Token': token },
-            body: JSON.stringify({ is_completed: !currentStatus })
-        });
+        await sendTaskUpdates(token, [{ id: id, is_completed: !currentStatus }]);
         fetchTasks(); // Refresh to re-sort/move
     } catch (e) {
         console.error("Update failed:", e);
@@ -842,11 +929,7 @@ async function deleteTask(id) {
 async function updateTaskTime(id, seconds) {
     const token = localStorage.getItem('user_token');
     try {
-        await fetch(`/api/tasks/${id}`, {
-            method: 'PUT',
-            headers: { 'Content-Type': 'application/json', 'X-User-Token': token },
-            body: JSON.stringify({ add_seconds: seconds })
-        });
+        await sendTaskUpdates(token, [{ id: id, add_seconds: seconds }]);
         console.log(`⏱️ Added ${seconds}s to Task ${id}`);
         // We do NOT call fetchTasks() here to avoid re-rendering entire UI during focus session end
         // But maybe we should to update the sidebar time? Yes.
@@ -0,0 +1,158 @@
+import os
+import threading
+from collections import deque
+
+
+class Subscriber(object):
+    """One viewer of a FrameBroadcaster, with its own small drop-oldest buffer"""
+
+    def __init__(self, broadcaster, buffer_size):
+        self._broadcaster = broadcaster
+        self._buffer = deque(maxlen=buffer_size)
+        self._cond = threading.Condition()
+        self.dropped = 0
+        self.closed = False
+
+    def push(self, item):
+        with self._cond:
+            if len(self._buffer) == self._buffer.maxlen:
+                self.dropped += 1 # deque drops the oldest entry for us
+            self._buffer.append(item)
+            self._cond.notify()
+
+    def get(self, timeout=None):
+        """Returns the next buffered item, or None on timeout/close"""
+        with self._cond:
+            if not self._buffer and not self.closed:
+                self._cond.wait(timeout)
+            if not self._buffer:
+                return None
+            return self._buffer.popleft()
+
+    def close(self):
+        self._broadcaster.unsubscribe(self)
+        with self._cond:
+            self.closed = True
+            self._cond.notify_all()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class FrameBroadcaster(object):
+    """Hands the same encoded frame (or status update) to any number of subscribers (fan-out)"""
+
+    def __init__(self, buffer_size=2):
+        self.buffer_size = buffer_size
+        self._subscribers = set()
+        self._cond = threading.Condition()
+        self.latest = None
+        self.seq = 0
+
+    def subscribe(self, buffer_size=None):
+        sub = Subscriber(self, buffer_size or self.buffer_size)
+        with self._cond:
+            self._subscribers.add(sub)
+        return sub
+
+    def unsubscribe(self, sub):
+        with self._cond:
+            self._subscribers.discard(sub)
+
+    @property
+    def subscriber_count(self):
+        with self._cond:
+            return len(self._subscribers)
+
+    def publish(self, item):
+        with self._cond:
+            self.latest = item
+            self.seq += 1
+            subscribers = list(self._subscribers)
+            self._cond.notify_all()
+        for sub in subscribers:
+            sub.push(item)
+
+    def wait_newer(self, last_seq, timeout=None):
+        """Blocks until an item newer than last_seq exists. Returns (seq, item)"""
+        with self._cond:
+            if self.seq == last_seq:
+                self._cond.wait(timeout)
+            return self.seq, self.latest
+
+
+class StreamProfiles(object):
+    """
+    Reduced stream profiles (width, JPEG quality) next to the full-size `main`
+    broadcaster. Requested values are snapped to a few steps, so viewers share
+    profiles and the producer encodes each frame once per profile being watched.
+    At most `max_profiles` are created; later requests get the closest existing one.
+    """
+    WIDTHS = (160, 240, 320, 480, 640, 960, 1280)
+    QUALITY_STEP = 5
+    MIN_QUALITY, MAX_QUALITY = 20, 95
+
+    def __init__(self, main, quality=95, on_create=None, max_profiles=None):
+        if max_profiles is None:
+            max_profiles = int(os.environ.get("NEUROMO_MAX_STREAM_PROFILES", "8"))
+        self.main = main
+        self.quality = quality
+        self.max_profiles = max_profiles
+        self.on_create = on_create # (key, broadcaster) for each new profile
+        self.main_key = (None, self.snap_quality(quality))
+        self.frame_width = None # Set by the producer once known: wider requests get the main stream
+        self._profiles = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def snap_width(cls, width):
+        """Smallest step at least `width` wide; None (full size) for None or anything wider"""
+        if width is None:
+            return None
+        return next((w for w in cls.WIDTHS if w >= width), None)
+
+    @classmethod
+    def snap_quality(cls, quality):
+        step = cls.QUALITY_STEP
+        return min(cls.MAX_QUALITY, max(cls.MIN_QUALITY, int(round(quality / float(step))) * step))
+
+    def key(self, width=None, quality=None):
+        """(width or None for full size, quality) after snapping"""
+        if quality is None or quality != quality: # Missing or NaN: the main stream's quality
+            quality = self.quality
+        width = self.snap_width(width)
+        if width is not None and self.frame_width and width >= self.frame_width:
+            width = None # Would not be downscaled anyway
+        return width, self.snap_quality(quality)
+
+    def _closest(self, key):
+        """Existing profile (or the main stream) nearest to `key`: same width first, then quality"""
+        width, quality = key
+        order = {w: i for i, w in enumerate(self.WIDTHS + (None,))}
+        candidates = [(self.main_key, self.main)] + list(self._profiles.items())
+        return min(candidates, key=lambda c: (abs(order[c[0][0]] - order[width]), abs(c[0][1] - quality)))[1]
+
+    def get(self, width=None, quality=None):
+        """Broadcaster for the profile closest to the request"""
+        key = self.key(width, quality)
+        if key == self.main_key:
+            return self.main
+        with self._lock:
+            broadcaster = self._profiles.get(key)
+            if broadcaster is None and len(self._profiles) >= self.max_profiles:
+                return self._closest(key)
+            created = broadcaster is None
+            if created:
+                broadcaster = self._profiles[key] = FrameBroadcaster(buffer_size=1)
+        if created and self.on_create is not None:
+            self.on_create(key, broadcaster)
+        return broadcaster
+
+    def active(self):
+        """[(key, broadcaster)] of the reduced profiles someone is watching"""
+        with self._lock:
+            profiles = list(self._profiles.items())
+        return [(key, b) for key, b in profiles if b.subscriber_count]
@@ -0,0 +1,182 @@
+import atexit
+import os
+import threading
+
+import metrics
+
+# Fields a task update may set, with how the request value is stored
+FIELDS = {
+    'is_completed': lambda v: 1 if v else 0,
+    'priority': int,
+}
+
+
+def parse_changes(data):
+    """Request body -> (fields, add_seconds). Raises ValueError on bad values"""
+    if not isinstance(data, dict):
+        raise ValueError("Expected an object")
+    fields = {name: convert(data[name]) for name, convert in FIELDS.items() if name in data}
+    add_seconds = int(round(float(data.get('add_seconds') or 0)))
+    if add_seconds < 0:
+        raise ValueError("add_seconds can't be negative")
+    return fields, add_seconds
+
+
+class PendingUpdate(object):
+    """Everything queued for one task since the last flush"""
+    __slots__ = ('fields', 'add_seconds')
+
+    def __init__(self):
+        self.fields = {}
+        self.add_seconds = 0
+
+    def merge(self, fields, add_seconds):
+        self.fields.update(fields) # Last write wins
+        self.add_seconds += add_seconds
+
+    def apply(self, task):
+        """Applies the queued changes to a task as get_tasks returns it"""
+        for name, value in self.fields.items():
+            task[name] = bool(value) if name == 'is_completed' else value
+        task['total_seconds'] += self.add_seconds
+
+
+class TaskWriteBehind(object):
+    """
+    Write-behind buffer for task updates. Per task, add_seconds deltas are summed
+    and field updates merged in memory; flush() writes everything queued in one
+    transaction, a single UPDATE ... WHERE id=? AND user_token=? per task. A
+    background thread flushes every `interval` seconds or as soon as `batch_size`
+    tasks are waiting, and stop() (registered with atexit) flushes on shutdown.
+    read() applies the queued changes to rows loaded from the database, so a user
+    sees their own updates right away. The queue only exists in this process, so
+    under several gunicorn workers (NEUROMO_WEB_WORKERS > 1) it writes through.
+    """
+
+    def __init__(self, db, interval=None, batch_size=None):
+        if interval is None:
+            interval = float(os.environ.get("NEUROMO_TASK_FLUSH", "2"))
+            if int(os.environ.get("NEUROMO_WEB_WORKERS", "1")) > 1:
+                interval = 0 # A read served by another worker would miss updates queued here
+        if batch_size is None:
+            batch_size = int(os.environ.get("NEUROMO_TASK_BATCH", "100"))
+        self.db = db
+        self.interval = interval # 0: write-through, every update is flushed before returning
+        self.batch_size = batch_size
+        self._pending = {} # (user_token, task_id) -> PendingUpdate
+        self._inflight = {} # Being written by flush(): still applied by read() until committed
+        self._generation = 0 # Bumped on every commit
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopped = False
+        self._thread = None
+        metrics.PENDING_TASK_UPDATES.set_function(self.__len__)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._pending)
+
+    def start(self):
+        if self._thread is None and self.interval > 0:
+            self._thread = threading.Thread(target=self._run, name="neuromo-task-writer", daemon=True)
+            self._thread.start()
+            atexit.register(self.stop)
+
+    def stop(self):
+        """Writes whatever is still queued (shutdown)"""
+        self._stopped = True
+        self._wake.set()
+        self.flush()
+
+    def _run(self):
+        while not self._stopped:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"⚠️ Task update flush failed (will retry): {e}")
+
+    def update(self, user_token, task_id, fields, add_seconds=0):
+        """Queues changes for a task the caller has checked belongs to `user_token`"""
+        self.update_many(user_token, [(task_id, fields, add_seconds)])
+
+    def update_many(self, user_token, updates):
+        """Queues [(task_id, fields, add_seconds)]; written together (one flush when writing through)"""
+        with self._lock:
+            for task_id, fields, add_seconds in updates:
+                if not fields and not add_seconds:
+                    continue
+                metrics.TASK_UPDATES.inc(label="queued")
+                pending = self._pending.get((user_token, task_id))
+                if pending is None:
+                    pending = self._pending[(user_token, task_id)] = PendingUpdate()
+                pending.merge(fields, add_seconds)
+            full = len(self._pending) >= self.batch_size
+        if self.interval <= 0 or self._thread is None or self._stopped:
+            self.flush()
+        elif full:
+            self._wake.set()
+
+    def discard(self, user_token, task_id):
+        """Drops queued changes of a deleted task"""
+        with self._lock:
+            self._pending.pop((user_token, task_id), None)
+
+    def read(self, user_token, load):
+        """
+        Runs load() -> task dicts (a database read) and applies this user's queued
+        changes to them. Retried if a flush committed meanwhile: rows loaded before
+        the commit need _inflight applied, rows loaded after it already include it.
+        """
+        while True:
+            with self._lock:
+                generation = self._generation
+            tasks = load()
+            with self._lock:
+                if self._generation != generation:
+                    continue
+                for task in tasks:
+                    for queue in (self._inflight, self._pending):
+                        pending = queue.get((user_token, task['id']))
+                        if pending is not None:
+                            pending.apply(task)
+            return tasks
+
+    def flush(self):
+        """Writes all queued updates in one transaction. Returns the number of tasks written"""
+        with self._flush_lock:
+            with self._lock:
+                if not self._pending:
+                    return 0
+                self._inflight, self._pending = self._pending, {}
+            try:
+                with self.db.connection() as c:
+                    c.execute("BEGIN IMMEDIATE")
+                    for (user_token, task_id), pending in self._inflight.items():
+                        sets = [f"{name}=?" for name in pending.fields]
+                        params = list(pending.fields.values())
+                        if pending.add_seconds:
+                            sets.append("total_seconds = total_seconds + ?")
+                            params.append(pending.add_seconds)
+                        c.execute(f"UPDATE tasks SET {', '.join(sets)} WHERE id=? AND user_token=?",
+                                  params + [task_id, user_token])
+                    # Commit, clear _inflight and bump the generation in one step: a read() can
+                    # never load committed rows and still apply _inflight on top of them
+                    with self._lock:
+                        c.commit()
+                        written, self._inflight = self._inflight, {}
+                        self._generation += 1
+            except Exception:
+                with self._lock:
+                    # Keep them for the next flush, under anything queued since
+                    for key, pending in self._inflight.items():
+                        newer = self._pending.get(key)
+                        if newer is not None:
+                            pending.merge(newer.fields, newer.add_seconds)
+                        self._pending[key] = pending
+                    self._inflight = {}
+                raise
+        metrics.TASK_UPDATES.inc(len(written), label="written")
+        return len(written)
@@ -0,0 +1,283 @@
+"""
+Optional per-frame attention telemetry: EAR, head-turn ratio and status of each
+analyzed frame, appended as fixed-width binary records to memory-mapped segment
+files (one directory per session). Off unless NEUROMO_TELEMETRY names a directory.
+
+  NEUROMO_TELEMETRY=telemetry python app.py
+  python telemetry.py telemetry/<token>/<session>     # per-minute summary of a recording
+
+Reading needs no parsing: each segment is a numpy record array over the file.
+"""
+import datetime
+import json
+import mmap
+import os
+import re
+import struct
+import sys
+import threading
+
+import numpy as np
+
+from attention import STATUS_CODES
+
+MAGIC = b'NMTL'
+VERSION = 1
+# Time is float32 seconds since the segment's start (sub-ms precision for hours);
+# EAR / ratio are float16: ~0.0002 resolution around the 0.26 EAR threshold.
+RECORD = np.dtype([('t', '<f4'), ('left_ear', '<f2'), ('right_ear', '<f2'), ('ratio', '<f2'), ('status', 'u1')])
+HEADER = np.dtype([('magic', 'S4'), ('version', '<u2'), ('record_size', '<u2'), ('capacity', '<u4'),
+                   ('count', '<u4'), ('start', '<f8'), ('pad', 'V8')])
+SEGMENT_RECORDS = 1 << 15 # 352 KB per segment
+# The same layouts for struct, used on the per-frame write path
+_RECORD = struct.Struct('<feeeB')
+_COUNT = _CAPACITY = struct.Struct('<I')
+COUNT_OFFSET, CAPACITY_OFFSET = HEADER.fields['count'][1], HEADER.fields['capacity'][1]
+STATUS_NAMES = {code: name for name, code in STATUS_CODES.items()}
+
+
+def _safe_name(token):
+    return re.sub(r'[^A-Za-z0-9_-]', '_', token)[:64] or "_"
+
+
+class Segment(object):
+    """One preallocated, memory-mapped segment file: header + `capacity` records"""
+
+    def __init__(self, path, start=None, capacity=SEGMENT_RECORDS):
+        self.path = path
+        self.writable = start is not None
+        with open(path, 'w+b' if self.writable else 'rb') as f:
+            if self.writable:
+                f.truncate(HEADER.itemsize + capacity * RECORD.itemsize)
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_WRITE if self.writable else mmap.ACCESS_READ)
+        header = np.ndarray((1,), dtype=HEADER, buffer=self._mm)
+        if self.writable:
+            header[0] = (MAGIC, VERSION, RECORD.itemsize, capacity, 0, start, b'\0' * 8)
+        elif header[0]['magic'] != MAGIC or header[0]['record_size'] != RECORD.itemsize:
+            raise ValueError(f"{path} is not a version {VERSION} telemetry segment")
+        self.start = float(header[0]['start'])
+        self.capacity = int(header[0]['capacity'])
+        self._count = int(header[0]['count'])
+        del header # No views may outlive close()
+        self._records = np.ndarray((self.capacity,), dtype=RECORD, buffer=self._mm, offset=HEADER.itemsize)
+
+    @property
+    def count(self):
+        if not self.writable:
+            self._count = _COUNT.unpack_from(self._mm, COUNT_OFFSET)[0] # Still being written elsewhere
+        return self._count
+
+    @property
+    def full(self):
+        return self._count >= self.capacity
+
+    @property
+    def records(self):
+        """Record array view of what has been written (no copy)"""
+        return self._records[:self.count]
+
+    def append_one(self, t, left_ear, right_ear, ratio, status):
+        """Packs one record straight into the mapping (cheaper than a structured numpy assignment)"""
+        _RECORD.pack_into(self._mm, HEADER.itemsize + self._count * RECORD.itemsize, t, left_ear, right_ear, ratio, status)
+        self._count += 1
+        _COUNT.pack_into(self._mm, COUNT_OFFSET, self._count) # Readers only look up to count
+
+    def append(self, rows):
+        """Writes as many of the structured `rows` as fit. Returns how many"""
+        n = min(len(rows), self.capacity - self._count)
+        self._records[self._count:self._count + n] = rows[:n]
+        self._count += n
+        _COUNT.pack_into(self._mm, COUNT_OFFSET, self._count)
+        return n
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        """Flushes a written segment and trims the unused preallocated records off the file"""
+        if self._mm.closed:
+            return
+        self._records = None
+        if self.writable:
+            _CAPACITY.pack_into(self._mm, CAPACITY_OFFSET, self._count)
+            self._mm.flush()
+        self._mm.close()
+        if self.writable:
+            os.truncate(self.path, HEADER.itemsize + self._count * RECORD.itemsize)
+            self.writable = False
+
+
+class TelemetryRecorder(object):
+    """
+    Appends one record per analyzed frame to <root>/<token>/<session id>/NNNNNN.ntl.
+    A segment holds SEGMENT_RECORDS frames; the next one is created when it is full.
+    At most `max_hz` records per second are kept (0 = all), plus every status change,
+    which keeps 30 fps capture at ~400 KB per hour.
+    """
+
+    def __init__(self, root, token, max_hz=None):
+        if max_hz is None:
+            max_hz = float(os.environ.get("NEUROMO_TELEMETRY_HZ", "10"))
+        self.min_interval = 1.0 / max_hz if max_hz > 0 else 0.0
+        stamp = datetime.datetime.now().strftime('%Y%m%d-%H%M%S')
+        self.path = os.path.join(root, _safe_name(token), f"{stamp}-{os.getpid()}-{id(self) & 0xffff:04x}")
+        self._segment = None
+        self._segments = 0
+        self._last_t = -np.inf
+        self._last_status = None
+        self._written = 0
+        self._mark = 0 # Records already covered by summary()
+        self._lock = threading.Lock()
+
+    def _open(self, t):
+        if self._segment is not None:
+            self._segment.close()
+        os.makedirs(self.path, exist_ok=True) # On the first frame: sessions without frames leave nothing
+        self._segment = Segment(os.path.join(self.path, f"{self._segments:06d}.ntl"), start=t)
+        self._segments += 1
+
+    def record(self, t, left_ear, right_ear, ratio, status):
+        """One frame (unix time, NaN EARs/ratio when there is no face, STATUS_CODES value)"""
+        if t - self._last_t < self.min_interval and status == self._last_status:
+            return
+        with self._lock:
+            if self._segment is None or self._segment.full:
+                self._open(t)
+            self._segment.append_one(t - self._segment.start, left_ear, right_ear, ratio, status)
+            self._written += 1
+            self._last_t, self._last_status = t, status
+
+    def record_batch(self, times, left_ears, right_ears, ratios, statuses):
+        """Many frames at once (arrays), e.g. an uploaded batch"""
+        times = np.asarray(times, dtype=np.float64)
+        statuses = np.asarray(statuses, dtype=np.uint8)
+        keep = np.ones(len(times), dtype=bool)
+        if self.min_interval and len(times):
+            # One frame per 1/max_hz time slot, but every status change is kept (like record())
+            slot = np.floor(times / self.min_interval)
+            prev_slot = np.concatenate(([np.floor(self._last_t / self.min_interval)], slot[:-1]))
+            prev_status = np.concatenate(([-1 if self._last_status is None else self._last_status], statuses[:-1]))
+            keep = (slot != prev_slot) | (statuses != prev_status)
+        rows = np.zeros(int(keep.sum()), dtype=RECORD)
+        if not len(rows):
+            return
+        rows['left_ear'], rows['right_ear'] = np.asarray(left_ears)[keep], np.asarray(right_ears)[keep]
+        rows['ratio'], rows['status'] = np.asarray(ratios)[keep], statuses[keep]
+        kept = times[keep]
+        with self._lock:
+            done = 0
+            while done < len(rows):
+                if self._segment is None or self._segment.full:
+                    self._open(kept[done])
+                chunk = rows[done:]
+                chunk['t'] = kept[done:] - self._segment.start
+                done += self._segment.append(chunk)
+            self._written += done
+            self._last_t, self._last_status = float(kept[-1]), int(rows['status'][-1])
+
+    def summary(self, bucket_seconds=60):
+        """Downsampled summary of what was recorded since the previous call (for the sessions row)"""
+        with self._lock:
+            mark, self._mark = self._mark, self._written
+            end = self._written
+        times, records = TelemetryLog(self.path).frames(start=mark, stop=end)
+        return summarize(times, records, bucket_seconds)
+
+    def close(self):
+        with self._lock:
+            if self._segment is not None:
+                self._segment.close()
+                self._segment = None
+
+
+class TelemetryLog(object):
+    """Read side of one recording directory"""
+
+    def __init__(self, path):
+        self.path = path
+
+    def segments(self):
+        """
+        Segment objects in order; segment.records is a view of the file, segment.start its time base.
+        Each holds a mapping and a file descriptor: close them (or use them in a with block)
+        """
+        if not os.path.isdir(self.path):
+            return []
+        names = sorted(n for n in os.listdir(self.path) if n.endswith('.ntl'))
+        return [Segment(os.path.join(self.path, name)) for name in names]
+
+    def frames(self, start=0, stop=None):
+        """(unix times float64, records) of records start..stop over all segments (one concatenated copy)"""
+        times, records, offset = [], [], 0
+        for segment in self.segments():
+            with segment: # Copies out of the mapping, then closes it
+                rec = segment.records
+                lo, hi = max(start - offset, 0), len(rec) if stop is None else min(stop - offset, len(rec))
+                offset += len(rec)
+                if lo < hi:
+                    times.append(segment.start + rec['t'][lo:hi].astype(np.float64))
+                    records.append(rec[lo:hi].copy())
+                del rec
+        if not records:
+            return np.empty(0), np.empty(0, dtype=RECORD)
+        return np.concatenate(times), np.concatenate(records)
+
+
+def summarize(times, records, bucket_seconds=60):
+    """
+    Per-bucket frames, mean / min EAR and mean ratio (face frames only) and frames
+    per status, as columnar lists like /api/analytics. None if nothing was recorded.
+    """
+    if not len(times):
+        return None
+    start = float(times.min())
+    index = ((times - start) // bucket_seconds).astype(np.int64)
+    n = int(index.max()) + 1
+    ear = (records['left_ear'].astype(np.float32) + records['right_ear'].astype(np.float32)) * 0.5
+    ratio = records['ratio'].astype(np.float32)
+    face = ~np.isnan(ear)
+    face_frames = np.bincount(index[face], minlength=n)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        ear_mean = np.bincount(index[face], weights=ear[face], minlength=n) / face_frames
+        ok = face & ~np.isnan(ratio)
+        ratio_mean = np.bincount(index[ok], weights=ratio[ok], minlength=n) / np.bincount(index[ok], minlength=n)
+    ear_min = np.full(n, np.inf)
+    np.minimum.at(ear_min, index[face], ear[face])
+
+    def column(values):
+        return [None if not np.isfinite(v) else round(float(v), 3) for v in values]
+
+    status = {}
+    for code in np.unique(records['status']).tolist():
+        mask = records['status'] == code
+        status[STATUS_NAMES.get(code, str(code))] = np.bincount(index[mask], minlength=n).tolist()
+    return {
+        'start': datetime.datetime.fromtimestamp(start, datetime.timezone.utc).strftime('%Y-%m-%d %H:%M:%S'),
+        'bucket_seconds': bucket_seconds,
+        'frames': np.bincount(index, minlength=n).tolist(),
+        'ear_mean': column(ear_mean),
+        'ear_min': column(ear_min),
+        'ratio_mean': column(ratio_mean),
+        'status': status,
+    }
+
+
+def recorder_for(token):
+    """A TelemetryRecorder for a new session, or None when telemetry is off"""
+    root = os.environ.get("NEUROMO_TELEMETRY")
+    if not root:
+        return None
+    try:
+        return TelemetryRecorder(root, token)
+    except OSError as e:
+        print(f"⚠️ Telemetry disabled: {e}")
+        return None
+
+
+if __name__ == '__main__':
+    times, records = TelemetryLog(sys.argv[1]).frames()
+    print(f"📈 {len(records)} frames, {os.path.basename(sys.argv[1])}")
+    print(json.dumps(summarize(times, records), indent=2))
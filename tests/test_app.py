@@ -0,0 +1,98 @@
+import importlib
+import io
+import json
+import sys
+
+import numpy as np
+import pytest
+
+
+@pytest.fixture(scope="module")
+def app_module(tmp_path_factory):
+    """app.py in multi-session mode, with its database in a temporary directory"""
+    monkeypatch = pytest.MonkeyPatch()
+    monkeypatch.chdir(tmp_path_factory.mktemp("app"))
+    monkeypatch.setenv("NEUROMO_SESSIONS", "multi")
+    sys.modules.pop("app", None)
+    module = importlib.import_module("app")
+    yield module
+    sys.modules.pop("app", None)
+    monkeypatch.undo()
+
+
+@pytest.fixture
+def client(app_module):
+    return app_module.app.test_client()
+
+
+def next_event(chunks):
+    for chunk in chunks:
+        chunk = chunk.decode() if isinstance(chunk, bytes) else chunk
+        if chunk.startswith("data: "):
+            return json.loads(chunk[len("data: "):])
+
+
+def test_status_stream_follows_the_token(app_module, client):
+    alice = client.get('/status/stream?token=alice', buffered=False)
+    bob = client.get('/status/stream?token=bob', buffered=False)
+    alice_events, bob_events = iter(alice.response), iter(bob.response)
+    assert next_event(alice_events)['status'] == "Active"
+    assert next_event(bob_events)['status'] == "Active"
+
+    session = app_module.sessions.get("alice", create=False)
+    assert session is not None and session is not app_module.global_camera.session
+    session.no_face()
+    assert next_event(alice_events)['label'] == "No Face"
+    # Bob's stream skips Alice's update and gets its own
+    app_module.sessions.get("bob", create=False)._step(0.3, 1.0)
+    assert next_event(bob_events)['label'] == "Focused"
+    alice.close()
+    bob.close()
+
+
+def test_oversized_landmark_uploads_are_refused_before_parsing(app_module, client, monkeypatch):
+    def fail(*args):
+        raise AssertionError("parsed an oversized body")
+    monkeypatch.setattr(app_module.features, 'unpack_frames', fail)
+    monkeypatch.setattr(app_module, '_json_frames', fail)
+    headers = {'X-User-Token': 'carol'}
+
+    body = b'\0' * (app_module.MAX_UPLOAD_BYTES + app_module.features.PACKED_FRAME_DTYPE.itemsize)
+    r = client.post('/api/landmarks', data=body, headers=headers, content_type='application/octet-stream')
+    assert r.status_code == 413
+
+    body = b'{"frames": [' + b' ' * app_module.MAX_JSON_UPLOAD_BYTES + b']}'
+    r = client.post('/api/landmarks', data=body, headers=headers, content_type='application/json')
+    assert r.status_code == 413
+
+    # Chunked, no Content-Length: the read stops at the limit
+    body = io.BytesIO(b'\0' * (app_module.MAX_UPLOAD_BYTES + 110))
+    r = client.post('/api/landmarks', input_stream=body, headers=dict(headers, **{'Transfer-Encoding': 'chunked'}),
+                    content_type='application/octet-stream', environ_overrides={'wsgi.input_terminated': True})
+    assert r.status_code == 413
+    assert body.tell() == app_module.MAX_UPLOAD_BYTES + 1
+
+
+def test_landmark_upload_within_limits(app_module, client):
+    n = len(app_module.features.FEATURE_INDICES)
+    body = app_module.features.pack_frames(1000.0 + np.arange(5) / 30, np.full((5, n, 3), 0.5, np.float32))
+    r = client.post('/api/landmarks', data=body, headers={'X-User-Token': 'dave'},
+                    content_type='application/octet-stream')
+    assert r.status_code == 200 and r.get_json()['frames'] == 5
+    r = client.post('/api/landmarks', json={'frames': [{'t': 1000.0, 'points': None}]}, headers={'X-User-Token': 'dave'})
+    assert r.status_code == 200 and r.get_json()['frames'] == 1
+
+
+@pytest.mark.parametrize("frame", [
+    {'t': 1000.0, 'points': [[0.5, 0.5, 0.0]]}, # One point broadcast over the face
+    {'t': 1000.0, 'points': [[0.5, 0.5, 0.0]] * 16},
+    {'t': 1000.0, 'points': [[0.5, 0.5]] * 17},
+    {'points': None}, # No time
+    {'t': "soon", 'points': None},
+    {'t': True, 'points': None},
+    {'t': float('inf'), 'points': None},
+])
+def test_malformed_json_frames_are_refused(client, frame):
+    r = client.post('/api/landmarks', data=json.dumps({'frames': [frame]}), headers={'X-User-Token': 'erin'},
+                    content_type='application/json')
+    assert r.status_code == 400
@@ -0,0 +1,26 @@
+import os
+
+import pytest
+
+import assets
+
+Image = pytest.importorskip("PIL.Image")
+
+
+def test_rejected_webp_variants_are_not_rebuilt(tmp_path, monkeypatch):
+    # A 1x1 GIF: its WebP can't be smaller
+    Image.new('P', (1, 1)).save(tmp_path / "tiny.gif")
+    assert assets.build_variants(str(tmp_path)) == 0
+    assert os.listdir(tmp_path / assets.VARIANT_DIR) == [f"tiny.{assets.file_digest(tmp_path / 'tiny.gif')}.webp.rejected"]
+
+    def fail(*args, **kwargs):
+        raise AssertionError("re-encoded a rejected GIF")
+    monkeypatch.setattr(Image, 'open', fail)
+    assert assets.build_variants(str(tmp_path)) == 0
+
+    # A changed GIF is tried again
+    monkeypatch.undo()
+    Image.new('P', (2, 1)).save(tmp_path / "tiny.gif")
+    assets.build_variants(str(tmp_path))
+    assert len(os.listdir(tmp_path / assets.VARIANT_DIR)) == 2
+    assert assets.AssetManifest(str(tmp_path)).get("tiny.gif").webp is None
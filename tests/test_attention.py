@@ -0,0 +1,139 @@
+import numpy as np
+import pytest
+
+from attention import (DISTRACTION_SECONDS, EAR_HYSTERESIS, EAR_THRESHOLD, SLEEP_SECONDS, STATUS_CODES,
+                       AttentionBatch, AttentionStateMachine)
+
+OPEN, CLOSED = 0.32, 0.15
+T0 = 1000.0
+
+
+def run(trace, fps, seconds):
+    """Feeds trace(t) -> (ear or None, looking_away) at `fps`. Returns (machine, {event: first time}, codes)"""
+    machine = AttentionStateMachine(verbose=False)
+    first, codes = {}, []
+    for i in range(int(seconds * fps)):
+        t = i / fps
+        ear, away = trace(t)
+        if ear is None:
+            machine.no_face()
+        else:
+            machine.update(ear, away, T0 + t)
+        if machine.new_event:
+            first.setdefault(machine.new_event, t)
+        codes.append(machine.status_code)
+    return machine, first, codes
+
+
+def session(t):
+    ear, away = OPEN, False
+    if 3 <= t < 5:
+        ear = CLOSED # Long closure: sleep
+    if 7 <= t < 7.25:
+        ear = CLOSED # Blink: no sleep
+    if 10 <= t < 16:
+        away = True # Distraction after DISTRACTION_SECONDS
+    return ear, away
+
+
+@pytest.mark.parametrize("fps", [5, 30])
+def test_same_alerts_at_5_and_30_fps(fps):
+    machine, first, _ = run(session, fps, 20)
+    assert machine.stats == {'sleep': 1, 'distracted': 1}
+    # Each alert fires after its time limit, not after a frame count
+    assert first['sleep'] == pytest.approx(3 + SLEEP_SECONDS, abs=0.25)
+    assert first['distracted'] == pytest.approx(10 + DISTRACTION_SECONDS, abs=0.25)
+
+
+@pytest.mark.parametrize("fps", [5, 30])
+def test_sleep_needs_the_eyes_closed_for_sleep_seconds(fps):
+    short = lambda t: (CLOSED if 1 <= t < 1 + SLEEP_SECONDS * 0.6 else OPEN, False)
+    long = lambda t: (CLOSED if 1 <= t < 1 + SLEEP_SECONDS * 2 else OPEN, False)
+    assert run(short, fps, 4)[0].stats['sleep'] == 0
+    assert run(long, fps, 4)[0].stats['sleep'] == 1
+
+
+def test_single_frame_dip_is_smoothed_away():
+    # One 30 fps frame with a low EAR moves the EMA only part of the way
+    machine, _, codes = run(lambda t: (CLOSED if 1 <= t < 1 + 1 / 30 else OPEN, False), 30, 2)
+    assert STATUS_CODES["Drowsy?"] not in codes
+    assert machine.ear_smoothed == pytest.approx(OPEN, abs=0.01)
+
+
+def test_hysteresis_keeps_closed_eyes_closed_near_the_threshold():
+    machine = AttentionStateMachine(verbose=False, ear_smoothing=0)
+    machine.update(EAR_THRESHOLD - 0.01, False, T0)
+    assert machine.eyes_closed
+    # Above the threshold but inside the hysteresis band: still closed
+    machine.update(EAR_THRESHOLD + EAR_HYSTERESIS / 2, False, T0 + 0.1)
+    assert machine.eyes_closed and machine.status_code == STATUS_CODES["Drowsy?"]
+    machine.update(EAR_THRESHOLD + EAR_HYSTERESIS * 1.5, False, T0 + 0.2)
+    assert not machine.eyes_closed and machine.status_code == STATUS_CODES["Focused"]
+
+
+def test_smoothing_restarts_after_a_gap():
+    machine = AttentionStateMachine(verbose=False)
+    machine.update(OPEN, False, T0)
+    machine.update(CLOSED, False, T0 + 5) # Long gap: the old EAR says nothing about now
+    assert machine.ear_smoothed == CLOSED
+
+
+def test_no_face_keeps_the_timers():
+    machine = AttentionStateMachine(verbose=False, ear_smoothing=0)
+    machine.update(CLOSED, False, T0)
+    machine.no_face()
+    assert machine.status_code == STATUS_CODES["No Face"]
+    machine.update(CLOSED, False, T0 + SLEEP_SECONDS + 0.1)
+    assert machine.status_code == STATUS_CODES["SLEEPING !!!"]
+    assert machine.current_status == "alarm"
+
+
+def random_traces(rng, frames, sessions):
+    """Runs of EAR values (some around the threshold), look-away spells, missing faces, uneven frame gaps"""
+    ears = rng.choice([OPEN, EAR_THRESHOLD + 0.01, EAR_THRESHOLD - 0.01, CLOSED], size=(frames, sessions),
+                      p=[.6, .1, .1, .2])
+    away = np.zeros((frames, sessions), dtype=bool)
+    for k in range(1, frames):
+        keep = rng.random(sessions) < 0.9
+        ears[k, keep] = ears[k - 1, keep]
+        away[k] = away[k - 1] ^ (rng.random(sessions) < 0.02)
+    ears[rng.random((frames, sessions)) < 0.03] = np.nan # No face
+    gaps = rng.choice([1 / 30, 1 / 5, 0.5, 2.0], size=(frames, sessions), p=[.5, .3, .15, .05])
+    return ears, away, T0 + np.cumsum(gaps, axis=0)
+
+
+def test_batch_matches_the_scalar_machine():
+    rng = np.random.default_rng(7)
+    ears, away, times = random_traces(rng, 2000, 32)
+    batch = AttentionBatch(ears.shape[1])
+    machines = [AttentionStateMachine(verbose=False) for _ in range(ears.shape[1])]
+    for k in range(len(ears)):
+        codes, new_sleep, new_distracted = batch.step(ears[k], away[k], times[k])
+        for j, machine in enumerate(machines):
+            if np.isnan(ears[k, j]):
+                machine.no_face()
+            else:
+                machine.update(float(ears[k, j]), bool(away[k, j]), float(times[k, j]))
+            assert codes[j] == machine.status_code
+            assert batch.alarm[j] == (machine.current_status == "alarm")
+            assert new_sleep[j] == (machine.new_event == 'sleep')
+            assert new_distracted[j] == (machine.new_event == 'distracted')
+    for key in ('sleep', 'distracted'):
+        assert batch.stats[key].tolist() == [m.stats[key] for m in machines]
+    assert batch.stats['sleep'].sum() > 0 and batch.stats['distracted'].sum() > 0
+
+
+@pytest.mark.parametrize("bad", [float('nan'), float('inf')])
+def test_non_finite_ear_counts_as_no_face(bad):
+    # Eyes closed with one unusable EAR in the middle: still asleep after SLEEP_SECONDS
+    trace = [CLOSED] * 5 + [bad] + [CLOSED] * 20
+    times = T0 + np.arange(len(trace)) / 30
+    machine, batch = AttentionStateMachine(verbose=False), AttentionBatch(1)
+    for ear, t in zip(trace, times):
+        status, _ = machine.update(ear, False, t)
+        codes, _, _ = batch.step([ear], [False], t)
+        assert codes[0] == machine.status_code
+        if not np.isfinite(ear):
+            assert status == "No Face" and machine.status_code == STATUS_CODES["No Face"]
+        assert np.isfinite(machine.ear_smoothed)
+    assert machine.stats['sleep'] == 1 == batch.stats['sleep'][0]
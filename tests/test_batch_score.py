@@ -0,0 +1,72 @@
+import numpy as np
+import pytest
+
+import attention
+import batch_score
+import features
+from attention import AttentionStateMachine
+
+
+def write_frames(path, times, ears, ratios):
+    np.savez_compressed(path, time=times, ear=ears, ratio=ratios)
+
+
+def scalar_stats(times, ears, ratios):
+    """What score_file's per-frame loop counts for the same frames"""
+    state = AttentionStateMachine(verbose=False)
+    for t, ear, ratio in zip(times, ears, ratios):
+        if np.isnan(ear):
+            state.no_face()
+        else:
+            state.update(float(ear), bool(ratio > 4 or ratio < 0), now=float(t))
+    return state.stats
+
+
+def test_rescore_matches_the_scalar_machine(tmp_path):
+    rng = np.random.default_rng(3)
+    runs = {}
+    for name, n in (('a', 900), ('b', 400), ('c', 0)):
+        times = np.cumsum(rng.choice([1 / 30, 0.2], size=n)).astype(np.float32)
+        ears = np.repeat(rng.choice([0.32, 0.15, np.nan], size=n // 30 + 1, p=[.6, .3, .1]), 30)[:n]
+        ratios = np.repeat(rng.choice([1.0, 6.0], size=n // 60 + 1, p=[.7, .3]), 60)[:n]
+        path = str(tmp_path / f"{name}.frames.npz")
+        write_frames(path, times, ears.astype(np.float32), ratios.astype(np.float32))
+        runs[path] = (times, ears, ratios)
+
+    results = batch_score.rescore(list(runs), 0.26, 0.7, 4)
+    for s in results:
+        expected = scalar_stats(*runs[s['path']])
+        assert (s['sleep'], s['distracted']) == (expected['sleep'], expected['distracted'])
+        assert s['frames'] == len(runs[s['path']][0])
+    assert sum(s['sleep'] + s['distracted'] for s in results) > 0
+
+
+def test_rescore_cli_finds_frames_files(tmp_path, capsys):
+    write_frames(str(tmp_path / "x.frames.npz"), np.arange(3, dtype=np.float32), np.full(3, 0.3), np.ones(3))
+    assert batch_score.main([str(tmp_path), '--rescore']) == 0
+    assert "x.frames.npz: 3 frames" in capsys.readouterr().out
+
+
+def test_output_names_do_not_collide(tmp_path):
+    paths = [str(tmp_path / p) for p in ("a/session.mp4", "b/session.mp4", "x.mp4", "x.avi", "y.mkv")]
+    names = batch_score.output_names(paths)
+    assert [names[p] for p in paths] == ["a/session", "b/session", "x.mp4", "x.avi", "y"]
+    assert batch_score.output_names([str(tmp_path / "one.mp4")]) == {str(tmp_path / "one.mp4"): "one"}
+
+
+def test_unresolvable_output_names_fail(tmp_path):
+    with pytest.raises(ValueError):
+        batch_score.output_names([str(tmp_path / p) for p in ("x.mp4", "x.avi", "x.mp4.mkv")])
+
+
+def test_find_videos_lists_each_file_once(tmp_path):
+    (tmp_path / "a.mp4").write_bytes(b"")
+    assert batch_score.find_videos([str(tmp_path), str(tmp_path / "a.mp4")]) == [str(tmp_path / "a.mp4")]
+
+
+def test_cli_defaults_follow_the_live_logic(tmp_path, monkeypatch):
+    seen = {}
+    monkeypatch.setattr(batch_score, 'rescore', lambda paths, *args: seen.update(args=args) or [])
+    write_frames(str(tmp_path / "x.frames.npz"), np.zeros(1), np.zeros(1), np.zeros(1))
+    batch_score.main([str(tmp_path), '--rescore'])
+    assert seen['args'] == (features.EAR_THRESHOLD, attention.SLEEP_SECONDS, attention.DISTRACTION_SECONDS)
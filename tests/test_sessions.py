@@ -0,0 +1,25 @@
+import numpy as np
+
+import features
+from attention import STATUS_CODES
+from sessions import UserSession
+
+
+def test_nan_points_in_a_face_row_are_a_frame_without_a_face():
+    session = UserSession("t", verbose=False)
+    session.state.EAR_THRESHOLD = 100.0 # Any finite EAR counts as closed eyes
+    n = len(features.FEATURE_INDICES)
+    points = np.repeat(np.random.default_rng(0).random((1, n, 3), dtype=np.float32), 30, axis=0)
+    points[10, 1:] = np.nan # First landmark is fine, the eyes aren't
+    faces = session.process_batch(1000.0 + np.arange(30) / 30, points, 640, 480)
+    assert faces == 29
+    assert np.isfinite(session.state.ear_smoothed)
+    assert session.state.status_code == STATUS_CODES["SLEEPING !!!"] and session.state.stats['sleep'] == 1
+
+
+def test_nan_ear_from_process_points_is_no_face():
+    session = UserSession("t", verbose=False)
+    points = np.full((len(features.FEATURE_INDICES), 3), np.nan, dtype=np.float32)
+    assert session.process_points(points, 640, 480, now=1000.0) is None
+    assert session.state.status_code == STATUS_CODES["No Face"]
+    assert session.state.ear_smoothed is None
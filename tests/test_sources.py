@@ -0,0 +1,32 @@
+import numpy as np
+import pytest
+
+from sources import FrameSource, SyntheticSource
+
+
+def test_a_source_must_implement_read():
+    class NoRead(FrameSource):
+        pass
+
+    with pytest.raises(TypeError):
+        NoRead()
+    with pytest.raises(TypeError):
+        FrameSource()
+
+
+def test_read_into_copies_into_the_buffer():
+    class Constant(FrameSource):
+        def read(self):
+            return True, np.full((4, 6, 3), 7, dtype=np.uint8)
+
+    out = np.zeros((4, 6, 3), dtype=np.uint8)
+    assert Constant().read_into(out) and (out == 7).all()
+    with pytest.raises(ValueError):
+        Constant().read_into(np.zeros((2, 2, 3), dtype=np.uint8))
+
+
+def test_builtin_sources_implement_read():
+    source = SyntheticSource(64, 48, fps=0)
+    out = np.zeros((48, 64, 3), dtype=np.uint8)
+    assert source.read_into(out) and out.any()
+    source.release()
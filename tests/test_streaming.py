@@ -0,0 +1,47 @@
+from streaming import FrameBroadcaster, StreamProfiles
+
+
+def profiles(**kwargs):
+    created = []
+    p = StreamProfiles(FrameBroadcaster(), on_create=lambda key, b: created.append(key), **kwargs)
+    return p, created
+
+
+def test_similar_requests_share_a_profile():
+    p, created = profiles()
+    assert p.get(300, 71) is p.get(320, 69)
+    assert p.get(None, None) is p.main and p.get(5000, 95) is p.main
+    assert created == [(320, 70)]
+
+
+def test_main_quality_is_snapped_too():
+    p, created = profiles(quality=83)
+    assert p.get() is p.main and p.get(None, 85) is p.main
+    assert created == []
+
+
+def test_nan_quality_means_default():
+    p, _ = profiles()
+    assert p.key(320, float('nan')) == (320, 95)
+
+
+def test_profile_count_is_capped():
+    p, created = profiles(max_profiles=3)
+    small, medium, light = p.get(160, 30), p.get(480, 80), p.get(640, 40)
+    for width in range(100, 1400, 7):
+        for quality in range(0, 101, 3):
+            p.get(width, quality)
+    assert created == [(160, 30), (480, 80), (640, 40)]
+    # Over the cap: the closest existing stream, width first
+    assert p.get(240, 90) is small
+    assert p.get(480, 20) is medium
+    assert p.get(640, 95) is light
+    assert p.get(1280, 50) is p.main
+
+
+def test_widths_at_or_above_the_frame_get_the_main_stream():
+    p, created = profiles()
+    p.frame_width = 640
+    assert p.get(640) is p.main and p.get(600) is p.main and p.get(960) is p.main
+    assert p.get(480) is not p.main
+    assert created == [(480, 95)]
@@ -0,0 +1,140 @@
+import threading
+from contextlib import contextmanager
+
+import pytest
+
+from db import Database
+from taskwriter import TaskWriteBehind, parse_changes
+
+TOKEN = "tok"
+
+
+class _HookedConnection(object):
+    """Pooled connection whose commit() can fail, or run the database's on_commit hook right after committing"""
+
+    def __init__(self, conn, db):
+        self._conn = conn
+        self._db = db
+
+    def commit(self):
+        if self._db.fail_commit:
+            raise RuntimeError("disk full")
+        self._conn.commit()
+        if self._db.on_commit is not None:
+            self._db.on_commit()
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+
+class HookedDatabase(Database):
+    on_commit = None
+    fail_commit = False
+
+    @contextmanager
+    def connection(self):
+        with super().connection() as conn:
+            yield _HookedConnection(conn, self)
+
+
+@pytest.fixture
+def db(tmp_path):
+    db = HookedDatabase(str(tmp_path / "tasks.db"))
+    with db.transaction() as c:
+        c.execute('''CREATE TABLE tasks (id INTEGER PRIMARY KEY, user_token TEXT NOT NULL, title TEXT,
+                     priority INTEGER DEFAULT 1, is_completed BOOLEAN DEFAULT 0, total_seconds INTEGER DEFAULT 0)''')
+        c.execute("INSERT INTO tasks (id, user_token, title) VALUES (1, ?, 'task')", (TOKEN,))
+    yield db
+    db.close_all()
+
+
+def load_tasks(db):
+    rows = db.query("SELECT id, priority, is_completed, total_seconds FROM tasks WHERE user_token=?", (TOKEN,))
+    return [{'id': r[0], 'priority': r[1], 'is_completed': bool(r[2]), 'total_seconds': r[3]} for r in rows]
+
+
+def test_updates_are_merged_into_one_row_write(db):
+    writer = TaskWriteBehind(db, interval=60, batch_size=100)
+    writer._thread = object() # Queue only, as if the flush thread were running
+    for _ in range(5):
+        writer.update(TOKEN, 1, {}, 60)
+    writer.update(TOKEN, 1, *parse_changes({'priority': 3, 'is_completed': True}))
+
+    assert load_tasks(db)[0]['total_seconds'] == 0
+    task = writer.read(TOKEN, lambda: load_tasks(db))[0]
+    assert (task['total_seconds'], task['priority'], task['is_completed']) == (300, 3, True)
+
+    assert writer.flush() == 1
+    assert load_tasks(db)[0] == task
+    assert writer.read(TOKEN, lambda: load_tasks(db))[0] == task
+
+
+def test_read_during_commit_does_not_count_twice(db):
+    writer = TaskWriteBehind(db, interval=60, batch_size=100)
+    writer._thread = object()
+    writer.update(TOKEN, 1, {}, 100)
+
+    committed, loaded = threading.Event(), threading.Event()
+    loads = []
+    result = {}
+
+    def load():
+        if not loads: # First attempt: read the rows right after the commit, before flush() finishes
+            committed.wait(5)
+        rows = load_tasks(db)
+        loads.append(rows[0]['total_seconds'])
+        loaded.set()
+        return rows
+
+    def on_commit():
+        db.on_commit = None
+        committed.set()
+        loaded.wait(5) # The reader has loaded the committed rows and now wants to apply queued changes
+
+    reader = threading.Thread(target=lambda: result.update(task=writer.read(TOKEN, load)[0]))
+    reader.start()
+    db.on_commit = on_commit
+    writer.flush()
+    reader.join(5)
+
+    assert loads[0] == 100 # The first load did see the committed update...
+    assert result['task']['total_seconds'] == 100 # ...and it was not applied a second time
+    assert load_tasks(db)[0]['total_seconds'] == 100
+
+
+def test_failed_flush_keeps_updates(db):
+    writer = TaskWriteBehind(db, interval=60, batch_size=100)
+    writer._thread = object()
+    writer.update(TOKEN, 1, {}, 10)
+
+    db.fail_commit = True
+    with pytest.raises(RuntimeError):
+        writer.flush()
+    db.fail_commit = False
+    writer.update(TOKEN, 1, {}, 5)
+
+    assert writer.read(TOKEN, lambda: load_tasks(db))[0]['total_seconds'] == 15
+    writer.flush()
+    assert load_tasks(db)[0]['total_seconds'] == 15
+
+
+def test_several_workers_write_through(db, monkeypatch):
+    monkeypatch.setenv("NEUROMO_WEB_WORKERS", "4")
+    monkeypatch.setenv("NEUROMO_TASK_FLUSH", "2")
+    writer = TaskWriteBehind(db)
+    writer.start()
+    assert writer.interval == 0 and writer._thread is None
+    writer.update(TOKEN, 1, {}, 30)
+    # Visible to a worker that reads the database directly, without this process's queue
+    assert load_tasks(db)[0]['total_seconds'] == 30
+
+
+def test_update_many_flushes_once(db):
+    with db.transaction() as c:
+        c.execute("INSERT INTO tasks (id, user_token, title) VALUES (2, ?, 'other')", (TOKEN,))
+    writer = TaskWriteBehind(db, interval=0)
+    commits = []
+    db.on_commit = lambda: commits.append(1)
+    writer.update_many(TOKEN, [(1, {}, 10), (2, {'priority': 5}, 0), (1, {}, 5)])
+    assert len(commits) == 1
+    assert [(t['total_seconds'], t['priority']) for t in load_tasks(db)] == [(15, 1), (0, 5)]
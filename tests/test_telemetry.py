@@ -0,0 +1,23 @@
+import numpy as np
+import pytest
+
+from attention import STATUS_CODES
+from telemetry import SEGMENT_RECORDS, TelemetryLog, TelemetryRecorder
+
+
+def test_reads_close_their_segments(tmp_path, monkeypatch):
+    recorder = TelemetryRecorder(str(tmp_path), "tok", max_hz=0)
+    n = SEGMENT_RECORDS + 100 # Two segments
+    t = 1000.0 + np.arange(n) / 30
+    recorder.record_batch(t, np.full(n, 0.3), np.full(n, 0.3), np.ones(n), np.full(n, STATUS_CODES["Focused"]))
+
+    opened = []
+    segments = TelemetryLog.segments
+    monkeypatch.setattr(TelemetryLog, 'segments', lambda self: opened.extend(segments(self)) or opened[-2:])
+    assert sum(recorder.summary()['frames']) == n
+    times, records = TelemetryLog(recorder.path).frames(start=10)
+    assert len(opened) == 4 and all(segment._mm.closed for segment in opened)
+    # The copies outlive the mappings
+    assert len(records) == n - 10 and np.allclose(records['left_ear'], 0.3, atol=1e-3)
+    assert times[0] == pytest.approx(t[10], abs=1e-3)
+    recorder.close()